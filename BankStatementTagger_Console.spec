@@ -7,6 +7,9 @@ hiddenimports = []
 tmp_ret = collect_all('customtkinter')
 datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
 
+# Engines are imported by name on first use (tagger.ENGINES), invisible to the analysis
+hiddenimports += ['hsbc_tagger', 'db_tagger', 'banamex_tagger', 'bbva_tagger', 'santander', 'monex_tagger']
+
 datas += [('bin', 'bin')]
 
 a = Analysis(
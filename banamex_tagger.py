@@ -2,6 +2,16 @@ import fitz  # PyMuPDF
 import re
 import os
 import sys
+import pdf_io
+import events
+import layout_cache
+import page_filter
+import tag_render
+import txindex
+
+# Bump when a change alters which transactions are found or where tags go;
+# re-tag sidecars written by older versions are then ignored (see sidecar.py)
+ENGINE_VERSION = 1
 
 # --- CONFIGURATION ---
 BANAMEX_SKIP_KEYWORDS = [
@@ -15,11 +25,21 @@ def has_money(text):
     # Matches 1,000.00 or 500.00 or 0.00
     return re.search(r'\d{1,3}(?:[,\.\s]\d{3})*[,\.\s]\d{2}', text)
 
-def get_lines_from_page(page):
+# Pages without a "05 ENE" style date and an amount hold no movements
+PAGE_FILTER = [
+    page_filter.rule(r'\d{2}[\s/.-]+[A-Z]{3}'),
+    page_filter.rule(r'\d{1,3}(?:[,\.\s]\d{3})*[,\.\s]\d{2}'),
+]
+
+# Extra space kept above a cached "DETALLE DE OPERACIONES" line when clipping
+LAYOUT_MARGIN = 20
+
+def get_lines_from_page(page, clip=None):
     """
     Groups words into lines based on Y coordinates (tolerance 10px).
+    With clip, only words inside that rectangle are read.
     """
-    words = page.get_text("words")
+    words = page.get_text("words", clip=clip)
     lines = {}
     for w in words:
         y_coord = round(w[1])
@@ -33,16 +53,38 @@ def get_lines_from_page(page):
             lines[y_coord] = [w]
     return lines
 
+def find_detail_start(lines):
+    """Y of the "DETALLE DE OPERACIONES" line, or 0 if the page has none."""
+    for y in sorted(lines.keys()):
+        line_text_check = " ".join([w[4] for w in lines[y]]).upper()
+        if "DETALLE" in line_text_check and "OPERACIONES" in line_text_check:
+            return y
+    return 0
+
+def get_table_lines(page):
+    """
+    Lines of the page, read only below "DETALLE DE OPERACIONES" when the page's
+    layout is already known (see layout_cache.py); otherwise the full page.
+    """
+    fp = layout_cache.fitz_fingerprint("BANAMEX", page)
+    entry = layout_cache.lookup(fp)
+    if entry and entry["detail_y"]:
+        clip = fitz.Rect(0, max(0, entry["detail_y"] - LAYOUT_MARGIN), page.rect.width, page.rect.height)
+        lines = get_lines_from_page(page, clip)
+        if find_detail_start(lines):
+            layout_cache.hit(fp)
+            return lines
+
+    lines = get_lines_from_page(page)
+    layout_cache.after_full_scan(fp, entry, {"detail_y": find_detail_start(lines)})
+    return lines
+
 def process_banamex_page(page, lines, prefix, counter):
     page_width = page.rect.width
+    tags = tag_render.PageTags(page)
 
     # 1. Geometric Filter: Find "DETALLE DE OPERACIONES"
-    start_tagging_y = 0
-    for y in sorted(lines.keys()):
-        line_text_check = " ".join([w[4] for w in lines[y]]).upper()
-        if "DETALLE" in line_text_check and "OPERACIONES" in line_text_check:
-            start_tagging_y = y
-            break
+    start_tagging_y = find_detail_start(lines)
 
     for y in sorted(lines.keys()):
         # Skip lines visually above the "DETALLE DE OPERACIONES" header
@@ -59,7 +101,8 @@ def process_banamex_page(page, lines, prefix, counter):
             continue
         
         # 3. Date Filter (Matches "05 ENE", "12/DIC", etc.)
-        if not re.search(r'\d{2}[\s/.-]+[A-Za-z]{3}', line_text): 
+        date_match = re.search(r'\d{2}[\s/.-]+[A-Za-z]{3}', line_text)
+        if not date_match: 
             continue
             
         # 4. Money Filter
@@ -86,11 +129,6 @@ def process_banamex_page(page, lines, prefix, counter):
             # Use this height as the font size
             dynamic_font_size = text_height
             
-            # --- DYNAMIC WIDTH CALCULATION ---
-            # Calculate how wide the tag text will be at this specific font size
-            # fitz.get_text_length calculates string width for the default font (Helvetica)
-            tag_width_px = fitz.get_text_length(key, fontname="helv", fontsize=dynamic_font_size)
-            
             # --- POSITIONING LOGIC ---
             # money_word tuple: (x0, y0, x1, y1, "text", ...)
             money_x0 = money_word[0] # Left edge of money
@@ -100,44 +138,69 @@ def process_banamex_page(page, lines, prefix, counter):
             
             # If money is on the right side of the page (>70%)
             if money_x0 > (page_width * 0.7):
-                # Place LEFT of the money
-                # math: (Left edge of money) - (Width of tag) - (Padding)
-                target_x = money_x0 - tag_width_px - padding
+                # Place LEFT of the money: the tag ends at (Left edge of money) - (Padding)
+                # (its width at this font size is measured in the tag font when drawn)
+                target_x = money_x0 - padding
+                align = "right"
             else:
                 # Place RIGHT of the money
                 # math: (Right edge of money) + (Padding)
                 target_x = money_x1 + padding
+                align = "left"
             
             # Align Y with the text baseline (bottom of the money word)
             # PyMuPDF inserts text starting from the baseline, so we use y1 roughly
             target_y = money_word[3] - (dynamic_font_size * 0.15) # Small adjust for baseline
             
             # Insert the text
-            page.insert_text((target_x, target_y), key, fontsize=dynamic_font_size, color=(1, 0, 0))
+            tags.text((target_x, target_y), key, dynamic_font_size, align=align)
+            txindex.record(page.number, money_word, key, money_word[4], date=date_match.group(0))
+            events.emit("transaction", "   [{n}] -> {tag}", events.DEBUG, n=counter, tag=key, page=page.number + 1)
             counter += 1
             
+    tags.flush()
     return counter
 
-def process_file(filename, prefix):
+def tag_pdf(source, prefix):
+    """
+    Tags a Banamex statement given as a path or in-memory PDF.
+    Returns (tagged_pdf_bytes, movement_count).
+    """
+    doc = tag_render.open_document(source)
     try:
-        doc = fitz.open(filename)
-        print(f"🏦 Processing BANAMEX File: {filename}")
+        events.emit("file", "🏦 Processing BANAMEX File: {file}", bank="BANAMEX", file=pdf_io.display_name(source), pages=len(doc))
         
         counter = 1
-        for page in doc:
-            lines = get_lines_from_page(page)
+        skipped = 0
+        for i, page in enumerate(doc):
+            if not page_filter.matches(page, PAGE_FILTER):
+                skipped += 1
+                continue
+            lines = get_table_lines(page)
             if lines:
                 counter = process_banamex_page(page, lines, prefix, counter)
+            events.emit("page", "   > Page {page}/{pages}: {count} movements", page=i + 1, pages=len(doc), count=counter - 1)
+        page_filter.report("BANAMEX", skipped, len(doc))
+                
+        return tag_render.save(doc), counter - 1
+    finally:
+        tag_render.close_document(doc)
+
+def process_file(filename, prefix):
+    try:
+        pdf_bytes, total = tag_pdf(filename, prefix)
                 
-        output = filename.replace(".pdf", "_BANAMEX_TAGGED.pdf")
-        doc.save(output)
-        print(f"✅ Done! {counter - 1} movements tagged.")
+        output = pdf_io.tagged_output_path(filename, "_BANAMEX_TAGGED")
+        pdf_io.write_bytes(output, pdf_bytes)
+        print(f"✅ Done! {total} movements tagged.")
         print(f"📁 Saved as: {output}")
+        return output
         
     except Exception as e:
         print(f"❌ Error: {e}")
 
 if __name__ == "__main__":
+    events.set_console_level(events.INFO)
     print("--- BANAMEX AUTOMATOR (Perfect Match) ---")
     pdfs = [f for f in os.listdir('.') if f.lower().endswith('.pdf') and "_TAGGED" not in f]
     
@@ -1,8 +1,18 @@
-import fitz  # PyMuPDF
 import re
-import os
 import sys
 import glob
+import pdf_io
+import events
+import page_filter
+import tag_render
+import txindex
+
+# Bump when a change alters which transactions are found or where tags go;
+# re-tag sidecars written by older versions are then ignored (see sidecar.py)
+ENGINE_VERSION = 1
+
+# Rows start with a DD/MMM date (dots and commas are OCR noise the row check strips)
+PAGE_FILTER = [page_filter.rule(r'\d[.,]*\d[.,]*/[.,]*[A-Z]')]
 
 def get_lines_from_page(page):
     """
@@ -44,7 +54,7 @@ def extract_expected_totals(doc):
         clean_text = re.sub(r'\s+', ' ', text)
         
         if "TOTAL MOVIMIENTOS" in clean_text:
-            print(f"   > Found Summary on Page {i+1}")
+            events.emit("summary", "   > Found Summary on Page {page}", page=i + 1)
             
             # Regex to find the numbers associated with the keywords
             # Looks for "TOTAL MOVIMIENTOS CARGOS" followed optionally by spaces/punctuation then digits
@@ -53,11 +63,11 @@ def extract_expected_totals(doc):
             
             if c_match: 
                 cargos = int(c_match.group(1))
-                print(f"     - Cargos found: {cargos}")
+                events.emit("summary", "     - Cargos found: {cargos}", cargos=cargos)
             
             if a_match: 
                 abonos = int(a_match.group(1))
-                print(f"     - Abonos found: {abonos}")
+                events.emit("summary", "     - Abonos found: {abonos}", abonos=abonos)
             
             # If we found data, stop scanning
             if cargos > 0 or abonos > 0:
@@ -74,6 +84,7 @@ def process_bbva_page(page, lines, prefix, counter):
     
     # Get page width to place tags on the right side
     page_width = page.rect.width
+    tags = tag_render.PageTags(page)
     
     # Sort Y coordinates to read top-to-bottom
     for y in sorted(lines.keys()):
@@ -109,39 +120,45 @@ def process_bbva_page(page, lines, prefix, counter):
         text_height = date_word[3] - date_word[1]
         
         # Calculate X position (RIGHT SIDE)
-        # fitz.get_text_length estimates width of our tag string
-        tag_width = fitz.get_text_length(key, fontname="helv", fontsize=text_height)
-        
-        # Place it at the Page Width minus the tag width minus a 40px margin
+        # The tag ends 40px from the page edge (it is measured in the tag font when drawn)
         # This aligns everything neatly on the right side of the sheet
-        x_pos = page_width - tag_width - 40
+        x_pos = page_width - 40
             
         # Vertical alignment (slightly adjusted for baseline)
         y_pos = date_word[3] - (text_height * 0.15)
         
         # Insert Tag
-        page.insert_text((x_pos, y_pos), key, fontsize=text_height, color=(1, 0, 0))
+        tags.text((x_pos, y_pos), key, text_height, align="right")
+        # First amount on the line (charge or deposit; the columns are not told apart here)
+        amount = next((a for a in (txindex.parse_amount(w[4]) for w in line_words[1:]) if a is not None), None)
+        txindex.record(page.number, date_word, key, amount, date=clean_first_word)
+        events.emit("transaction", "   [{n}] -> {tag}", events.DEBUG, n=counter, tag=key, page=page.number + 1)
         
         counter += 1
             
+    tags.flush()
     return counter
 
-def process_file(filename, prefix):
+def tag_pdf(source, prefix):
+    """
+    Tags a BBVA statement given as a path or in-memory PDF.
+    Returns (tagged_pdf_bytes, movement_count).
+    """
+    doc = tag_render.open_document(source)
     try:
-        doc = fitz.open(filename)
-        print(f"\n🏦 Processing BBVA File: {filename}")
+        events.emit("file", "\n🏦 Processing BBVA File: {file}", bank="BBVA", file=pdf_io.display_name(source), pages=len(doc))
         
         # 1. Get Expected Count from Summary
         expected_total = extract_expected_totals(doc)
         if expected_total == 0:
-            print("   ⚠️ WARNING: Could not find 'Total de Movimientos' summary table.")
+            events.emit("check", "   ⚠️ WARNING: Could not find 'Total de Movimientos' summary table.", events.WARNING)
         
         # 2. Tag Pages
         counter = 1
         start_processing = False
+        skipped = 0
         
         for page_num, page in enumerate(doc):
-            lines = get_lines_from_page(page)
             page_text = page.get_text("text").upper()
             
             # Simple Logic: Only start tagging AFTER we see the "Detalle de Movimientos" header
@@ -149,28 +166,44 @@ def process_file(filename, prefix):
             if "DETALLE DE MOVIMIENTOS" in page_text:
                 start_processing = True
                 
-            if start_processing and lines:
-                counter = process_bbva_page(page, lines, prefix, counter)
+            # Words and rows are only built for pages that can hold movements
+            if start_processing and page_filter.matches(page, PAGE_FILTER, page_text):
+                lines = get_lines_from_page(page)
+                if lines:
+                    counter = process_bbva_page(page, lines, prefix, counter)
+            else:
+                skipped += 1
+            events.emit("page", "   > Page {page}/{pages}: {count} movements", page=page_num + 1, pages=len(doc), count=counter - 1)
                 
+        page_filter.report("BBVA", skipped, len(doc))
         actual_tagged = counter - 1
         
         # 3. Validation Report
-        print(f"   ----------------------------------------")
-        print(f"   Expected (from PDF): {expected_total}")
-        print(f"   Actual Tags Created: {actual_tagged}")
+        events.emit("check", "   ----------------------------------------\n   Expected (from PDF): {expected}\n   Actual Tags Created: {actual}",
+                    expected=expected_total, actual=actual_tagged)
         
         if expected_total > 0:
             if expected_total == actual_tagged:
-                print(f"   ✅ SUCCESS: Counts match perfectly!")
+                events.emit("check", "   ✅ SUCCESS: Counts match perfectly!")
             else:
-                diff = abs(expected_total - actual_tagged)
-                print(f"   ❌ MISMATCH: Difference of {diff} movements.")
-                print(f"      (Check if some dates were missed or headers tagged by mistake)")
+                # A count mismatch is worth seeing even in quiet batch runs
+                events.emit("check", "   ❌ MISMATCH: Difference of {diff} movements.\n"
+                                     "      (Check if some dates were missed or headers tagged by mistake)",
+                            events.WARNING, diff=abs(expected_total - actual_tagged), expected=expected_total, actual=actual_tagged)
+        
+        return tag_render.save(doc), actual_tagged
+    finally:
+        tag_render.close_document(doc)
+
+def process_file(filename, prefix):
+    try:
+        pdf_bytes, total = tag_pdf(filename, prefix)
         
         # 4. Save
-        output = filename.replace(".pdf", "_BBVA_TAGGED.pdf")
-        doc.save(output)
+        output = pdf_io.tagged_output_path(filename, "_BBVA_TAGGED")
+        pdf_io.write_bytes(output, pdf_bytes)
         print(f"   📁 Saved as: {output}")
+        return output
         
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -178,6 +211,7 @@ def process_file(filename, prefix):
         traceback.print_exc()
 
 if __name__ == "__main__":
+    events.set_console_level(events.INFO)
     print("--- BBVA STATEMENT TAGGER (Standalone Test) ---")
     
     # Find all PDFs in current folder that aren't already tagged
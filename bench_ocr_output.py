@@ -0,0 +1,85 @@
+import argparse
+import collections
+import glob
+import os
+import time
+
+import fitz  # PyMuPDF
+
+import detector
+import events
+import ocr_utils
+import pdf_io
+import tagger
+from bench_ocr_profiles import simulate_scan
+
+def parse_seconds(pdf_bytes):
+    """Open + word extraction of every page, the first thing every engine does."""
+    start = time.perf_counter()
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    for page in doc:
+        page.get_text("words")
+    doc.close()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares OCR output image modes: bytes of the searchable PDF and downstream parse and "
+                    "tag time. Text PDFs are rendered as if scanned; 'source' (the image Tesseract wraps at "
+                    "the OCR DPI) is the baseline.")
+    parser.add_argument("folder")
+    parser.add_argument("--modes", default="source,gray,bilevel")
+    parser.add_argument("--image-dpis", default=str(ocr_utils.OCR_IMAGE_DPI), help="comma separated")
+    parser.add_argument("--scan-dpi", type=int, default=200, help="render DPI when simulating scans")
+    args = parser.parse_args()
+
+    combos = []
+    for mode in (m.strip() for m in args.modes.split(",") if m.strip()):
+        # The source image ignores the image DPI
+        dpis = [None] if mode == "source" else [int(d) for d in args.image_dpis.split(",")]
+        combos += [(mode, dpi) for dpi in dpis]
+
+    files = sorted(glob.glob(os.path.join(args.folder, "*.pdf")))
+    files = [f for f in files if "_TAGGED" not in f]
+    if not files:
+        print("❌ No PDF files found.")
+        return
+
+    events.set_console_level(events.ERROR)
+    totals = collections.defaultdict(lambda: {"files": 0, "bytes": 0, "ocr": 0.0, "parse": 0.0, "tag": 0.0})
+    for path in files:
+        bank, _ = detector.detect_bank_and_currency(path)
+        engine = tagger.get_engine(bank)
+        if ocr_utils.has_readable_text(path):
+            scan, _ = simulate_scan(path, args.scan_dpi)
+        else:
+            scan = pdf_io.read_bytes(path)
+        print(f"📄 {os.path.basename(path)} ({bank})")
+
+        for mode, dpi in combos:
+            ocr_utils.OCR_IMAGE_MODE = mode
+            if dpi:
+                ocr_utils.OCR_IMAGE_DPI = dpi
+            start = time.perf_counter()
+            pdf_bytes = ocr_utils.ocr_to_bytes(scan)
+            t = totals[(mode, dpi)]
+            t["files"] += 1
+            t["ocr"] += time.perf_counter() - start
+            t["bytes"] += len(pdf_bytes)
+            t["parse"] += parse_seconds(pdf_bytes)
+            if engine is not None:
+                start = time.perf_counter()
+                engine.tag_pdf(pdf_bytes, "BENCH")
+                t["tag"] += time.perf_counter() - start
+
+    base = totals.get(("source", None))
+    print(f"\n{'MODE':<8} {'DPI':>4} {'FILES':>5} {'KB/file':>9} {'SAVED':>7} {'OCR s':>7} {'PARSE ms':>9} {'TAG ms':>8} {'PARSE x':>8}")
+    for (mode, dpi), t in totals.items():
+        n = t["files"]
+        saved = f"{100 * (1 - t['bytes'] / base['bytes']):6.1f}%" if base else "    n/a"
+        speedup = f"{base['parse'] / t['parse']:7.2f}x" if base and t["parse"] else "     n/a"
+        print(f"{mode:<8} {dpi or '-':>4} {n:>5} {t['bytes'] / n / 1024:>9.0f} {saved:>7} {t['ocr'] / n:>7.2f} "
+              f"{1000 * t['parse'] / n:>9.1f} {1000 * t['tag'] / n:>8.1f} {speedup:>8}")
+
+if __name__ == "__main__":
+    main()
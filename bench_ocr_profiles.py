@@ -0,0 +1,154 @@
+import argparse
+import collections
+import contextlib
+import glob
+import io
+import itertools
+import json
+import os
+import time
+
+import fitz  # PyMuPDF
+
+import detector
+import ocr_profiles
+import ocr_utils
+import pdf_io
+import tagger
+
+def simulate_scan(path, dpi):
+    """Renders every page to an image-only PDF so a text PDF can be OCR'd like a scan."""
+    src = fitz.open(path)
+    out = fitz.open()
+    try:
+        for page in src:
+            pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+            new_page = out.new_page(width=page.rect.width, height=page.rect.height)
+            new_page.insert_image(new_page.rect, pixmap=pix)
+        return out.tobytes(garbage=1), len(src)
+    finally:
+        src.close()
+        out.close()
+
+def candidate_profiles(bank, args):
+    """Grid of profiles to try for a bank; axes not given on the command line keep the bank's current value."""
+    base = ocr_profiles.get_profile(bank)
+
+    def axis(value, key, cast=str):
+        if not value:
+            return [base[key]]
+        return [None if v.lower() == "default" else cast(v) for v in value.split(",")]
+
+    grid = itertools.product(axis(args.langs, "lang"), axis(args.psms, "psm", int),
+                             axis(args.oems, "oem", int), axis(args.dpis, "dpi", int))
+    return [dict(base, lang=lang, psm=psm, oem=oem, dpi=dpi) for lang, psm, oem, dpi in grid]
+
+def engine_regions(bank):
+    """The engine's OCR_REGIONS, or None for engines that only support full-page OCR."""
+    return getattr(tagger.get_engine(bank), "OCR_REGIONS", None)
+
+def run_ocr(scan, profile, regions):
+    if regions:
+        return ocr_utils.roi_ocr_to_bytes(scan, regions, profile)
+    return ocr_utils.ocr_to_bytes(scan, profile)
+
+def count_transactions(bank, pdf_bytes):
+    # Engines print a line per page and transaction; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            _, count = tagger.get_engine(bank).tag_pdf(pdf_bytes, "BENCH")
+        except Exception:
+            count = 0
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks Tesseract profiles per bank: pages/sec and share of transactions found. "
+                    "Text PDFs are rendered as if scanned and their native tag count is the reference; "
+                    "for real scans the best profile's count is the reference.")
+    parser.add_argument("folder")
+    parser.add_argument("--langs", help="comma separated, e.g. spa,eng+spa")
+    parser.add_argument("--psms", help="comma separated, e.g. 4,6")
+    parser.add_argument("--oems", help="comma separated, e.g. 1,default")
+    parser.add_argument("--dpis", help="comma separated, e.g. 200,300")
+    parser.add_argument("--roi", action="store_true", help="OCR only the engine's column strips where it declares them")
+    parser.add_argument("--scan-dpi", type=int, default=150, help="resolution used to simulate scans of text PDFs")
+    parser.add_argument("--save", help="write the best profile per bank as JSON (use with BST_OCR_PROFILES)")
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.folder, "*.pdf")))
+    files = [f for f in files if "_TAGGED" not in f]
+    if not files:
+        print("❌ No PDF files found.")
+        return
+
+    # (bank, profile label) -> totals
+    stats = collections.defaultdict(lambda: {"pages": 0, "seconds": 0.0, "found": 0, "expected": 0, "profile": None})
+
+    for path in files:
+        bank, _ = detector.detect_bank_and_currency(path)
+        if bank not in tagger.ENGINES:
+            print(f"⚠️ Skipping {os.path.basename(path)} (bank not detected)")
+            continue
+
+        if ocr_utils.has_readable_text(path):
+            reference = count_transactions(bank, pdf_io.read_bytes(path))
+            scan, pages = simulate_scan(path, args.scan_dpi)
+        else:
+            reference = None
+            scan = pdf_io.read_bytes(path)
+            with fitz.open(stream=scan, filetype="pdf") as doc:
+                pages = len(doc)
+
+        regions = engine_regions(bank) if args.roi else None
+        print(f"📄 {os.path.basename(path)} ({bank}, {pages} pages, reference: {reference if reference is not None else 'best profile'})")
+
+        counts = {}
+        for profile in candidate_profiles(bank, args):
+            label = ocr_profiles.describe(profile) + (" roi" if regions else "")
+            t0 = time.perf_counter()
+            try:
+                ocr_bytes = run_ocr(scan, profile, regions)
+            except Exception as e:
+                print(f"   ❌ {label}: {e}")
+                continue
+            elapsed = time.perf_counter() - t0
+            counts[label] = count_transactions(bank, ocr_bytes)
+
+            s = stats[(bank, label)]
+            s["profile"] = profile
+            s["pages"] += pages
+            s["seconds"] += elapsed
+            s["found"] += counts[label]
+            print(f"   {label}: {counts[label]} transactions in {elapsed:.1f}s")
+
+        expected = reference if reference is not None else max(counts.values(), default=0)
+        for label in counts:
+            stats[(bank, label)]["expected"] += expected
+
+    print(f"\n{'BANK':<10} {'PROFILE':<32} {'PAGES':>5} {'PAGES/S':>8} {'FOUND':>8}")
+    best = {}
+    for (bank, label), s in sorted(stats.items()):
+        rate = s["found"] / s["expected"] if s["expected"] else None
+        speed = s["pages"] / s["seconds"] if s["seconds"] else 0.0
+        found = f"{100 * rate:6.1f}%" if rate is not None else "    n/a"
+        print(f"{bank:<10} {label:<32} {s['pages']:>5} {speed:>8.2f} {found:>8}")
+        # Best = highest found rate, then fastest
+        key = (rate or 0, speed)
+        if bank not in best or key > best[bank][0]:
+            best[bank] = (key, s["profile"])
+
+    if best:
+        print("\n🏆 Best profile per bank:")
+        for bank, (_, profile) in sorted(best.items()):
+            print(f"   {bank}: {ocr_profiles.describe(profile)}")
+
+    if args.save and best:
+        keys = ("lang", "psm", "oem", "dpi")
+        winners = {bank: {k: profile[k] for k in keys} for bank, (_, profile) in best.items()}
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(winners, f, indent=2)
+        print(f"💾 Saved to {args.save} (set BST_OCR_PROFILES={args.save} to use it)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import collections
+import glob
+import os
+import re
+import time
+
+import fitz  # PyMuPDF
+import pytesseract
+from PIL import Image
+
+import detector
+import ocr_utils
+import preprocess
+
+# Points pytesseract at the bundled Tesseract binary
+ocr_utils.load_ocr_stack()
+
+# Amount tokens such as 1,234.56 are what the engines actually need to read correctly
+AMOUNT_RE = re.compile(r'^\$?\d[\d,]*\.\d{2}$')
+
+def tokens(text):
+    return [t for t in re.split(r'\s+', text.upper()) if t]
+
+def recall(truth, found):
+    """Share of ground-truth tokens (with multiplicity) present in the OCR output."""
+    if not truth:
+        return None
+    truth_counts = collections.Counter(truth)
+    found_counts = collections.Counter(found)
+    hits = sum(min(n, found_counts[t]) for t, n in truth_counts.items())
+    return hits / len(truth)
+
+def render_gray(page, dpi):
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks OCR preprocessing profiles. Text PDFs are rendered as if scanned "
+                    "and their own text layer is used as ground truth; scanned PDFs report timings only.")
+    parser.add_argument("folder")
+    parser.add_argument("--profiles", default=",".join(preprocess.PROFILES))
+    parser.add_argument("--dpi", type=int, default=ocr_utils.OCR_DPI)
+    parser.add_argument("--max-pages", type=int, default=3, help="pages per file")
+    parser.add_argument("--lang", default="eng+spa")
+    args = parser.parse_args()
+
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    files = sorted(glob.glob(os.path.join(args.folder, "*.pdf")))
+    files = [f for f in files if "_TAGGED" not in f]
+    if not files:
+        print("❌ No PDF files found.")
+        return
+
+    # (bank, profile) -> list of per-page measurements
+    stats = collections.defaultdict(lambda: {"pages": 0, "pre": 0.0, "ocr": 0.0, "words": [], "amounts": []})
+
+    for path in files:
+        bank, _ = detector.detect_bank_and_currency(path)
+        doc = fitz.open(path)
+        print(f"📄 {os.path.basename(path)} ({bank})")
+        for page in list(doc)[:args.max_pages]:
+            truth = tokens(page.get_text())
+            truth_amounts = [t for t in truth if AMOUNT_RE.match(t)]
+            image = render_gray(page, args.dpi)
+
+            for profile in profiles:
+                t0 = time.perf_counter()
+                processed = preprocess.apply(image, profile)
+                t1 = time.perf_counter()
+                text = pytesseract.image_to_string(processed, lang=args.lang, config="--psm 6")
+                t2 = time.perf_counter()
+
+                s = stats[(bank, profile)]
+                s["pages"] += 1
+                s["pre"] += t1 - t0
+                s["ocr"] += t2 - t1
+                found = tokens(text)
+                word_recall = recall(truth, found)
+                amount_recall = recall(truth_amounts, [t for t in found if AMOUNT_RE.match(t)])
+                if word_recall is not None:
+                    s["words"].append(word_recall)
+                if amount_recall is not None:
+                    s["amounts"].append(amount_recall)
+        doc.close()
+
+    def pct(values):
+        return f"{100 * sum(values) / len(values):6.1f}%" if values else "    n/a"
+
+    print(f"\n{'BANK':<10} {'PROFILE':<17} {'PAGES':>5} {'PRE ms/pg':>10} {'OCR s/pg':>9} {'WORDS':>8} {'AMOUNTS':>8}")
+    for (bank, profile), s in sorted(stats.items()):
+        n = s["pages"]
+        print(f"{bank:<10} {profile:<17} {n:>5} {1000 * s['pre'] / n:>10.1f} {s['ocr'] / n:>9.2f} "
+              f"{pct(s['words']):>8} {pct(s['amounts']):>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import collections
+import glob
+import os
+
+import detector
+import events
+import metrics
+import ocr_utils
+import pdf_io
+import tag_render
+import tagger
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares save profiles for tagged outputs: output size and save time per file. "
+                    "Scanned inputs are OCRed once and every profile tags the same OCR result.")
+    parser.add_argument("folder")
+    parser.add_argument("--profiles", default=",".join(tag_render.SAVE_PROFILES))
+    args = parser.parse_args()
+
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip() in tag_render.SAVE_PROFILES]
+    files = sorted(glob.glob(os.path.join(args.folder, "*.pdf")))
+    files = [f for f in files if "_TAGGED" not in f]
+    if not files:
+        print("❌ No PDF files found.")
+        return
+
+    # Engine progress is not part of the report
+    events.set_console_level(events.ERROR)
+
+    totals = collections.defaultdict(lambda: {"files": 0, "bytes": 0, "seconds": 0.0})
+    print(f"{'FILE':<32} {'PROFILE':<12} {'INPUT KB':>9} {'OUTPUT KB':>10} {'SAVE ms':>8}")
+    for path in files:
+        bank, _ = detector.detect_bank_and_currency(path)
+        engine = tagger.get_engine(bank)
+        if engine is None:
+            print(f"⚠️ Skipping {os.path.basename(path)} (bank not detected)")
+            continue
+        data = pdf_io.read_bytes(path)
+        if not ocr_utils.has_readable_text(data):
+            data = ocr_utils.force_ocr(data, regions=getattr(engine, "OCR_REGIONS", None), bank=bank) or data
+
+        for profile in profiles:
+            tag_render.SAVE_PROFILE = profile
+            with metrics.job_stats() as stats:
+                engine.tag_pdf(data, "BENCH")
+            t = totals[profile]
+            t["files"] += 1
+            t["bytes"] += stats["output_bytes"]
+            t["seconds"] += stats["save_seconds"]
+            print(f"{os.path.basename(path)[:32]:<32} {profile:<12} {len(data) // 1024:>9} "
+                  f"{stats['output_bytes'] // 1024:>10} {1000 * stats['save_seconds']:>8.1f}")
+
+    print(f"\n{'PROFILE':<12} {'FILES':>5} {'TOTAL KB':>9} {'SAVE ms/file':>13}")
+    for profile in profiles:
+        t = totals[profile]
+        if t["files"]:
+            print(f"{profile:<12} {t['files']:>5} {t['bytes'] // 1024:>9} {1000 * t['seconds'] / t['files']:>13.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# Each scenario runs in a fresh interpreter so nothing is imported beforehand
+SCENARIOS = {
+    "main": "import main",
+    "gui": "import gui",
+    "watcher": "import watcher",
+    "service": "import service",
+    # What every start-up paid before engines and the OCR stack were loaded on first use
+    "main+eager": "import main, tagger, ocr_utils; tagger.warm_up(); ocr_utils.load_ocr_stack()",
+}
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def measure(code):
+    """
+    Runs code in a fresh interpreter with -X importtime.
+    Returns (total import seconds, [(cumulative seconds, module)] for the modules the
+    entry points import directly), or None if the scenario cannot be imported here
+    (e.g. no display for the GUI).
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=here, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    total, modules = 0.0, []
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if not m:
+            continue
+        # Indentation grows by two spaces per level: depth 1 = imported by the scenario, 2 = by an entry module
+        depth, seconds, module = len(m.group(3)) // 2 + 1, int(m.group(2)) / 1e6, m.group(4)
+        if depth == 1:
+            total += seconds
+        if depth <= 2 and module not in code:
+            modules.append((seconds, module))
+    return total, modules
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measures start-up import time of the entry points in fresh interpreters "
+                    "(median of several runs) and lists the heaviest imports of each.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="heaviest imports listed per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    args = parser.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip() in SCENARIOS]
+    results = {}
+    for name in names:
+        runs = [measure(SCENARIOS[name]) for _ in range(args.runs)]
+        if any(r is None for r in runs):
+            print(f"⚠️ Skipping {name} (import failed in this environment)")
+            continue
+        totals = [total for total, _ in runs]
+        # Heaviest imports from the median run
+        median_run = sorted(runs, key=lambda r: r[0])[len(runs) // 2]
+        results[name] = (statistics.median(totals), min(totals), median_run[1])
+
+    print(f"\n{'SCENARIO':<12} {'MEDIAN ms':>10} {'BEST ms':>9}")
+    for name, (median, best, _) in results.items():
+        print(f"{name:<12} {1000 * median:>10.1f} {1000 * best:>9.1f}")
+
+    if "main" in results and "main+eager" in results:
+        saved = results["main+eager"][0] - results["main"][0]
+        print(f"\nLazy loading saves {1000 * saved:.1f} ms per CLI start-up")
+
+    for name, (_, _, modules) in results.items():
+        print(f"\n{name}: heaviest imports")
+        for seconds, module in sorted(modules, reverse=True)[:args.top]:
+            print(f"   {1000 * seconds:>8.1f} ms  {module}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,20 @@
 import pdfplumber
-import fitz  # PyMuPDF
-import os
 import glob
 import re
 import ocr_utils
+import pdf_io
+import events
+import layout_cache
+import page_filter
+import tag_render
+import txindex
+
+# Bump when a change alters which transactions are found or where tags go;
+# re-tag sidecars written by older versions are then ignored (see sidecar.py)
+ENGINE_VERSION = 1
+
+# DB amounts always end in a dot and two decimals
+PAGE_FILTER = [page_filter.rule(r'\.\d{2}\b')]
 
 def is_amount(text):
     """
@@ -24,13 +35,15 @@ def is_amount(text):
     except ValueError:
         return False
 
-def find_table_bounds(page):
+def find_table_bounds(page, words=None):
     """
     Finds the vertical boundaries (Y-axis) of the transaction list.
     Top: 'Bookdate' or 'Start Balance'
     Bottom: 'Sum of', 'Close Balance', 'No. Debit TX'
+    words: already extracted words to scan instead of the full page.
     """
-    words = page.extract_words()
+    if words is None:
+        words = page.extract_words()
     y_min = 0
     y_max = page.height
 
@@ -56,30 +69,58 @@ def find_table_bounds(page):
 
     return y_min, y_max
 
+def get_table_words(page):
+    """
+    Returns (y_min, y_max, words). When the page layout is known (see layout_cache.py)
+    only the words from the cached table top down are extracted; the header must
+    still be found there, else the full page is scanned as before.
+    """
+    fp = layout_cache.plumber_fingerprint("DB", page)
+    entry = layout_cache.lookup(fp)
+    if entry and entry["y_min"]:
+        # Lines are grouped on a 5pt grid, so nothing more than 5pt above the top can be a table line
+        region = page.crop((0, max(0, entry["y_min"] - 5), page.width, page.height))
+        words = region.extract_words(keep_blank_chars=False)
+        y_min, y_max = find_table_bounds(page, words)
+        if y_min >= entry["y_min"]:
+            layout_cache.hit(fp)
+            return y_min, y_max, words
+
+    words = page.extract_words(keep_blank_chars=False)
+    y_min, y_max = find_table_bounds(page, words)
+    layout_cache.after_full_scan(fp, entry, {"y_min": y_min})
+    return y_min, y_max, words
+
 def get_transaction_coordinates(pdf_path):
-    print(f"   > Scanning file structure...")
+    """
+    Accepts a path or an in-memory PDF (bytes, memoryview, mmap, file object).
+    Returns (tagging_data, actual_pdf) where actual_pdf is the OCR'd PDF (bytes) when OCR was needed.
+    """
+    events.emit("file", "   > Scanning file structure...", bank="DB", file=pdf_io.display_name(pdf_path))
     
     # OCR Check
     if not ocr_utils.has_readable_text(pdf_path):
-        ocr_res = ocr_utils.force_ocr(pdf_path)
+        ocr_res = ocr_utils.force_ocr(pdf_path, bank="DB")
         if ocr_res:
             pdf_path = ocr_res
 
     tagging_data = []
     transaction_count = 0
 
-    with pdfplumber.open(pdf_path) as pdf:
-        # ... logic ...
+    relevant = page_filter.relevant_pages(pdf_path, PAGE_FILTER)
+    with pdfplumber.open(pdf_io.open_stream(pdf_path)) as pdf:
+        page_filter.report("DB", relevant.count(False), len(pdf.pages))
         for page_num, page in enumerate(pdf.pages):
-            # 1. Find where the table starts and ends on this page
-            y_min, y_max = find_table_bounds(page)
+            if not relevant[page_num]:
+                continue
+            # 1. Find where the table starts and ends on this page (and its words)
+            y_min, y_max, words = get_table_words(page)
             
             # Fallbacks if headers aren't found (e.g., middle pages of a long statement)
             if y_min == 0: y_min = 100 
             if y_max == page.height: y_max = page.height - 100
 
-            # 2. Extract and group text
-            words = page.extract_words(keep_blank_chars=False)
+            # 2. Group text
             
             lines = {}
             for word in words:
@@ -131,44 +172,74 @@ def get_transaction_coordinates(pdf_path):
                     if x_pos > page.width - 50:
                         x_pos = target_word['x0'] - 60 
 
+                    left_text = " ".join(w['text'] for w in line_words if w['x0'] < target_word['x0'])
                     tagging_data.append({
                         "page_index": page_num,
                         "x": x_pos,
                         "y": y_pos,
-                        "count": transaction_count
+                        "count": transaction_count,
+                        "bbox": (target_word['x0'], target_word['top'], target_word['x1'], target_word['bottom']),
+                        "amount": target_word['text'],
+                        "date": txindex.find_date(left_text)
                     })
+                    events.emit("transaction", "   [{n}] page {page}", events.DEBUG, n=transaction_count, page=page_num + 1)
+
+            events.emit("page", "   > Page {page}/{pages}: {count} movements",
+                        page=page_num + 1, pages=len(pdf.pages), count=transaction_count)
 
     return tagging_data, pdf_path
 
-def create_tagged_pdf(pdf_path, tagging_data, prefix):
-    print(f"   > Writing {len(tagging_data)} tags to new PDF...")
+def render_tagged_pdf(pdf_source, tagging_data, prefix):
+    """Draws the tags on a path or in-memory PDF and returns the result as bytes."""
+    events.emit("render", "   > Writing {count} tags to new PDF...", count=len(tagging_data))
     
-    doc = fitz.open(pdf_path)
+    doc = tag_render.open_document(pdf_source)
+    try:
+        pages = {}  # page index -> PageTags, drawn once all tags are placed
     
-    for item in tagging_data:
-        page_idx = item['page_index']
-        x_pos = item['x']
-        y_pos = item['y']
-        count = item['count']
-        tag_text = f"{prefix}_{count}"
+        for item in tagging_data:
+            page_idx = item['page_index']
+            x_pos = item['x']
+            y_pos = item['y']
+            count = item['count']
+            tag_text = f"{prefix}_{count}"
         
-        if page_idx < len(doc):
-            page = doc[page_idx]
+            if page_idx < len(doc):
+                tags = pages.get(page_idx) or pages.setdefault(page_idx, tag_render.PageTags(doc[page_idx]))
             
-            # DEBUG: Draw circle
-            page.draw_circle((x_pos, y_pos), 3, color=(0, 0, 1), fill=(0, 0, 1))
+                # DEBUG: Draw circle (debug render mode only)
+                tags.mark((x_pos, y_pos), 3)
             
-            # Red color, font size 10 (enforced min)
-            page.insert_text((x_pos, y_pos + 3), tag_text, fontsize=12, color=(1, 0, 0))
+                # Red color, font size 10 (enforced min)
+                tags.text((x_pos, y_pos + 3), tag_text, 12)
+                if "bbox" in item:
+                    txindex.record(page_idx, item["bbox"], tag_text, item.get("amount"), date=item.get("date"))
 
-    base_name = os.path.splitext(pdf_path)[0]
-    output_filename = f"{base_name}_TAGGED.pdf"
-    
-    doc.save(output_filename)
-    doc.close()
-    
+        for tags in pages.values():
+            tags.flush()
+        return tag_render.save(doc)
+    finally:
+        tag_render.close_document(doc)
+
+def create_tagged_pdf(pdf_path, tagging_data, prefix, output_filename=None):
+    """
+    Renders the tags and writes the result atomically.
+    pdf_path may be the in-memory OCR result, in which case output_filename is required.
+    """
+    pdf_bytes = render_tagged_pdf(pdf_path, tagging_data, prefix)
+    if output_filename is None:
+        output_filename = pdf_io.tagged_output_path(pdf_path)
+    pdf_io.write_bytes(output_filename, pdf_bytes)
     return output_filename
 
+def tag_pdf(source, prefix):
+    """
+    Tags a statement given as a path or in-memory PDF.
+    Returns (tagged_pdf_bytes, transaction_count).
+    """
+    coords, actual_pdf = get_transaction_coordinates(source)
+    return render_tagged_pdf(actual_pdf, coords, prefix), len(coords)
+
 def select_file():
     pdf_files = glob.glob("*.pdf")
     pdf_files = [f for f in pdf_files if "_TAGGED" not in f]
@@ -189,6 +260,7 @@ def select_file():
         except ValueError: pass
 
 if __name__ == "__main__":
+    events.set_console_level(events.INFO)
     print("--- Deutsche Bank PDF Tagger ---")
     
     selected_file = select_file()
@@ -197,11 +269,11 @@ if __name__ == "__main__":
         prefix_input = input(f"Enter TAG PREFIX (e.g., DB_EUR): ")
         
         try:
-            coords = get_transaction_coordinates(selected_file)
+            coords, pdf = get_transaction_coordinates(selected_file)
             
             if coords:
                 print(f"   > Found {len(coords)} transactions.")
-                output_file = create_tagged_pdf(selected_file, coords, prefix_input)
+                output_file = create_tagged_pdf(pdf, coords, prefix_input, pdf_io.tagged_output_path(selected_file))
                 print(f"\nSuccess! Created tagged file: {output_file}")
             else:
                 print("\nNo transactions found.")
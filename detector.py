@@ -1,7 +1,7 @@
-import fitz
 import re
 import os
-import ocr_utils
+import pdf_io
+import events
 
 BANKS = {
     "HSBC": ["HSBC"],
@@ -19,12 +19,12 @@ CURRENCIES = {
     "EUR": [r"\bEUR\b", r"\bEUROS\b"],
 }
 
-def get_text_head(file_path, max_pages=2):
-    """Extracts text from the first few pages for detection."""
+def get_text_head(source, max_pages=2):
+    """Extracts text from the first few pages for detection (path or in-memory PDF)."""
     text = ""
     try:
         # Try native PDF text first
-        doc = fitz.open(file_path)
+        doc = pdf_io.open_document(source)
         for i, page in enumerate(doc):
             if i >= max_pages: break
             text += page.get_text() + "\n"
@@ -32,24 +32,28 @@ def get_text_head(file_path, max_pages=2):
         
         # If text is too sparse, it might be an image scan.
         if len(text.strip()) < 50:
-            print(f"   > Text too sparse in {os.path.basename(file_path)}, attempting OCR for detection...")
+            events.emit("detect", "   > Text too sparse in {file}, attempting OCR for detection...", file=pdf_io.display_name(source))
             # We don't want to force a full OCR convert just for detection if we can avoid it,
             # but if we must, we might just look at the filename or punt.
             # For now, let's assume we rely on what we have or filename fallback.
             pass
             
     except Exception as e:
-        print(f"   > Error reading {file_path}: {e}")
+        events.emit("detect", "   > Error reading {file}: {error}", events.WARNING, file=pdf_io.display_name(source), error=str(e))
         return ""
         
     return text.upper()
 
-def detect_bank_and_currency(file_path):
+def detect_bank_and_currency(source, filename=None):
     """
     Returns (bank_code, currency_code)
     e.g. ("HSBC", "MXN")
+    source can be a path or the PDF content (bytes, memoryview, mmap, file object).
+    filename is an optional hint for in-memory sources (e.g. the uploaded name).
     """
-    filename = os.path.basename(file_path).upper()
+    if filename is None:
+        filename = pdf_io.display_name(source, default="")
+    filename = os.path.basename(filename).upper()
     
     # 1. Detect Bank (Filename has high priority for Bank)
     detected_bank = "UNK"
@@ -61,7 +65,7 @@ def detect_bank_and_currency(file_path):
         if detected_bank != "UNK": break
     
     # 2. Extract content for deeper analysis (Currency needs content usually)
-    content = get_text_head(file_path)
+    content = get_text_head(source)
     
     # Refine Bank if unknown from filename
     if detected_bank == "UNK":
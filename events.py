@@ -0,0 +1,116 @@
+import contextlib
+import os
+import threading
+
+# Structured progress events from the engines, OCR and detection.
+#
+#   events.emit("page", "--- Pág {page}/{pages} ---", page=1, pages=3)
+#
+# Every event is a dict with 'kind', 'level', 'message' (a str.format template over the
+# event's own fields) plus its fields and the current context (e.g. 'file').
+# Front ends subscribe with listen()/subscribe(); the console only prints events at or
+# above CONSOLE_LEVEL, which is WARNING unless BST_LOG_LEVEL says otherwise, so batch
+# runs stay quiet. When nobody listens at a level, emit() returns before building the event.
+#
+# Levels: transaction-level progress is DEBUG, page- and file-level progress is INFO.
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+
+def parse_level(value, default=WARNING):
+    if isinstance(value, int):
+        return value
+    return LEVELS.get(str(value or "").lower(), default)
+
+CONSOLE_LEVEL = parse_level(os.environ.get("BST_LOG_LEVEL"))
+
+_lock = threading.Lock()
+_subscribers = ()          # tuple of (callback, level); replaced, never mutated
+_min_level = CONSOLE_LEVEL
+_local = threading.local()
+
+def _update_min_level():
+    global _min_level
+    _min_level = min([CONSOLE_LEVEL] + [level for _, level in _subscribers])
+
+def set_console_level(level):
+    """Console verbosity for this process, e.g. DEBUG in the standalone engine scripts."""
+    global CONSOLE_LEVEL
+    with _lock:
+        CONSOLE_LEVEL = parse_level(level)
+        _update_min_level()
+
+def subscribe(callback, level=INFO):
+    """Calls callback(event) for every event at or above level (from any thread)."""
+    global _subscribers
+    with _lock:
+        _subscribers = _subscribers + ((callback, parse_level(level)),)
+        _update_min_level()
+
+def unsubscribe(callback):
+    global _subscribers
+    with _lock:
+        _subscribers = tuple(s for s in _subscribers if s[0] is not callback)
+        _update_min_level()
+
+@contextlib.contextmanager
+def listen(callback, level=INFO):
+    subscribe(callback, level)
+    try:
+        yield
+    finally:
+        unsubscribe(callback)
+
+@contextlib.contextmanager
+def context(**fields):
+    """Adds fields (e.g. file=...) to every event emitted by this thread inside the block."""
+    previous = getattr(_local, "context", {})
+    _local.context = dict(previous, **fields)
+    try:
+        yield
+    finally:
+        _local.context = previous
+
+def enabled(level):
+    return level >= _min_level
+
+def format_event(event):
+    try:
+        return event["message"].format(**event)
+    except (KeyError, IndexError, ValueError):
+        return event["message"]
+
+def emit(kind, message="", level=INFO, **fields):
+    if level < _min_level:
+        return
+    # Context wins over the emitter's own fields: the front end knows the real file
+    # name ('file') even when the engine only sees in-memory bytes
+    event = dict(fields)
+    event.update(getattr(_local, "context", {}))
+    event.update(kind=kind, level=level, message=message)
+    dispatch(event)
+
+def dispatch(event):
+    """Delivers an already built event (also used for events forwarded from workers)."""
+    level = event["level"]
+    for callback, min_level in _subscribers:
+        if level >= min_level:
+            try:
+                callback(event)
+            except Exception:
+                pass  # a broken front end must not stop the engines
+    if level >= CONSOLE_LEVEL:
+        print(format_event(event))
+
+# --- worker processes -------------------------------------------------------------
+
+def forward_to(queue, level=INFO):
+    """Worker-side: sends events at or above level to the parent through a multiprocessing queue."""
+    subscribe(queue.put, level)
+
+def pump(queue, callback):
+    """Parent-side: calls callback(event) for forwarded events until a None sentinel arrives."""
+    for event in iter(queue.get, None):
+        try:
+            callback(event)
+        except Exception:
+            pass
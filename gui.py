@@ -1,74 +1,362 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
+from PIL import Image
+import collections
+import queue
 import threading
+import multiprocessing
 import os
-import sys
-
-# Import Verified Engines
-import hsbc_tagger
-import banamex_tagger
-import bbva_tagger
-import santander
-import monex_tagger
-import db_tagger
-import ocr_utils
-import detector
+import time
+
+# Engines and the OCR stack are loaded on first use (see tagger.get_engine, ocr_utils.load_ocr_stack)
+import events
+import pdf_io
+import pipeline
+import thumbnails
 
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
 
+# Tk widgets may only be touched from the main loop. The batch runs in a background
+# thread (the pipeline and its worker processes); it only puts messages on a queue,
+# which the main loop drains every PUMP_MS, at most PUMP_BATCH messages per tick:
+# log lines are inserted together and only the latest progress per file is drawn.
+PUMP_MS = 100
+PUMP_BATCH = 500
+
+# The log window keeps only the last LOG_LINES lines (older ones are dropped as new ones
+# arrive); each batch's full log goes to a 'bst_gui_<date>_<time>.log' file next to the
+# first selected file.
+LOG_LINES = 1000
+
+class FileTable(ctk.CTkFrame):
+    """
+    Virtualized table of the selected files. A fixed set of row widgets shows the visible
+    slice of self.items and is refilled on scroll or change, so thousands of files cost
+    no more widgets (or redraw time) than one screenful.
+    """
+    COLUMNS = (("File", 250), ("Bank", 80), ("Curr.", 50), ("Status", 150), ("Movs", 50), ("Time", 60))
+
+    def __init__(self, master, visible_rows=10, on_select=None):
+        super().__init__(master)
+        self.items = []     # dicts: path, name, bank, currency, state, status, count, seconds, progress, output
+        self.by_path = {}   # input path, as in results and worker events ('path')
+        self.first = 0
+        self.dirty = False
+        self.visible_rows = visible_rows
+        self.on_select = on_select
+
+        for col, (title, width) in enumerate(self.COLUMNS):
+            ctk.CTkLabel(self, text=title, width=width, anchor="w",
+                         font=ctk.CTkFont(weight="bold")).grid(row=0, column=col, padx=4, sticky="w")
+        ctk.CTkLabel(self, text="Progress", anchor="w", font=ctk.CTkFont(weight="bold")).grid(
+            row=0, column=len(self.COLUMNS), padx=4, sticky="w")
+
+        self.rows = []      # per visible row: (labels, progress bar, texts shown)
+        for r in range(visible_rows):
+            labels = []
+            for col, (_, width) in enumerate(self.COLUMNS):
+                label = ctk.CTkLabel(self, text="", width=width, anchor="w")
+                label.grid(row=r + 1, column=col, padx=4, sticky="w")
+                label.bind("<Button-1>", lambda e, r=r: self.select(r))
+                labels.append(label)
+            bar = ctk.CTkProgressBar(self, width=120)
+            bar.set(0)
+            bar.grid(row=r + 1, column=len(self.COLUMNS), padx=4)
+            self.rows.append((labels, bar, [None] * (len(labels) + 1)))
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.grid(row=1, column=len(self.COLUMNS) + 1, rowspan=visible_rows, sticky="ns")
+        self.totals = ctk.CTkLabel(self, text="", anchor="w")
+        self.totals.grid(row=visible_rows + 1, column=0, columnspan=len(self.COLUMNS) + 1, padx=4, sticky="w")
+        for widget in [self] + [w for labels, bar, _ in self.rows for w in labels + [bar]]:
+            widget.bind("<MouseWheel>", self.on_wheel)
+            widget.bind("<Button-4>", lambda e: self.scroll_to(self.first - 3))
+            widget.bind("<Button-5>", lambda e: self.scroll_to(self.first + 3))
+
+    def set_files(self, paths):
+        self.items = [{"path": p, "name": os.path.basename(p), "bank": "", "currency": "", "state": "queued",
+                       "status": "queued", "count": 0, "seconds": 0.0, "progress": 0.0, "output": None} for p in paths]
+        self.by_path = {item["path"]: item for item in self.items}
+        self.first = 0
+        self.dirty = True
+
+    def reset(self):
+        self.set_files([item["path"] for item in self.items])
+
+    def update_item(self, item, **fields):
+        item.update(fields)
+        self.dirty = True
+
+    def select(self, row):
+        """Click on a visible row: hands its item to on_select."""
+        index = self.first + row
+        if self.on_select and index < len(self.items):
+            self.on_select(self.items[index])
+
+    def on_wheel(self, event):
+        self.scroll_to(self.first - (3 if event.delta > 0 else -3))
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self.items)))
+        else:
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll_to(self.first + int(amount) * step)
+
+    def scroll_to(self, first):
+        first = max(0, min(first, len(self.items) - self.visible_rows))
+        if first != self.first:
+            self.first = first
+            self.dirty = True
+            self.refresh()
+
+    def refresh(self):
+        """Redraws the visible rows if anything changed (call from the main loop)."""
+        if not self.dirty:
+            return
+        self.dirty = False
+        for i, (labels, bar, shown) in enumerate(self.rows):
+            index = self.first + i
+            item = self.items[index] if index < len(self.items) else None
+            texts = [""] * len(labels) if item is None else [
+                item["name"], item["bank"], item["currency"], item["status"],
+                str(item["count"]) if item["count"] else "",
+                f"{item['seconds']:.1f}s" if item["seconds"] else ""]
+            # Only widgets whose content changed are reconfigured
+            for col, text in enumerate(texts):
+                if shown[col] != text:
+                    labels[col].configure(text=text)
+                    shown[col] = text
+            progress = item["progress"] if item else 0.0
+            if shown[-1] != progress:
+                bar.set(progress)
+                shown[-1] = progress
+        total = len(self.items)
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + self.visible_rows) / total))
+            counts = collections.Counter(item["state"] for item in self.items)
+            self.totals.configure(text=f"{total} files: " + ", ".join(f"{n} {state}" for state, n in counts.items()))
+        else:
+            self.scrollbar.set(0, 1)
+            self.totals.configure(text="")
+
+class PreviewPane(ctk.CTkFrame):
+    """
+    Page thumbnails of one file (its tagged output once there is one), a view of
+    COLUMNS x ROWS pages at a time. Only the pages on screen and the next view are
+    requested; a Thumbnailer renders them in the background (see thumbnails.py) and
+    the App hands them to set_thumb from the main loop.
+    """
+    COLUMNS = 2
+    ROWS = 2
+
+    def __init__(self, master, thumbnailer):
+        super().__init__(master)
+        self.thumbnailer = thumbnailer
+        self.path = None
+        self.pages = 0
+        self.first = 0
+        self.per_view = self.COLUMNS * self.ROWS
+        # Shown while a page loads and in unused slots (a CTkLabel keeps its image when given None)
+        size = (thumbnails.THUMB_WIDTH, thumbnails.THUMB_WIDTH * 4 // 3)
+        self.blank = ctk.CTkImage(light_image=Image.new("RGB", size, "#d0d0d0"), size=size)
+
+        self.heading = ctk.CTkLabel(self, text="Click a file to preview it", anchor="w", width=2 * thumbnails.THUMB_WIDTH)
+        self.heading.grid(row=0, column=0, columnspan=self.COLUMNS, padx=4, pady=(4, 0), sticky="w")
+        nav = ctk.CTkFrame(self, fg_color="transparent")
+        nav.grid(row=1, column=0, columnspan=self.COLUMNS, pady=4)
+        self.btn_prev = ctk.CTkButton(nav, text="◀", width=30, command=lambda: self.show_page(self.first - self.per_view))
+        self.btn_prev.pack(side="left", padx=4)
+        self.page_label = ctk.CTkLabel(nav, text="", width=140)
+        self.page_label.pack(side="left", padx=4)
+        self.btn_next = ctk.CTkButton(nav, text="▶", width=30, command=lambda: self.show_page(self.first + self.per_view))
+        self.btn_next.pack(side="left", padx=4)
+
+        self.slots = []     # per position: (image label, caption label, page shown, CTkImage kept alive)
+        for i in range(self.per_view):
+            row, col = divmod(i, self.COLUMNS)
+            image = ctk.CTkLabel(self, text="", image=self.blank)
+            image.grid(row=2 + 2 * row, column=col, padx=4, pady=(4, 0))
+            caption = ctk.CTkLabel(self, text="")
+            caption.grid(row=3 + 2 * row, column=col, padx=4)
+            self.slots.append([image, caption, None, None])
+            image.bind("<MouseWheel>", lambda e: self.show_page(self.first + (-1 if e.delta > 0 else 1) * self.per_view))
+            image.bind("<Button-4>", lambda e: self.show_page(self.first - self.per_view))
+            image.bind("<Button-5>", lambda e: self.show_page(self.first + self.per_view))
+        self.update_nav()
+
+    def show_file(self, path):
+        self.first = -1     # redraw even if the view starts on the same page
+        try:
+            self.pages = pdf_io.page_count(path)
+        except Exception as e:
+            self.path, self.pages = None, 0
+            self.heading.configure(text=f"⚠️ Cannot open {os.path.basename(path)}: {e}")
+            self.show_page(0)
+            return
+        self.path = path
+        self.heading.configure(text=os.path.basename(path))
+        self.show_page(0)
+
+    def show_page(self, first):
+        first = max(0, min(first, (max(self.pages, 1) - 1) // self.per_view * self.per_view))
+        if first == self.first:
+            return
+        self.first = first
+        visible = [p for p in range(first, first + self.per_view) if p < self.pages]
+        ahead = [p for p in range(first + self.per_view, first + 2 * self.per_view) if p < self.pages]
+        cached = self.thumbnailer.request(self.path, visible + ahead) if self.path else {}
+        for i, slot in enumerate(self.slots):
+            page = first + i
+            if page in visible:
+                slot[1].configure(text=f"p. {page + 1}")
+                slot[2] = page
+                if page in cached:
+                    self.set_image(slot, cached[page])
+                else:
+                    slot[0].configure(image=self.blank, text="…")
+                    slot[3] = None
+            else:
+                slot[0].configure(image=self.blank, text="")
+                slot[1].configure(text="")
+                slot[2], slot[3] = None, None
+        self.update_nav()
+
+    def set_thumb(self, path, page, thumb):
+        """A thumbnail from the Thumbnailer; ignored if that page is no longer on screen."""
+        if path != self.path:
+            return
+        for slot in self.slots:
+            if slot[2] == page:
+                if thumb is None:
+                    slot[0].configure(image=self.blank, text="⚠️")
+                    slot[3] = None
+                else:
+                    self.set_image(slot, thumb)
+
+    def set_image(self, slot, thumb):
+        size = (thumb["width"], thumb["height"])
+        slot[3] = ctk.CTkImage(light_image=Image.frombytes("RGB", size, thumb["samples"]), size=size)
+        slot[0].configure(image=slot[3], text="")
+
+    def update_nav(self):
+        if self.pages:
+            last = min(self.first + self.per_view, self.pages)
+            self.page_label.configure(text=f"Pages {self.first + 1}-{last} of {self.pages}")
+        else:
+            self.page_label.configure(text="")
+        self.btn_prev.configure(state="normal" if self.first > 0 else "disabled")
+        self.btn_next.configure(state="normal" if self.first + self.per_view < self.pages else "disabled")
+
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()
 
         self.title("Bank Statement Tagger Pro")
-        self.geometry("700x500")
+        self.geometry("1200x720")
 
         # --- Grid Layout ---
         self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure(2, weight=1)
+        self.grid_rowconfigure(3, weight=1)
+        self.grid_rowconfigure(4, weight=1)
 
         # --- Header ---
         self.label = ctk.CTkLabel(self, text="Bank Statement Tagger", font=ctk.CTkFont(size=20, weight="bold"))
-        self.label.grid(row=0, column=0, padx=20, pady=20)
+        self.label.grid(row=0, column=0, columnspan=2, padx=20, pady=20)
 
         # --- File Selection ---
         self.selection_frame = ctk.CTkFrame(self)
-        self.selection_frame.grid(row=1, column=0, padx=20, pady=10, sticky="ew")
-        self.selection_frame.grid_columnconfigure(0, weight=1)
+        self.selection_frame.grid(row=1, column=0, columnspan=2, padx=20, pady=10, sticky="ew")
+        self.selection_frame.grid_columnconfigure(1, weight=1)
 
         self.btn_select = ctk.CTkButton(self.selection_frame, text="Select PDF Files", command=self.select_files)
         self.btn_select.grid(row=0, column=0, padx=10, pady=10)
 
         self.file_label = ctk.CTkLabel(self.selection_frame, text="No files selected")
-        self.file_label.grid(row=0, column=1, padx=10, pady=10)
+        self.file_label.grid(row=0, column=1, padx=10, pady=10, sticky="w")
+
+        # Worker processes tagging files in parallel (one per core by default)
+        cpus = os.cpu_count() or 1
+        ctk.CTkLabel(self.selection_frame, text="Workers:").grid(row=0, column=2, padx=(10, 0), pady=10)
+        self.workers_menu = ctk.CTkOptionMenu(self.selection_frame, width=70,
+                                              values=[str(n) for n in range(1, cpus + 1)])
+        self.workers_menu.set(str(cpus))
+        self.workers_menu.grid(row=0, column=3, padx=10, pady=10)
 
         # --- Configuration ---
         self.config_frame = ctk.CTkFrame(self)
-        self.config_frame.grid(row=2, column=0, padx=20, pady=5, sticky="ew")
-        
+        self.config_frame.grid(row=2, column=0, columnspan=2, padx=20, pady=5, sticky="ew")
+
         ctk.CTkLabel(self.config_frame, text="Tag Prefix Pattern:").pack(side="left", padx=10)
         self.entry_prefix = ctk.CTkEntry(self.config_frame, width=200, placeholder_text="[BANK]_[CURR]_TAG")
         self.entry_prefix.pack(side="left", padx=10)
         self.entry_prefix.insert(0, "[BANK]_[CURR]_TAG")
-        
+
         ctk.CTkLabel(self.config_frame, text="(Use [BANK], [CURR] as placeholders)").pack(side="left", padx=10)
 
+        self.split_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(self.config_frame, text="Split combined PDFs", variable=self.split_var).pack(side="left", padx=10)
+
+        # Files already tagged (see manifest.py) are skipped unless this is checked
+        self.force_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(self.config_frame, text="Reprocess done files", variable=self.force_var).pack(side="left", padx=10)
+
+        # --- Per-file progress ---
+        self.table = FileTable(self, on_select=self.preview_item)
+        self.table.grid(row=3, column=0, padx=20, pady=5, sticky="nsew")
+
+        # --- Page preview (click a file in the table) ---
+        self.thumbnailer = thumbnails.Thumbnailer(lambda path, page, thumb: self.post("thumb", (path, page, thumb)))
+        self.preview = PreviewPane(self, self.thumbnailer)
+        self.preview.grid(row=3, column=1, rowspan=2, padx=(0, 20), pady=5, sticky="n")
+
         # --- Console Output ---
-        self.textbox = ctk.CTkTextbox(self, width=600, height=200)
-        self.textbox.grid(row=3, column=0, padx=20, pady=10, sticky="nsew")
+        self.textbox = ctk.CTkTextbox(self, width=600, height=160)
+        self.textbox.grid(row=4, column=0, padx=20, pady=10, sticky="nsew")
         self.textbox.insert("0.0", "Welcome! Select bank statements to begin.\n")
 
         # --- Action Buttons ---
-        self.btn_process = ctk.CTkButton(self, text="Start Tagging", command=self.start_processing_thread, state="disabled")
-        self.btn_process.grid(row=4, column=0, padx=20, pady=20)
+        self.button_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.button_frame.grid(row=5, column=0, columnspan=2, padx=20, pady=15)
+        self.btn_process = ctk.CTkButton(self.button_frame, text="Start Tagging", command=self.start_processing_thread, state="disabled")
+        self.btn_process.pack(side="left", padx=10)
+        self.btn_cancel = ctk.CTkButton(self.button_frame, text="Cancel", command=self.cancel_processing, state="disabled",
+                                        fg_color="#a33", hover_color="#822")
+        self.btn_cancel.pack(side="left", padx=10)
 
         self.selected_files = []
+        self.log_file = None
+        self.ui_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.after(PUMP_MS, self.pump)
 
     def log(self, message):
+        """Main loop only; the batch thread posts lines with post()."""
+        if self.log_file:
+            self.log_file.write(f"{message}\n")
+            self.log_file.flush()
         self.textbox.insert("end", f"{message}\n")
+        # Ring buffer: drop the oldest lines beyond LOG_LINES
+        lines = int(self.textbox.index("end-1c").split(".")[0])
+        if lines > LOG_LINES:
+            self.textbox.delete("1.0", f"{lines - LOG_LINES + 1}.0")
         self.textbox.see("end")
 
+    def open_log_file(self):
+        folder = os.path.dirname(os.path.abspath(self.selected_files[0]))
+        path = os.path.join(folder, time.strftime("bst_gui_%Y%m%d_%H%M%S.log"))
+        try:
+            self.log_file = open(path, "w", encoding="utf-8")
+        except OSError as e:
+            self.log(f"⚠️ Could not create log file {path}: {e}")
+            return
+        self.log(f"📝 Full log: {path}")
+
+    def post(self, kind, payload=None):
+        """Thread-safe: queues a message for the main loop (see pump)."""
+        self.ui_queue.put((kind, payload))
+
     def select_files(self):
         files = filedialog.askopenfilenames(filetypes=[("PDF Files", "*.pdf")])
         if files:
@@ -76,74 +364,140 @@ class App(ctk.CTk):
             self.file_label.configure(text=f"{len(files)} files selected")
             self.btn_process.configure(state="normal")
             self.log(f"Selected {len(files)} files.")
+            self.table.set_files(self.selected_files)
+            self.table.refresh()
 
-    def process_all(self):
+    def start_processing_thread(self):
         self.btn_process.configure(state="disabled")
         self.btn_select.configure(state="disabled")
-        
+        self.btn_cancel.configure(state="normal")
+        self.table.reset()
+        self.table.refresh()
+        self.open_log_file()
+
         pattern = self.entry_prefix.get().strip()
         if not pattern: pattern = "[BANK]_[CURR]_TAG"
-        
-        for f in self.selected_files:
-            filename = os.path.basename(f)
-            
-            # Detect Bank and Currency
-            bank, currency = detector.detect_bank_and_currency(f)
-            
-            # Generate Prefix
-            prefix = pattern.replace("[BANK]", bank).replace("[CURR]", currency)
-            
-            self.log(f"\n🚀 Processing: {filename}")
-            self.log(f"   ℹ️  Bank: {bank}, Currency: {currency} -> Prefix: {prefix}")
-            
+
+        self.cancel_event.clear()
+        options = {"pattern": pattern, "split": self.split_var.get(), "force": self.force_var.get(),
+                   "workers": int(self.workers_menu.get())}
+        thread = threading.Thread(target=self.process_all, args=(list(self.selected_files), options), daemon=True)
+        thread.start()
+
+    def process_all(self, files, options):
+        """Runs in the batch thread: no Tk calls here, only post()."""
+        # Reads, tagging and writes of consecutive files overlap (see pipeline.py)
+        jobs = [{"path": f} for f in files]
+        try:
+            results = pipeline.process_batch(jobs, on_result=lambda r: self.post("result", r),
+                                             on_event=lambda e: self.post("event", e),
+                                             cancel=self.cancel_event, **options)
+        except Exception as e:
+            self.post("log", f"❌ Batch failed: {e}")
+            results = None
+        self.post("done", results)
+
+    def cancel_processing(self):
+        self.cancel_event.set()
+        self.btn_cancel.configure(state="disabled")
+        self.log("🛑 Cancelling: files already being tagged will finish, the rest are skipped...")
+
+    def pump(self):
+        """Drains the UI queue on the main loop, then schedules itself again."""
+        lines, finished = [], False
+        results = None
+        for _ in range(PUMP_BATCH):
             try:
-                if bank == "HSBC":
-                    coords, actual_pdf = hsbc_tagger.get_transaction_coordinates(f)
-                    if coords:
-                        hsbc_tagger.create_tagged_pdf(actual_pdf, coords, prefix)
-                        self.log(f"   ✅ Done: Found {len(coords)} movements.")
-                    else:
-                        self.log("   ❌ No movements found.")
-
-                elif bank == "DB":
-                    coords, actual_pdf = db_tagger.get_transaction_coordinates(f)
-                    if coords:
-                        db_tagger.create_tagged_pdf(actual_pdf, coords, prefix)
-                        self.log(f"   ✅ Done: Found {len(coords)} movements.")
-                    else:
-                        self.log("   ❌ No movements found.")
-
-                elif bank == "BANAMEX":
-                    banamex_tagger.process_file(f, prefix)
-                    self.log("   ✅ Done.")
-
-                elif bank == "BBVA":
-                    bbva_tagger.process_file(f, prefix)
-                    self.log("   ✅ Done.")
-
-                elif bank == "SANTANDER":
-                    santander.process_file(f, prefix)
-                    self.log("   ✅ Done.")
-
-                elif bank == "MONEX":
-                    monex_tagger.process_file(f, prefix)
-                    self.log("   ✅ Done.")
-                
-                else:
-                    self.log(f"   ⚠️ Could not identify supported bank for {filename}. (Detected: {bank})")
+                kind, payload = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "event":
+                self.handle_event(payload, lines)
+            elif kind == "result":
+                self.handle_result(payload, lines)
+            elif kind == "log":
+                lines.append(payload)
+            elif kind == "thumb":
+                self.preview.set_thumb(*payload)
+            elif kind == "done":
+                finished, results = True, payload
+        self.table.refresh()
+        if lines:
+            self.log("\n".join(lines))
+        if finished:
+            self.finish_batch(results)
+        self.after(PUMP_MS, self.pump)
+
+    def preview_item(self, item):
+        """Shows the clicked file in the preview: its tagged output if it has one yet."""
+        self.preview.show_file(item["output"] or item["path"])
 
-            except Exception as e:
-                self.log(f"   ❌ Error: {e}")
+    def handle_event(self, event, lines):
+        """Live progress from the workers: the file's bar per page, warnings to the log."""
+        item = self.table.by_path.get(event.get("path"))
+        if event["kind"] == "file" and item is not None:
+            self.table.update_item(item, state="running", status="started")
+        elif event["kind"] == "page" and item is not None:
+            part = f"part {event['segment']}: " if event.get("segment") is not None else ""
+            self.table.update_item(item, state="running", progress=event["page"] / max(event["pages"], 1),
+                                   status=f"{part}page {event['page']}/{event['pages']}")
+        elif event["level"] >= events.WARNING:
+            lines.append(events.format_event(event))
 
-        self.log("\n✨ ALL TASKS COMPLETED.")
+    def handle_result(self, result, lines):
+        filename = os.path.basename(result["path"])
+        if result["segment"] is not None:
+            filename += f" (part {result['segment']}, pages {result['first_page']}-{result['last_page']})"
+        lines.append(f"\n🚀 Processed: {filename}")
+        if result["currency"]:
+            lines.append(f"   ℹ️  Bank: {result['bank']}, Currency: {result['currency']} -> Prefix: {result['prefix']}")
+
+        if result["stage"] == "cancelled":
+            state, status = "cancelled", "cancelled"
+            lines.append("   🛑 Cancelled.")
+        elif result["error"]:
+            state, status = "failed", f"failed ({result['stage']})"
+            lines.append(f"   ❌ Error: {result['error']}")
+        elif result["skipped"]:
+            state, status = "skipped", "up to date"
+            lines.append(f"   ⏭️ Up to date: {result['count']} movements (check 'Reprocess done files' to redo)")
+        elif result["duplicate_of"] and result["output"]:
+            state, status = "duplicate", f"copy of {os.path.basename(result['duplicate_of'])}"
+            lines.append(f"   ♻️ Same content as {os.path.basename(result['duplicate_of'])}: copied its {result['count']} movements.")
+        elif result["output"]:
+            state, status = "done", "done"
+            lines.append(f"   ✅ Done: Found {result['count']} movements.")
+        else:
+            state, status = "empty", "no movements"
+            lines.append("   ❌ No movements found.")
+
+        item = self.table.by_path.get(result["path"])
+        if item is not None:
+            # Segments of a split file add up; a failed segment marks the whole file
+            if item["state"] == "failed":
+                state, status = item["state"], item["status"]
+            self.table.update_item(item, state=state, status=status, progress=1.0,
+                                   bank=result["bank"] or "", currency=result["currency"] or "",
+                                   output=item["output"] or result["output"],
+                                   count=item["count"] + result["count"],
+                                   seconds=item["seconds"] + (result.get("seconds") or 0.0))
+
+    def finish_batch(self, results):
+        if results is not None:
+            self.log(f"\n📋 {pipeline.format_summary(pipeline.summarize(results))}")
+        self.log("✨ ALL TASKS COMPLETED.")
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
         self.btn_process.configure(state="normal")
         self.btn_select.configure(state="normal")
-        messagebox.showinfo("Success", "All selected files have been processed.")
-
-    def start_processing_thread(self):
-        thread = threading.Thread(target=self.process_all)
-        thread.start()
+        self.btn_cancel.configure(state="disabled")
+        if self.cancel_event.is_set():
+            messagebox.showinfo("Cancelled", "The batch was cancelled; see the log for the files that were processed.")
+        else:
+            messagebox.showinfo("Success", "All selected files have been processed.")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = App()
     app.mainloop()
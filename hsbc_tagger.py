@@ -1,11 +1,29 @@
 import pdfplumber
-import fitz  # PyMuPDF
-import os
 import glob
 import re
-import sys
 import traceback
 import ocr_utils
+import pdf_io
+import events
+import layout_cache
+import page_filter
+import tag_render
+import txindex
+
+# Bump when a change alters which transactions are found or where tags go;
+# re-tag sidecars written by older versions are then ignored (see sidecar.py)
+ENGINE_VERSION = 1
+
+# Column strips read by region-of-interest OCR (BST_OCR_MODE=roi).
+# The left strip keeps dates and descriptions (needed for the SALDO/TOTAL filters),
+# the amount strip matches the 50%-82% transaction band; the balance column is skipped.
+OCR_REGIONS = [
+    {"x0": 0.0, "x1": 0.50, "kind": "text"},
+    {"x0": 0.50, "x1": 0.82, "kind": "amount"},
+]
+
+# Transaction amounts (with decimals) sit in the 50%-82% band
+PAGE_FILTER = [page_filter.rule(r'\d\.|\.\d', 0.48, 0.84)]
 
 def is_valid_day(val):
     if not val: return False
@@ -38,8 +56,9 @@ def is_summary_line(text):
         if k in upper: return True
     return False
 
-def find_header_y(page):
-    words = page.extract_words()
+def find_header_y(page, words=None):
+    if words is None:
+        words = page.extract_words()
     lines = {}
     for w in words:
         y = round(w['top'] / 5) * 5
@@ -51,19 +70,45 @@ def find_header_y(page):
             return max(w['bottom'] for w in lines[y])
     return 0
 
+def find_header_y_cached(page, words):
+    """
+    find_header_y() on the page's words that, for a known layout (see layout_cache.py),
+    only looks at the narrow band around the cached "DETALLE ... MOVIMIENTOS" line.
+    """
+    fp = layout_cache.plumber_fingerprint("HSBC", page, words)
+    entry = layout_cache.lookup(fp)
+    if entry and entry["header_bottom"]:
+        y = entry["header_bottom"]
+        band = [w for w in words if y - 30 <= w["top"] and w["bottom"] <= y + 1]
+        if abs(find_header_y(page, band) - y) < 0.5:
+            layout_cache.hit(fp)
+            return y
+
+    header_bottom = find_header_y(page, words)
+    layout_cache.after_full_scan(fp, entry, {"header_bottom": header_bottom})
+    return header_bottom
+
 def get_transaction_coordinates(pdf_path):
-    print(f"   > Scanning file structure...")
+    """
+    Accepts a path or an in-memory PDF (bytes, memoryview, mmap, file object).
+    Returns (tagging_data, actual_pdf) where actual_pdf is the OCR'd PDF (bytes) when OCR was needed.
+    """
+    events.emit("file", "   > Scanning file structure...", bank="HSBC", file=pdf_io.display_name(pdf_path))
     
     if not ocr_utils.has_readable_text(pdf_path):
-        print("   > Text not readable. Attempting OCR...")
-        ocr_pdf = ocr_utils.force_ocr(pdf_path)
+        events.emit("ocr_needed", "   > Text not readable. Attempting OCR...")
+        ocr_pdf = ocr_utils.force_ocr(pdf_path, regions=OCR_REGIONS, bank="HSBC")
         if ocr_pdf: pdf_path = ocr_pdf 
 
     tagging_data = []
     transaction_count = 0
     
-    with pdfplumber.open(pdf_path) as pdf:
+    relevant = page_filter.relevant_pages(pdf_path, PAGE_FILTER)
+    with pdfplumber.open(pdf_io.open_stream(pdf_path)) as pdf:
+        page_filter.report("HSBC", relevant.count(False), len(pdf.pages))
         for page_num, page in enumerate(pdf.pages):
+            if not relevant[page_num]:
+                continue
             words = page.extract_words(keep_blank_chars=False)
             width = page.width
             
@@ -79,7 +124,7 @@ def get_transaction_coordinates(pdf_path):
             
             min_y_threshold = 0
             if page_num == 0:
-                header_bottom = find_header_y(page)
+                header_bottom = find_header_y_cached(page, words)
                 if header_bottom > 0: min_y_threshold = header_bottom - 10
             
             # --- CLUSTERING (Fixes split lines) ---
@@ -141,51 +186,86 @@ def get_transaction_coordinates(pdf_path):
                         word_height = target_word['bottom'] - target_word['top']
                         y_center = target_word['top'] + (word_height / 2)
                         
+                        # Index data: HSBC often prints only the day, kept as the raw date text
+                        left_text = " ".join(w['text'] for w in line_words if w['x0'] < target_word['x0'])
+                        date_text = txindex.find_date(left_text)
+                        if not date_text and is_valid_day(first_word['text']):
+                            date_text = first_word['text']
+                        
                         tagging_data.append({
                             "page_index": page_num,
                             "y": y_center,
                             "x": final_x, 
                             "height": word_height, 
                             "count": transaction_count,
-                            "align": align_mode
+                            "align": align_mode,
+                            "bbox": (target_word['x0'], target_word['top'], target_word['x1'], target_word['bottom']),
+                            "amount": target_word['text'],
+                            "direction": "withdrawal" if x_pct < split_pct else "deposit",
+                            "date": date_text
                         })
+                        events.emit("transaction", "   [{n}] page {page}", events.DEBUG, n=transaction_count, page=page_num + 1)
+
+            events.emit("page", "   > Page {page}/{pages}: {count} movements",
+                        page=page_num + 1, pages=len(pdf.pages), count=transaction_count)
     
     return tagging_data, pdf_path
 
-def create_tagged_pdf(pdf_path, tagging_data, prefix):
-    print(f"   > Writing {len(tagging_data)} tags to new PDF...")
-    doc = fitz.open(pdf_path)
-    for item in tagging_data:
-        page_idx = item['page_index']
-        y_pos = item['y']
-        x_pos = item['x']
-        font_size = item['height'] 
-        count = item['count']
-        align = item.get('align', 'center')
-        tag_text = f"{prefix}_{count}"
+def render_tagged_pdf(pdf_source, tagging_data, prefix):
+    """Draws the tags on a path or in-memory PDF and returns the result as bytes."""
+    events.emit("render", "   > Writing {count} tags to new PDF...", count=len(tagging_data))
+    doc = tag_render.open_document(pdf_source)
+    try:
+        pages = {}  # page index -> PageTags, drawn once all tags are placed
+        for item in tagging_data:
+            page_idx = item['page_index']
+            y_pos = item['y']
+            x_pos = item['x']
+            font_size = item['height'] 
+            count = item['count']
+            align = item.get('align', 'center')
+            tag_text = f"{prefix}_{count}"
         
-        if page_idx < len(doc):
-            page = doc[page_idx]
-            safe_fs = max(font_size, 10)
-            text_width = len(tag_text) * (safe_fs * 0.5) 
+            if page_idx < len(doc):
+                tags = pages.get(page_idx) or pages.setdefault(page_idx, tag_render.PageTags(doc[page_idx]))
+                safe_fs = max(font_size, 10)
             
-            # Adjust drawing X based on alignment
-            # Left: draw starting at x
-            # Right: draw ending at x
-            if align == "left": final_x = x_pos 
-            elif align == "right": final_x = x_pos - text_width
-            else: final_x = x_pos - (text_width / 2)
+                # Alignment is applied when drawn, with the measured tag width
+                # Left: draw starting at x
+                # Right: draw ending at x
             
-            # Visual Debugging
-            page.draw_circle((x_pos, y_pos), 3, color=(0, 0, 1), fill=(0, 0, 1))
-            page.insert_text((final_x, y_pos + (safe_fs/3)), tag_text, fontsize=safe_fs, color=(1, 0, 0))
-
-    base_name = os.path.splitext(pdf_path)[0]
-    output_filename = f"{base_name}_TAGGED.pdf"
-    doc.save(output_filename)
-    doc.close()
+                # Visual Debugging (debug render mode only)
+                tags.mark((x_pos, y_pos), 3)
+                tags.text((x_pos, y_pos + (safe_fs/3)), tag_text, safe_fs, align=align)
+                if "bbox" in item:
+                    txindex.record(page_idx, item["bbox"], tag_text, item.get("amount"),
+                                   item.get("direction"), item.get("date"))
+
+        for tags in pages.values():
+            tags.flush()
+        return tag_render.save(doc)
+    finally:
+        tag_render.close_document(doc)
+
+def create_tagged_pdf(pdf_path, tagging_data, prefix, output_filename=None):
+    """
+    Renders the tags and writes the result atomically.
+    pdf_path may be the in-memory OCR result, in which case output_filename is required.
+    """
+    pdf_bytes = render_tagged_pdf(pdf_path, tagging_data, prefix)
+    if output_filename is None:
+        output_filename = pdf_io.tagged_output_path(pdf_path)
+    pdf_io.write_bytes(output_filename, pdf_bytes)
     return output_filename
 
+def tag_pdf(source, prefix):
+    """
+    Tags a statement given as a path or in-memory PDF.
+    Returns (tagged_pdf_bytes, transaction_count).
+    """
+    coords, actual_pdf = get_transaction_coordinates(source)
+    return render_tagged_pdf(actual_pdf, coords, prefix), len(coords)
+
 def select_file():
     pdf_files = glob.glob("*.pdf")
     pdf_files = [f for f in pdf_files if "_TAGGED" not in f]
@@ -202,6 +282,7 @@ def select_file():
         except ValueError: pass
 
 if __name__ == "__main__":
+    events.set_console_level(events.INFO)
     print("--- HSBC PDF Tagger (Searchable + Dynamic Font) ---")
     selected_file = select_file()
     if selected_file:
@@ -210,7 +291,7 @@ if __name__ == "__main__":
             coords, pdf = get_transaction_coordinates(selected_file)
             if coords:
                 print(f"   > Found {len(coords)} transactions.")
-                output_file = create_tagged_pdf(pdf, coords, prefix_input)
+                output_file = create_tagged_pdf(pdf, coords, prefix_input, pdf_io.tagged_output_path(selected_file))
                 print(f"\nSuccess! Created tagged file: {output_file}")
             else:
                 print("\nNo transactions found.")
@@ -0,0 +1,119 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+
+import metrics
+import pdf_io
+
+# Statements from the same bank and template keep their table geometry month after month.
+# A page's layout fingerprint is its size plus the labels printed in its header band
+# (words without digits, so dates, amounts and account numbers do not change it).
+# Engines cache where the transaction table starts under that fingerprint and, on later
+# pages and files, only extract words below it. A cached entry is always re-checked
+# against the page (the header must still be there); if not, the engine falls back to
+# its full-page scan and stores the new result.
+# Layouts without a header (continuation pages) are cached too, with the position 0:
+# those pages go straight to the full-page scan, which they need anyway.
+HEADER_FRACTION = 0.2
+GRID_PT = 10            # label positions are rounded to this grid
+MAX_ENTRIES = 1000     # per process and in the cache file; least recently used go first
+
+# Optional JSON file shared by all processes (BST_LAYOUT_CACHE); in-memory per process otherwise
+CACHE_FILE = os.environ.get("BST_LAYOUT_CACHE") or None
+
+_lock = threading.Lock()
+_entries = {}
+_dirty = False          # entries stored since the cache file was last written
+
+def _read_file():
+    try:
+        with open(CACHE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+if CACHE_FILE:
+    _entries.update(_read_file())
+
+def fingerprint(bank, width, height, words):
+    """words: (x0, top, text) of the header band."""
+    labels = sorted(
+        (round(x0 / GRID_PT), round(top / GRID_PT), text.upper())
+        for x0, top, text in words
+        if text and not any(c.isdigit() for c in text)
+    )
+    key = repr((bank, round(width), round(height), labels)).encode("utf-8")
+    return f"{bank}:{hashlib.sha1(key).hexdigest()[:16]}"
+
+def fitz_fingerprint(bank, page):
+    rect = page.rect
+    band = (0, 0, rect.width, rect.height * HEADER_FRACTION)
+    words = [(w[0], w[1], w[4]) for w in page.get_text("words", clip=band)]
+    return fingerprint(bank, rect.width, rect.height, words)
+
+def plumber_fingerprint(bank, page, words=None):
+    """words: the page's words if already extracted (the header band is taken from them)."""
+    if words is None:
+        band = page.crop((0, 0, page.width, page.height * HEADER_FRACTION))
+        words = band.extract_words()
+    else:
+        words = [w for w in words if w["top"] < page.height * HEADER_FRACTION]
+    return fingerprint(bank, page.width, page.height, [(w["x0"], w["top"], w["text"]) for w in words])
+
+def lookup(fp):
+    """Cached geometry for a fingerprint (dict) or None. Call hit() once the page confirms it."""
+    return _entries.get(fp)
+
+def hit(fp):
+    """Records a hit and marks the entry as recently used."""
+    metrics.cache_lookup("layout", True)
+    with _lock:
+        entry = _entries.pop(fp, None)
+        if entry is not None:
+            _entries[fp] = entry
+
+def store(fp, entry):
+    """Records a miss and caches the geometry found by the full-page scan."""
+    global _dirty
+    metrics.cache_lookup("layout", False)
+    with _lock:
+        _entries.pop(fp, None)
+        _entries[fp] = entry
+        while len(_entries) > MAX_ENTRIES:
+            _entries.pop(next(iter(_entries)))
+        _dirty = True
+
+def flush():
+    """
+    Writes the cache file if layouts were stored since the last write. Called once per
+    statement (tagger.tag_statement) and at exit, not on every miss.
+    """
+    global _dirty
+    with _lock:
+        if not (CACHE_FILE and _dirty):
+            return
+        # Other processes' entries first, ours (the most recent) last; oldest trimmed
+        merged = {k: v for k, v in _read_file().items() if k not in _entries}
+        merged.update(_entries)
+        for k in list(merged)[:max(0, len(merged) - MAX_ENTRIES)]:
+            del merged[k]
+        pdf_io.write_bytes(CACHE_FILE, json.dumps(merged).encode("utf-8"))
+        _dirty = False
+
+atexit.register(flush)
+
+def after_full_scan(fp, entry, found):
+    """
+    After a full-page scan: a hit if it confirms the cached entry (a layout without a
+    header is still without one), else found is stored.
+    """
+    if entry == found:
+        hit(fp)
+    else:
+        store(fp, found)
+
+def clear():
+    with _lock:
+        _entries.clear()
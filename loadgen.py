@@ -0,0 +1,103 @@
+import argparse
+import glob
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+def _request(method, url, data=None):
+    """(status, body); status None when the connection failed (refused, reset, timed out)."""
+    req = urllib.request.Request(url, data=data, method=method)
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+    except (urllib.error.URLError, http.client.HTTPException, ConnectionError, TimeoutError) as e:
+        return None, str(e).encode("utf-8")
+
+def _count(stats, key, amount=1):
+    with stats["lock"]:
+        stats[key] += amount
+
+def run_one(base_url, path, stats):
+    with open(path, "rb") as f:
+        data = f.read()
+    query = urllib.parse.urlencode({"filename": os.path.basename(path)})
+
+    start = time.perf_counter()
+    while True:
+        code, body = _request("POST", f"{base_url}/jobs?{query}", data)
+        if code != 429:
+            break
+        _count(stats, "rejected")
+        time.sleep(0.2)
+    if code != 202:
+        _count(stats, "errors")
+        return
+    job_id = json.loads(body)["id"]
+
+    while True:
+        code, body = _request("GET", f"{base_url}/jobs/{job_id}")
+        # 404: the service already purged the job (see RESULT_TTL_SECONDS); None: connection failed
+        status = json.loads(body)["status"] if code == 200 else "failed"
+        if status in ("done", "failed"):
+            break
+        time.sleep(0.05)
+
+    if status == "done":
+        code, pdf = _request("GET", f"{base_url}/jobs/{job_id}/result")
+        if code != 200:
+            _count(stats, "errors")
+            return
+        with stats["lock"]:
+            stats["bytes"] += len(pdf)
+            stats["latencies"].append(time.perf_counter() - start)
+    else:
+        _count(stats, "errors")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for service.py")
+    parser.add_argument("folder", help="folder with sample statements")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--jobs", type=int, default=100, help="total jobs to submit")
+    parser.add_argument("--concurrency", type=int, default=8, help="simultaneous clients")
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.folder, "*.pdf")))
+    if not files:
+        print("❌ No PDF files found.")
+        return
+
+    lock = threading.Lock()
+    stats = {"rejected": 0, "errors": 0, "bytes": 0, "latencies": [], "lock": threading.Lock()}
+    next_job = [0]
+
+    def client():
+        while True:
+            with lock:
+                n = next_job[0]
+                next_job[0] += 1
+            if n >= args.jobs:
+                return
+            run_one(args.url, files[n % len(files)], stats)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - start
+
+    lat = sorted(stats["latencies"])
+    done = len(lat)
+    print(f"Jobs completed: {done}/{args.jobs} in {elapsed:.2f}s -> {done / elapsed:.2f} jobs/s")
+    if lat:
+        print(f"Latency p50: {lat[done // 2]:.3f}s  p95: {lat[min(done - 1, int(done * 0.95))]:.3f}s  max: {lat[-1]:.3f}s")
+    print(f"429 retries: {stats['rejected']}  errors: {stats['errors']}  output: {stats['bytes'] / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,33 @@
+import argparse
 import os
 import sys
+import multiprocessing
 import glob
-import re
 import detector
+import events
+import metrics
+import pipeline
+import profiler
+import sidecar
+import tag_render
+import tagger
+import txindex
 
-# Import Engines
-import hsbc_tagger
-import banamex_tagger
-import bbva_tagger
-import santander
-import monex_tagger
-import db_tagger
-import ocr_utils
-
-def process_file(filename, bank, prefix):
-    print(f"\n🚀 Processing: {filename} (Bank: {bank})")
-    
-    try:
-        if bank == "HSBC":
-            coords, actual_pdf = hsbc_tagger.get_transaction_coordinates(filename)
-            if coords:
-                print(f"   > Found {len(coords)} transactions.")
-                hsbc_tagger.create_tagged_pdf(actual_pdf, coords, prefix)
-            else:
-                print("   > No transactions found.")
-
-        elif bank == "DB":
-            coords, actual_pdf = db_tagger.get_transaction_coordinates(filename)
-            if coords:
-                print(f"   > Found {len(coords)} transactions.")
-                db_tagger.create_tagged_pdf(actual_pdf, coords, prefix)
-            else:
-                print("   > No transactions found.")
-
-        elif bank == "BANAMEX":
-            banamex_tagger.process_file(filename, prefix)
-
-        elif bank == "BBVA":
-            bbva_tagger.process_file(filename, prefix)
-
-        elif bank == "SANTANDER":
-            santander.process_file(filename, prefix)
-
-        elif bank == "MONEX":
-            monex_tagger.process_file(filename, prefix)
-            
-        else:
-            print(f"❌ Unknown bank for {filename}")
-
-    except Exception as e:
-        print(f"❌ Error processing {filename}: {e}")
-        import traceback
-        traceback.print_exc()
+def report_result(result):
+    name = os.path.basename(result["path"])
+    if result["error"]:
+        print(f"❌ Error processing {name} ({result['stage']}): {result['error']}")
+    elif result["skipped"]:
+        print(f"⏭️  {name}: up to date ({result['count']} transactions), skipped")
+    elif result["duplicate_of"] and result["output"]:
+        print(f"♻️  {name}: same content as {os.path.basename(result['duplicate_of'])}, "
+              f"{result['count']} transactions -> {result['output']}")
+    elif result["output"]:
+        print(f"✅ {name}: {result['count']} transactions -> {result['output']} ({result['seconds']:.1f}s)")
+    else:
+        print(f"   > {name}: No transactions found.")
 
-def main():
+def main(profile_dir=None, metrics_file=None, index_file=None, force=False):
     print("=========================================")
     print("   BANK STATEMENT TAGGER (ALL-IN-ONE)    ")
     print("=========================================")
@@ -90,16 +64,17 @@ def main():
         print("No valid selection.")
         return
 
-    # 3. Process
+    # 3. Collect bank and prefix per file (prompts happen up front)
+    jobs = []
     for idx in selected_indices:
         filename = pdfs[idx]
         bank, currency = detector.detect_bank_and_currency(filename)
         
         if bank == "UNK":
             print(f"\nCould not detect bank for '{filename}'.")
-            print("1. HSBC\n2. Banamex\n3. BBVA\n4. Santander\n5. Monex\n6. Deutsche Bank")
+            mapping = {str(i): b for i, b in enumerate(tagger.BANK_NAMES, 1)}
+            print("\n".join(f"{i}. {tagger.BANK_NAMES[b]}" for i, b in mapping.items()))
             choice = input("Select Bank Number: ").strip()
-            mapping = {"1": "HSBC", "2": "BANAMEX", "3": "BBVA", "4": "SANTANDER", "5": "MONEX", "6": "DB"}
             bank = mapping.get(choice)
         
         if bank:
@@ -108,12 +83,43 @@ def main():
             prefix = input(f"\nEnter Prefix for {filename} (Default: {default_prefix}): ").strip()
             if not prefix: prefix = default_prefix
             
-            process_file(filename, bank, prefix)
+            jobs.append({"path": filename, "bank": bank, "prefix": prefix})
         else:
             print("Skipping file (No bank selected).")
 
-    print("\n✅ All tasks completed.")
+    # 4. Process (reads, tagging and writes overlap across files)
+    results = pipeline.process_batch(jobs, on_result=report_result, profile_dir=profile_dir, metrics_file=metrics_file,
+                                     index_file=index_file, force=force)
+
+    print(f"\n📋 {pipeline.format_summary(pipeline.summarize(results))}")
+    print("✅ All tasks completed.")
     input("Press Enter to close...")
 
 if __name__ == "__main__":
-    main()
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Tag bank statement PDFs in the current folder")
+    parser.add_argument("--profile", metavar="DIR", default=profiler.PROFILE_DIR,
+                        help="profile each file with cProfile and write a hotspot report to DIR")
+    parser.add_argument("--metrics", metavar="FILE", default=metrics.METRICS_FILE,
+                        help="write Prometheus metrics to FILE and a JSON snapshot next to it")
+    parser.add_argument("--save-profile", choices=tag_render.SAVE_PROFILES, default=tag_render.SAVE_PROFILE,
+                        help="how tagged PDFs are written: compact (smallest), incremental (quickest on large scans) "
+                             "or fast (uncompressed, scratch runs)")
+    parser.add_argument("--index", metavar="FILE", default=txindex.INDEX_FILE,
+                        help="add every tagged transaction to a SQLite index (search it with txindex.py)")
+    parser.add_argument("--sidecars", metavar="DIR", default=sidecar.SIDECAR_DIR,
+                        help="keep what was found in each statement in DIR; re-tagging it with another prefix "
+                             "then only redraws the tags")
+    parser.add_argument("--force", action="store_true",
+                        help="reprocess files the run manifest says are already done")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="engine progress on the console: -v per page, -vv per transaction")
+    args = parser.parse_args()
+    if args.verbose:
+        level = "debug" if args.verbose > 1 else "info"
+        # Workers read the level from the environment when they start
+        os.environ["BST_LOG_LEVEL"] = level
+        events.set_console_level(level)
+    tag_render.set_save_profile(args.save_profile)
+    sidecar.set_dir(args.sidecars)
+    main(args.profile, args.metrics, args.index, args.force)
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+
+import events
+import pdf_io
+import tagger
+import txindex
+
+# Run manifest: every input folder gets a '.bst_manifest.jsonl' with one line per file
+# finished there (input size, mtime and SHA-256, and per output: bank, currency, prefix,
+# engine version, count and the output's name and size). A line is appended and synced as
+# soon as a file is done, so a batch that dies at file 1,400 leaves 1,399 entries behind.
+# The next run skips every input whose entry is still current (see Manifest.current) and
+# only processes the rest; --force reprocesses everything.
+# Files are tagged and written whole, so an interrupted file starts over; with sidecars
+# (see sidecar.py) files that did finish are not even read again.
+#
+# BST_MANIFEST=0 turns manifests off.
+ENABLED = os.environ.get("BST_MANIFEST", "1") != "0"
+MANIFEST_NAME = ".bst_manifest.jsonl"
+# Appends and compaction hold the manifest's lock file (pdf_io.acquire_lock), so a
+# compaction never drops a line another run or watcher appended meanwhile; an append
+# waits this long for it
+LOCK_WAIT_SECONDS = 5.0
+
+def _wait_lock(path):
+    deadline = time.monotonic() + LOCK_WAIT_SECONDS
+    while not pdf_io.acquire_lock(path):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def _read(manifest_path):
+    """{input file name: entry} and the number of lines in the file."""
+    entries, lines = {}, 0
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue    # a line cut short by a crash
+                entries[entry["name"]] = entry
+    except OSError:
+        pass
+    return entries, lines
+
+class Manifest:
+    """The manifests of the folders a run touches, loaded on first use. Thread-safe."""
+
+    def __init__(self, name=MANIFEST_NAME):
+        self.name = name
+        self.lock = threading.Lock()
+        self.folders = {}   # folder -> {input file name: entry}
+
+    def _location(self, path):
+        folder = os.path.dirname(os.path.abspath(path))
+        return folder, os.path.join(folder, self.name)
+
+    def _entries(self, folder, manifest_path):
+        entries = self.folders.get(folder)
+        if entries is not None:
+            return entries
+        entries, lines = _read(manifest_path)
+        self.folders[folder] = entries
+        # Later lines replace earlier ones; drop the replaced lines once they pile up.
+        # Skipped this time if another process holds the lock.
+        if lines > 2 * len(entries) + 100:
+            with pdf_io.exclusive(manifest_path) as claimed:
+                if claimed:
+                    entries.update(_read(manifest_path)[0])     # lines appended since
+                    body = "".join(json.dumps(e) + "\n" for e in entries.values())
+                    pdf_io.write_bytes(manifest_path, body.encode("utf-8"))
+        return entries
+
+    def lookup(self, path):
+        folder, manifest_path = self._location(path)
+        with self.lock:
+            return self._entries(folder, manifest_path).get(os.path.basename(path))
+
+    def current(self, path, bank=None, prefix=None, pattern=tagger.DEFAULT_PATTERN, split=False):
+        """
+        The entry of path if its outputs are up to date for this run, else None.
+        Up to date: same input content, run with the same split setting, every output made
+        by the current engine version with the prefix this run would use, and still on disk
+        with the size it was written with.
+        """
+        entry = self.lookup(path)
+        if entry is None or entry["split"] != split:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if (st.st_size, st.st_mtime_ns) != (entry["size"], entry["mtime_ns"]):
+            # Touched or copied: still the same statement if the bytes match
+            if st.st_size != entry["size"] or txindex.content_hash(path) != entry["sha256"]:
+                return None
+        folder = os.path.dirname(os.path.abspath(path))
+        for out in entry["outputs"]:
+            if bank and not split and out["bank"] != bank:
+                return None
+            engine = tagger.get_engine(out["bank"])
+            if engine is None or getattr(engine, "ENGINE_VERSION", None) != out["engine_version"]:
+                return None
+            if (prefix or tagger.build_prefix(pattern, out["bank"], out["currency"])) != out["prefix"]:
+                return None
+            if out["output"]:
+                try:
+                    if os.path.getsize(os.path.join(folder, out["output"])) != out["output_size"]:
+                        return None
+                except OSError:
+                    return None
+        return entry
+
+    def record(self, path, stat, sha256, results, split=False):
+        """
+        Appends the entry of a finished input. stat: os.stat of the input when it was read;
+        results: its pipeline results (one per segment), none of them failed.
+        """
+        outputs = []
+        for r in results:
+            engine = tagger.get_engine(r["bank"])
+            outputs.append({
+                "segment": r["segment"], "bank": r["bank"], "currency": r["currency"], "prefix": r["prefix"],
+                "engine_version": getattr(engine, "ENGINE_VERSION", None), "count": r["count"],
+                "pages": r["pages"],
+                "output": os.path.basename(r["output"]) if r["output"] else None,
+                "output_size": os.path.getsize(r["output"]) if r["output"] else None,
+            })
+        outputs.sort(key=lambda o: o["segment"] or 0)
+        entry = {"name": os.path.basename(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                 "sha256": sha256, "split": split, "outputs": outputs, "finished": time.time()}
+        folder, manifest_path = self._location(path)
+        with self.lock:
+            self._entries(folder, manifest_path)[entry["name"]] = entry
+            # Without the lock (a crashed holder) the line is appended anyway: at worst a
+            # concurrent compaction drops it and the file is tagged again next time
+            locked = _wait_lock(manifest_path)
+            try:
+                with open(manifest_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                events.emit("manifest", "⚠️ Could not update {manifest}: {error}", events.WARNING,
+                            manifest=manifest_path, error=e)
+            finally:
+                if locked:
+                    pdf_io.release_lock(manifest_path)
+        return entry
+
+def skipped_result(path, entry):
+    """Pipeline result for an input the manifest says is done."""
+    folder = os.path.dirname(os.path.abspath(path))
+    first = entry["outputs"][0] if entry["outputs"] else {}
+    outputs = [os.path.join(folder, o["output"]) for o in entry["outputs"] if o["output"]]
+    return {
+        "bank": first.get("bank"), "currency": first.get("currency"), "prefix": first.get("prefix"),
+        "count": sum(o["count"] for o in entry["outputs"]),
+        "pages": sum(o["pages"] or 0 for o in entry["outputs"]) or None,
+        "output": outputs[0] if outputs else None,
+        "skipped": True,
+    }
@@ -0,0 +1,219 @@
+import bisect
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+import pdf_io
+
+# Metrics are recorded in the process that collects results (pipeline, watcher, service)
+# and exported as a Prometheus textfile / endpoint and a JSON snapshot.
+# Work done inside a worker process (OCR time, cache lookups) is counted with add()
+# into the current job's stats, which travel back with the result (see tagger.tag_statement).
+METRICS_FILE = os.environ.get("BST_METRICS") or None
+
+# name -> (type, help, histogram buckets)
+DEFINITIONS = {
+    "bst_files_total": ("counter", "Files processed by bank and status (done, empty, skipped, duplicate, cancelled, failed)", None),
+    "bst_pages_total": ("counter", "Pages processed by bank", None),
+    "bst_pages_skipped_total": ("counter", "Pages skipped by the page prefilter by bank", None),
+    "bst_ocr_pages_total": ("counter", "Pages that went through OCR by bank", None),
+    "bst_ocr_seconds_total": ("counter", "Seconds spent in OCR by bank", None),
+    "bst_transactions_total": ("counter", "Transactions tagged by bank", None),
+    "bst_failures_total": ("counter", "Failed files by stage (read, tag, write)", None),
+    "bst_output_bytes_total": ("counter", "Bytes of tagged PDF written by bank", None),
+    "bst_save_seconds_total": ("counter", "Seconds spent serializing tagged PDFs by bank", None),
+    "bst_cache_requests_total": ("counter", "Cache lookups by cache and result (hit, miss)", None),
+    "bst_file_seconds": ("histogram", "Wall time per file by bank", (0.5, 1, 2, 5, 10, 30, 60, 120, 300)),
+    "bst_ocr_seconds_per_page": ("histogram", "OCR seconds per page by bank", (0.25, 0.5, 1, 2, 3, 5, 8, 13, 20)),
+    "bst_transactions_per_file": ("histogram", "Transactions found per file by bank", (0, 5, 10, 25, 50, 100, 250, 500, 1000)),
+}
+
+# --- worker side: per-job stats -------------------------------------------------
+
+_local = threading.local()
+
+@contextlib.contextmanager
+def job_stats():
+    """Collects add() calls made while a job runs in this thread; yields the Counter."""
+    stats = collections.Counter()
+    previous = getattr(_local, "stats", None)
+    _local.stats = stats
+    try:
+        yield stats
+    finally:
+        _local.stats = previous
+
+def add(key, value=1):
+    """Adds to the current job's stats (no-op outside job_stats())."""
+    stats = getattr(_local, "stats", None)
+    if stats is not None:
+        stats[key] += value
+
+def cache_lookup(cache, hit):
+    add(f"cache_{'hit' if hit else 'miss'}:{cache}")
+
+# --- collector side --------------------------------------------------------------
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class Registry:
+    """Thread-safe counters and histograms keyed by metric name and label tuple."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = collections.defaultdict(collections.Counter)
+        self.histograms = collections.defaultdict(dict)
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[name][tuple(sorted(labels.items()))] += value
+
+    def observe(self, name, value, **labels):
+        buckets = DEFINITIONS[name][2]
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            h = self.histograms[name].get(key)
+            if h is None:
+                h = self.histograms[name][key] = {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+            i = bisect.bisect_left(buckets, value)
+            if i < len(buckets):
+                h["buckets"][i] += 1
+            h["sum"] += value
+            h["count"] += 1
+
+    def record_file(self, bank=None, status="done", seconds=None, pages=0, count=0, stats=None, stage=None):
+        """Records one finished file (or segment). stats: the job's add() counters."""
+        bank = bank or "UNK"
+        stats = stats or {}
+        self.inc("bst_files_total", bank=bank, status=status)
+        if status == "failed":
+            self.inc("bst_failures_total", stage=stage or "tag")
+        if pages:
+            self.inc("bst_pages_total", pages, bank=bank)
+        if seconds is not None:
+            self.observe("bst_file_seconds", seconds, bank=bank)
+        if status != "failed":
+            self.inc("bst_transactions_total", count, bank=bank)
+            self.observe("bst_transactions_per_file", count, bank=bank)
+
+        if stats.get("pages_skipped"):
+            self.inc("bst_pages_skipped_total", stats["pages_skipped"], bank=bank)
+
+        if stats.get("output_bytes"):
+            self.inc("bst_output_bytes_total", stats["output_bytes"], bank=bank)
+            self.inc("bst_save_seconds_total", stats.get("save_seconds", 0.0), bank=bank)
+
+        ocr_pages = stats.get("ocr_pages", 0)
+        if ocr_pages:
+            ocr_seconds = stats.get("ocr_seconds", 0.0)
+            self.inc("bst_ocr_pages_total", ocr_pages, bank=bank)
+            self.inc("bst_ocr_seconds_total", ocr_seconds, bank=bank)
+            self.observe("bst_ocr_seconds_per_page", ocr_seconds / ocr_pages, bank=bank)
+
+        for key, value in stats.items():
+            if key.startswith("cache_"):
+                kind, cache = key[len("cache_"):].split(":", 1)
+                self.inc("bst_cache_requests_total", value, cache=cache, result=kind)
+
+    def record_result(self, result):
+        """Records a pipeline result dict (see pipeline.run_pipeline)."""
+        if result["stage"] == "cancelled":
+            self.inc("bst_files_total", bank=result["bank"] or "UNK", status="cancelled")
+            return
+        if not result["error"] and (result.get("skipped") or result.get("duplicate_of")):
+            # Up to date according to the run manifest, or a copy of another input: nothing was processed
+            status = "skipped" if result.get("skipped") else "duplicate"
+            self.inc("bst_files_total", bank=result["bank"] or "UNK", status=status)
+            return
+        if result["error"]:
+            status = "failed"
+        else:
+            status = "done" if result["count"] else "empty"
+        self.record_file(result["bank"], status, result.get("seconds"), result.get("pages") or 0,
+                         result["count"], result.get("stats"), result["stage"])
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            for name, (kind, help_text, buckets) in DEFINITIONS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for labels, value in sorted(self.counters[name].items()):
+                        lines.append(f"{name}{_labels_text(labels)} {value:g}")
+                    continue
+                for labels, h in sorted(self.histograms[name].items()):
+                    cumulative = 0
+                    for bound, n in zip(buckets, h["buckets"]):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{_labels_text(labels + (('le', f'{bound:g}'),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels_text(labels + (('le', '+Inf'),))} {h['count']}")
+                    lines.append(f"{name}_sum{_labels_text(labels)} {h['sum']:g}")
+                    lines.append(f"{name}_count{_labels_text(labels)} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """JSON-friendly summary with rates per bank, cache hit rates and failures by stage."""
+        with self.lock:
+            uptime = max(time.time() - self.started, 1e-9)
+            counters = {name: dict(values) for name, values in self.counters.items()}
+            histograms = {name: {labels: dict(h, buckets=list(h["buckets"])) for labels, h in values.items()}
+                          for name, values in self.histograms.items()}
+
+        def by(name, label):
+            totals = collections.Counter()
+            for labels, value in counters.get(name, {}).items():
+                totals[dict(labels).get(label)] += value
+            return totals
+
+        files, pages = by("bst_files_total", "bank"), by("bst_pages_total", "bank")
+        ocr_pages, ocr_seconds = by("bst_ocr_pages_total", "bank"), by("bst_ocr_seconds_total", "bank")
+        transactions = by("bst_transactions_total", "bank")
+        banks = {}
+        for bank in sorted(files):
+            banks[bank] = {
+                "files": files[bank],
+                "pages": pages[bank],
+                "files_per_second": files[bank] / uptime,
+                "pages_per_second": pages[bank] / uptime,
+                "ocr_seconds_per_page": ocr_seconds[bank] / ocr_pages[bank] if ocr_pages[bank] else None,
+                "transactions_per_file": transactions[bank] / files[bank] if files[bank] else None,
+                "status": {dict(l)["status"]: v for l, v in counters["bst_files_total"].items() if dict(l)["bank"] == bank},
+            }
+
+        caches = collections.defaultdict(lambda: {"hit": 0, "miss": 0})
+        for labels, value in counters.get("bst_cache_requests_total", {}).items():
+            labels = dict(labels)
+            caches[labels["cache"]][labels["result"]] += value
+        for c in caches.values():
+            c["hit_rate"] = c["hit"] / (c["hit"] + c["miss"]) if c["hit"] + c["miss"] else None
+
+        return {
+            "started": self.started,
+            "uptime_seconds": uptime,
+            "banks": banks,
+            "caches": dict(caches),
+            "failures": {dict(l)["stage"]: v for l, v in counters.get("bst_failures_total", {}).items()},
+            "histograms": {
+                name: {_labels_text(labels) or "all": h for labels, h in values.items()}
+                for name, values in histograms.items()
+            },
+        }
+
+    def write(self, path):
+        """Writes the Prometheus textfile to path and the JSON snapshot next to it (.json)."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        pdf_io.write_bytes(path, self.prometheus_text().encode("utf-8"))
+        json_path = os.path.splitext(path)[0] + ".json"
+        pdf_io.write_bytes(json_path, json.dumps(self.snapshot(), indent=2).encode("utf-8"))
+        return path
+
+# Process-wide registry used by the pipeline, watcher and service
+REGISTRY = Registry()
@@ -3,6 +3,18 @@ import re
 import os
 import sys
 import ocr_utils
+import pdf_io
+import events
+import page_filter
+import tag_render
+import txindex
+
+# Bump when a change alters which transactions are found or where tags go;
+# re-tag sidecars written by older versions are then ignored (see sidecar.py)
+ENGINE_VERSION = 1
+
+# Every Monex movement is anchored on an 8-digit reference number
+PAGE_FILTER = [page_filter.rule(r'\b\d{8}\b')]
 
 def get_lines_from_page(page):
     """
@@ -26,6 +38,7 @@ def get_lines_from_page(page):
 def process_monex_page(page, lines, prefix, counter):
     # Get all words raw to perform loose zone search
     all_words = page.get_text("words")
+    tags = tag_render.PageTags(page)
     
     for y in sorted(lines.keys()):
         line_words = sorted(lines[y], key=lambda x: x[0])
@@ -76,6 +89,7 @@ def process_monex_page(page, lines, prefix, counter):
                 pass
         
         target_zero_rect = None
+        amount_word = None
         
         # 3. Apply Zero-Balance Logic
         # We look for a positive amount followed immediately by 0.00, or preceded by 0.00
@@ -85,10 +99,12 @@ def process_monex_page(page, lines, prefix, counter):
                 # Check Next (Standard Monex format: Amount ... 0.00)
                 if i + 1 < len(numbers_found) and numbers_found[i+1][0] == 0.0:
                     target_zero_rect = fitz.Rect(numbers_found[i+1][1][:4])
+                    amount_word = (val, w)
                     break 
                 # Check Previous (Rare Monex format: 0.00 ... Amount)
                 if i - 1 >= 0 and numbers_found[i-1][0] == 0.0:
                     target_zero_rect = fitz.Rect(numbers_found[i-1][1][:4])
+                    amount_word = (val, w)
                     break 
 
         if target_zero_rect:
@@ -96,7 +112,7 @@ def process_monex_page(page, lines, prefix, counter):
             
             # Cover the 0.00 with a white box (existing logic)
             cover_rect = fitz.Rect(target_zero_rect.x0 - 5, target_zero_rect.y0 - 2, target_zero_rect.x1 + 5, target_zero_rect.y1 + 2)
-            page.draw_rect(cover_rect, color=(1, 1, 1), fill=(1, 1, 1))
+            tags.cover(cover_rect)
             
             # Place tag to the left of where the 0.00 was
             text_x = target_zero_rect.x0 - 10 
@@ -104,41 +120,67 @@ def process_monex_page(page, lines, prefix, counter):
             # Measure height of the Reference Number (y1 - y0)
             dynamic_fontsize = max(ref_word_obj[3] - ref_word_obj[1], 10)
             
-            # DEBUG: Draw circle
-            page.draw_circle((text_x, ref_word_obj[3]), 2, color=(0, 0, 1), fill=(0, 0, 1))
+            # DEBUG: Draw circle (debug render mode only)
+            tags.mark((text_x, ref_word_obj[3]), 2)
 
             # Align text vertically with the Reference Number using the calculated size
-            page.insert_text((text_x, ref_word_obj[3]), key, fontsize=dynamic_fontsize, color=(1, 0, 0))
+            tags.text((text_x, ref_word_obj[3]), key, dynamic_fontsize)
+            # The date (if printed) sits left of the reference number
+            date_text = txindex.find_date(" ".join(w[4] for w in line_words if w[0] < ref_word_obj[0]))
+            txindex.record(page.number, amount_word[1], key, amount_word[0], date=date_text)
+            events.emit("transaction", "   [{n}] -> {tag}", events.DEBUG, n=counter, tag=key, page=page.number + 1)
             counter += 1
             
+    tags.flush()
     return counter
 
-def process_file(filename, prefix):
-    try:
-        # OCR Check
-        if not ocr_utils.has_readable_text(filename):
-             ocr_result = ocr_utils.force_ocr(filename)
-             if ocr_result:
-                 filename = ocr_result
+def tag_pdf(source, prefix):
+    """
+    Tags a Monex statement given as a path or in-memory PDF.
+    Returns (tagged_pdf_bytes, movement_count).
+    """
+    # OCR Check
+    work_source = source
+    if not ocr_utils.has_readable_text(source):
+         ocr_result = ocr_utils.force_ocr(source, bank="MONEX")
+         if ocr_result:
+             work_source = ocr_result
 
-        doc = fitz.open(filename)
-        print(f"🏦 Processing MONEX File: {filename}")
+    doc = tag_render.open_document(work_source)
+    try:
+        events.emit("file", "🏦 Processing MONEX File: {file}", bank="MONEX", file=pdf_io.display_name(work_source), pages=len(doc))
         
         counter = 1
-        for page in doc:
+        skipped = 0
+        for i, page in enumerate(doc):
+            if not page_filter.matches(page, PAGE_FILTER):
+                skipped += 1
+                continue
             lines = get_lines_from_page(page)
             if lines:
                 counter = process_monex_page(page, lines, prefix, counter)
+            events.emit("page", "   > Page {page}/{pages}: {count} movements", page=i + 1, pages=len(doc), count=counter - 1)
+        page_filter.report("MONEX", skipped, len(doc))
+                
+        return tag_render.save(doc), counter - 1
+    finally:
+        tag_render.close_document(doc)
+
+def process_file(filename, prefix):
+    try:
+        pdf_bytes, total = tag_pdf(filename, prefix)
                 
-        output = filename.replace(".pdf", "_MONEX_TAGGED.pdf")
-        doc.save(output)
-        print(f"✅ Done! {counter - 1} movements tagged.")
+        output = pdf_io.tagged_output_path(filename, "_MONEX_TAGGED")
+        pdf_io.write_bytes(output, pdf_bytes)
+        print(f"✅ Done! {total} movements tagged.")
         print(f"📁 Saved as: {output}")
+        return output
         
     except Exception as e:
         print(f"❌ Error: {e}")
 
 if __name__ == "__main__":
+    events.set_console_level(events.INFO)
     print("--- MONEX AUTOMATOR ---")
     pdfs = [f for f in os.listdir('.') if f.lower().endswith('.pdf') and "_TAGGED" not in f]
     
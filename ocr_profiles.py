@@ -0,0 +1,71 @@
+import json
+import os
+
+# Tesseract settings per bank. Mexican statements only need Spanish; loading a
+# single language model is noticeably faster than 'eng+spa'.
+#   lang       - Tesseract language(s)
+#   psm        - page segmentation mode (6 = single uniform block, 4 = single column of variable sizes)
+#   oem        - engine mode (1 = LSTM only, None = Tesseract default)
+#   whitelist  - restrict recognised characters (None = all)
+#   dpi        - rasterization resolution used for OCR
+#   preprocess - image profile from preprocess.PROFILES (None = BST_PREPROCESS default)
+DEFAULT_PROFILE = {
+    "lang": "eng+spa",
+    "psm": 6,
+    "oem": None,
+    "whitelist": None,
+    "dpi": 300,
+    "preprocess": None,
+}
+
+BANK_PROFILES = {
+    "SANTANDER": {"lang": "spa", "oem": 1},
+    "HSBC": {"lang": "spa", "oem": 1},
+    "MONEX": {"lang": "spa", "oem": 1},
+    "BANAMEX": {"lang": "spa", "oem": 1},
+    "BBVA": {"lang": "spa", "oem": 1},
+    # Deutsche Bank statements are in English (BOOKDATE, CLOSE BALANCE)
+    "DB": {"lang": "eng", "oem": 1},
+}
+
+# Optional JSON file with per-bank overrides, e.g. the winners of bench_ocr_profiles.py:
+#   {"HSBC": {"psm": 4, "dpi": 250}}
+OVERRIDES_FILE = os.environ.get("BST_OCR_PROFILES")
+
+def _load_overrides():
+    if not OVERRIDES_FILE or not os.path.exists(OVERRIDES_FILE):
+        return {}
+    with open(OVERRIDES_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+_overrides = _load_overrides()
+
+def get_profile(bank=None, **overrides):
+    """Effective OCR profile for a bank: defaults < BANK_PROFILES < overrides file < keyword overrides."""
+    profile = dict(DEFAULT_PROFILE)
+    profile.update(BANK_PROFILES.get(bank, {}))
+    profile.update(_overrides.get(bank, {}))
+    profile.update({k: v for k, v in overrides.items() if v is not None})
+    return profile
+
+def tesseract_config(profile, whitelist=None):
+    """Builds the Tesseract command-line config string for a profile."""
+    parts = [f"--psm {profile['psm']}"]
+    if profile.get("oem") is not None:
+        parts.append(f"--oem {profile['oem']}")
+    whitelist = whitelist or profile.get("whitelist")
+    if whitelist:
+        parts.append(f"-c tessedit_char_whitelist={whitelist}")
+    return " ".join(parts)
+
+def describe(profile):
+    """Short label, e.g. 'spa psm6 oem1 300dpi'"""
+    label = f"{profile['lang']} psm{profile['psm']}"
+    if profile.get("oem") is not None:
+        label += f" oem{profile['oem']}"
+    label += f" {profile['dpi']}dpi"
+    if profile.get("whitelist"):
+        label += " wl"
+    if profile.get("preprocess"):
+        label += f" {profile['preprocess']}"
+    return label
@@ -1,96 +1,315 @@
-import pytesseract
-from pdf2image import convert_from_path
-from pypdf import PdfWriter, PdfReader
-from PIL import ImageEnhance
 import os
 import sys
 import io
+import threading
+import time
 import fitz
+import pdf_io
+import ocr_profiles
+import metrics
+import events
 
-# Configuration for bundled binaries
-if getattr(sys, 'frozen', False):
-    # If the application is run as a bundle
-    base_path = sys._MEIPASS
-    
-    # Set Tesseract path
-    tesseract_cmd_path = os.path.join(base_path, 'bin', 'Tesseract-OCR', 'tesseract.exe')
-    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd_path
-    
-    # Set Poppler path for pdf2image
-    poppler_path = os.path.join(base_path, 'bin', 'poppler')
-else:
-    # Running in normal Python environment
-    # Check if we have local bin folder (e.g. during dev)
-    local_bin_tesseract = os.path.join(os.getcwd(), 'bin', 'Tesseract-OCR', 'tesseract.exe')
-    local_bin_poppler = os.path.join(os.getcwd(), 'bin', 'poppler')
-    
-    if os.path.exists(local_bin_tesseract):
-        pytesseract.pytesseract.tesseract_cmd = local_bin_tesseract
-        
-    if os.path.exists(local_bin_poppler):
-        poppler_path = local_bin_poppler
-    else:
-        poppler_path = None # Rely on PATH
-
-def clean_image(image):
-    enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(1.5)
-    enhancer = ImageEnhance.Sharpness(image)
-    image = enhancer.enhance(1.5)
-    return image
-
-def force_ocr(input_pdf_path):
-    print(f"   > OCR: Converting '{os.path.basename(input_pdf_path)}' to searchable PDF...")
-    temp_output_path = input_pdf_path.replace(".pdf", "_OCR.pdf")
-    
-    try:
-        if poppler_path:
-            images = convert_from_path(input_pdf_path, dpi=300, poppler_path=poppler_path)
-        else:
-            images = convert_from_path(input_pdf_path, dpi=300)
+# The OCR stack (pytesseract, pdf2image, Pillow, numpy) is only needed for
+# scanned statements; it is imported by load_ocr_stack() the first time a page is OCRed,
+# so starting the GUI/CLI and tagging text PDFs never pays for it.
+pytesseract = None
+convert_from_path = convert_from_bytes = None
+Image = None
+preprocess = None
+poppler_path = None
+
+_stack_lock = threading.Lock()
 
-        pdf_writer = PdfWriter()
+def load_ocr_stack():
+    """Imports the OCR libraries and points them at the bundled binaries (once per process)."""
+    global pytesseract, convert_from_path, convert_from_bytes, Image, preprocess, poppler_path
+    if pytesseract is not None:
+        return
+    with _stack_lock:
+        if pytesseract is not None:
+            return
+        import pytesseract as tesseract_module
+        from pdf2image import convert_from_path, convert_from_bytes
+        from PIL import Image
+        import preprocess
 
-        for i, image in enumerate(images):
-            # print(f"     - Processing page {i + 1}/{len(images)}")
-            processed_image = clean_image(image)
-            custom_config = r'--psm 6'
+        # Configuration for bundled binaries
+        if getattr(sys, 'frozen', False):
+            # If the application is run as a bundle
+            base_path = sys._MEIPASS
             
-            try:
-                page_pdf_bytes = pytesseract.image_to_pdf_or_hocr(
-                    processed_image, 
-                    extension='pdf', 
-                    lang='eng+spa', 
-                    config=custom_config
-                )
-            except pytesseract.TesseractError:
-                 page_pdf_bytes = pytesseract.image_to_pdf_or_hocr(
-                    processed_image, 
-                    extension='pdf',
-                    config=custom_config
-                )
+            # Set Tesseract path
+            tesseract_cmd_path = os.path.join(base_path, 'bin', 'Tesseract-OCR', 'tesseract.exe')
+            tesseract_module.pytesseract.tesseract_cmd = tesseract_cmd_path
             
-            pdf_page = PdfReader(io.BytesIO(page_pdf_bytes))
-            pdf_writer.add_page(pdf_page.pages[0])
-
-        with open(temp_output_path, "wb") as f:
-            pdf_writer.write(f)
+            # Set Poppler path for pdf2image
+            poppler_path = os.path.join(base_path, 'bin', 'poppler')
+        else:
+            # Running in normal Python environment
+            # Check if we have local bin folder (e.g. during dev)
+            local_bin_tesseract = os.path.join(os.getcwd(), 'bin', 'Tesseract-OCR', 'tesseract.exe')
+            local_bin_poppler = os.path.join(os.getcwd(), 'bin', 'poppler')
             
-        print(f"   > OCR Success: {temp_output_path}")
-        return temp_output_path
+            if os.path.exists(local_bin_tesseract):
+                tesseract_module.pytesseract.tesseract_cmd = local_bin_tesseract
+                
+            if os.path.exists(local_bin_poppler):
+                poppler_path = local_bin_poppler
+            else:
+                poppler_path = None # Rely on PATH
+
+        # Published last: other threads only skip the lock once everything is set
+        pytesseract = tesseract_module
+
+# OCR mode: "full" rasterizes and OCRs whole pages; "roi" only OCRs the column
+# strips each engine declares in OCR_REGIONS (engines without regions use "full").
+OCR_MODE = os.environ.get("BST_OCR_MODE", "full").lower()
+
+OCR_DPI = ocr_profiles.DEFAULT_PROFILE["dpi"]
+
+# Page images kept in full-page OCR output. Tesseract reads the page at the profile's DPI,
+# but the searchable PDF only needs a readable picture under the invisible text:
+#   gray    - 8-bit grayscale JPEG at OCR_IMAGE_DPI (default)
+#   bilevel - black and white at OCR_IMAGE_DPI, Flate-compressed (smallest for clean scans)
+#   source  - the OCR-resolution image as Tesseract wraps it (previous behaviour)
+OCR_IMAGE_MODE = os.environ.get("BST_OCR_IMAGE_MODE", "gray").lower()
+OCR_IMAGE_DPI = int(os.environ.get("BST_OCR_IMAGE_DPI", "150"))
+OCR_JPEG_QUALITY = 60
+BILEVEL_THRESHOLD = 160
+ROI_PREVIEW_DPI = 50     # cheap render used to locate the table
+ROI_PADDING_PT = 6       # extra margin around the located table (PDF points)
+
+# Character whitelist per column kind; stops letters and noise being read as digits
+ROI_WHITELISTS = {
+    "amount": "0123456789.,$-",
+    "date": "0123456789/-.ABCDEFGHIJKLMNOPQRSTUVWXYZ",
+    "text": None,
+}
+
+def clean_image(image, profile=None):
+    """Preprocesses a page image for Tesseract (see preprocess.PROFILES, BST_PREPROCESS)."""
+    load_ocr_stack()
+    return preprocess.apply(image, profile)
+
+def rasterize(source, dpi=300, output_folder=None):
+    """
+    Renders every page of a path or in-memory PDF.
+    Without output_folder the pages come back as PIL images held in memory;
+    with one, they are written there and only the file paths are returned.
+    """
+    load_ocr_stack()
+    # Grayscale straight from Poppler: one third of the memory and no RGB->L pass later
+    kwargs = {"dpi": dpi, "grayscale": True}
+    if poppler_path:
+        kwargs["poppler_path"] = poppler_path
+    if output_folder:
+        kwargs["output_folder"] = output_folder
+        kwargs["paths_only"] = True
+    if pdf_io.is_path(source):
+        return convert_from_path(source, **kwargs)
+    return convert_from_bytes(pdf_io.read_bytes(source), **kwargs)
+
+def ocr_to_bytes(source, profile=None):
+    """
+    OCRs a path or in-memory PDF and returns the searchable PDF as bytes.
+    profile: settings from ocr_profiles.get_profile() (defaults when None).
+    Page images live in a private per-job workspace, never next to the input,
+    so concurrent workers on the same folder cannot collide.
+    """
+    load_ocr_stack()
+    profile = profile or ocr_profiles.get_profile()
+    with pdf_io.job_workspace() as workspace:
+        page_files = rasterize(source, dpi=profile["dpi"], output_folder=workspace)
+
+        out = fitz.open()
+        try:
+            for page_file in page_files:
+                # Inside the block: the 'none' profile hands back the opened image itself
+                with Image.open(page_file) as image:
+                    processed_image = clean_image(image, profile["preprocess"])
+                    add_ocr_page(out, processed_image, profile)
+            return out.tobytes(garbage=3, deflate=True)
+        finally:
+            out.close()
+
+# Languages Tesseract has no data for in this process; their pages go straight to the default
+_missing_langs = set()
+
+def _tesseract(func, image, profile, whitelist=None, extra_config="", **kwargs):
+    """
+    Calls a pytesseract function with the profile. If the profile's language pack is not
+    installed, warns once and uses Tesseract's default language; other errors are raised.
+    """
+    config = f"{ocr_profiles.tesseract_config(profile, whitelist)} {extra_config}".strip()
+    lang = profile["lang"]
+    if lang not in _missing_langs:
+        try:
+            return func(image, lang=lang, config=config, **kwargs)
+        except pytesseract.TesseractError as e:
+            message = str(e.message)
+            if "Failed loading language" not in message and "traineddata" not in message:
+                raise
+            _missing_langs.add(lang)
+            events.emit("ocr", "⚠️ Tesseract has no '{lang}' language data, using its default language", events.WARNING,
+                        lang=lang)
+    return func(image, config=config, **kwargs)
+
+def ocr_page(processed_image, profile=None, text_only=False):
+    """
+    OCRs one page image and returns Tesseract's one-page searchable PDF (bytes).
+    text_only: only the invisible text layer, without the page image.
+    """
+    load_ocr_stack()
+    profile = profile or ocr_profiles.get_profile()
+    return _tesseract(pytesseract.image_to_pdf_or_hocr, processed_image, profile,
+                      extra_config="-c textonly_pdf=1" if text_only else "", extension='pdf')
+
+def encode_page_image(image, page_width):
+    """
+    The page picture kept under the OCR text: OCR_IMAGE_MODE at OCR_IMAGE_DPI (never upscaled).
+    page_width: width in points of the page it covers; the image's own resolution follows
+    from it (preprocessing such as 'downsample' may already have reduced it).
+    """
+    load_ocr_stack()
+    image = image.convert("L") if image.mode != "L" else image
+    image_dpi = image.width * 72 / page_width
+    if OCR_IMAGE_DPI < image_dpi:
+        scale = OCR_IMAGE_DPI / image_dpi
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                             Image.LANCZOS)
+    buffer = io.BytesIO()
+    if OCR_IMAGE_MODE == "bilevel":
+        image.point(lambda v: 255 if v >= BILEVEL_THRESHOLD else 0, "1").save(buffer, "PNG", optimize=True)
+    else:
+        image.save(buffer, "JPEG", quality=OCR_JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+def add_ocr_page(doc, processed_image, profile):
+    """Appends the searchable page for one processed page image to a PyMuPDF document."""
+    source_image = OCR_IMAGE_MODE == "source"
+    page_pdf = ocr_page(processed_image, profile, text_only=not source_image)
+    with fitz.open(stream=page_pdf, filetype="pdf") as page_doc:
+        doc.insert_pdf(page_doc)
+    if not source_image:
+        page = doc[-1]
+        page.insert_image(page.rect, stream=encode_page_image(processed_image, page.rect.width), overlay=False)
+
+def find_table_region(page, regions):
+    """
+    Locates the vertical extent of the transaction table on a low-resolution render.
+    Uses the ink inside the amount strips (or all strips if none is an amount column)
+    and returns (top, bottom) in PDF points, or None for an empty page.
+    """
+    load_ocr_stack()
+    pix = page.get_pixmap(dpi=ROI_PREVIEW_DPI, colorspace=fitz.csGRAY)
+    preview = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    # Dark pixels become white so getbbox() returns the bounding box of the ink
+    ink = preview.point(lambda v: 255 if v < 160 else 0)
+
+    anchors = [r for r in regions if r["kind"] == "amount"] or regions
+    top, bottom = None, None
+    for r in anchors:
+        box = ink.crop((int(r["x0"] * pix.width), 0, int(r["x1"] * pix.width), pix.height)).getbbox()
+        if box:
+            top = box[1] if top is None else min(top, box[1])
+            bottom = box[3] if bottom is None else max(bottom, box[3])
+    if top is None:
+        return None
+
+    scale = page.rect.height / pix.height
+    return (max(0, top * scale - ROI_PADDING_PT), min(page.rect.height, bottom * scale + ROI_PADDING_PT))
+
+def _insert_invisible_word(page, text, rect):
+    """Adds an invisible (render mode 3) word whose bbox matches the OCR box."""
+    # PyMuPDF's Helvetica word box is ~1.374 x fontsize tall with the baseline 0.299 x fontsize above its bottom
+    fontsize = max(rect.height / 1.374, 1)
+    baseline = fitz.Point(rect.x0, rect.y1 - 0.299 * fontsize)
+    natural_width = fitz.get_text_length(text, fontname="helv", fontsize=fontsize)
+    morph = None
+    if natural_width > 0:
+        morph = (baseline, fitz.Matrix(rect.width / natural_width, 1))
+    page.insert_text(baseline, text, fontsize=fontsize, fontname="helv", render_mode=3, morph=morph)
+
+def ocr_regions(page, regions, profile=None):
+    """OCRs only the given column strips of a scanned page and adds their words as invisible text."""
+    load_ocr_stack()
+    profile = profile or ocr_profiles.get_profile()
+    region = find_table_region(page, regions)
+    if region is None:
+        return 0
+    top, bottom = region
+    width = page.rect.width
+    dpi = profile["dpi"]
+    scale = 72 / dpi
+    words_added = 0
+
+    for r in regions:
+        clip = fitz.Rect(r["x0"] * width, top, r["x1"] * width, bottom)
+        pix = page.get_pixmap(dpi=dpi, clip=clip, colorspace=fitz.csGRAY)
+        strip = clean_image(Image.frombytes("L", (pix.width, pix.height), pix.samples), profile["preprocess"])
+        data = _tesseract(pytesseract.image_to_data, strip, profile, ROI_WHITELISTS[r["kind"]],
+                          output_type=pytesseract.Output.DICT)
+        for i, text in enumerate(data["text"]):
+            text = text.strip()
+            if not text or float(data["conf"][i]) < 0:
+                continue
+            x0 = clip.x0 + data["left"][i] * scale
+            y0 = clip.y0 + data["top"][i] * scale
+            rect = fitz.Rect(x0, y0, x0 + data["width"][i] * scale, y0 + data["height"][i] * scale)
+            _insert_invisible_word(page, text, rect)
+            words_added += 1
+    return words_added
+
+def roi_ocr_to_bytes(source, regions, profile=None):
+    """
+    Region-of-interest OCR: keeps the original scanned pages and adds an invisible
+    text layer only for the table columns the engine reads (regions are fractions
+    of the page width, see OCR_REGIONS in the engines).
+    """
+    doc = pdf_io.open_document(source)
+    try:
+        for page in doc:
+            ocr_regions(page, regions, profile)
+        return pdf_io.document_bytes(doc)
+    finally:
+        doc.close()
+
+def force_ocr(source, regions=None, bank=None):
+    """
+    OCRs a scanned statement (path or in-memory PDF).
+    Returns the searchable PDF as bytes, or None on failure. Nothing is written
+    next to the input; the engines open the returned bytes directly.
+    regions: the engine's column strips, used when OCR_MODE is "roi".
+    bank: selects the Tesseract profile (see ocr_profiles.py).
+    """
+    profile = ocr_profiles.get_profile(bank)
+    events.emit("ocr", "   > OCR: Converting '{file}' to searchable PDF ({profile})...",
+                file=pdf_io.display_name(source), profile=ocr_profiles.describe(profile), stage="start")
+    
+    try:
+        start = time.perf_counter()
+        if OCR_MODE == "roi" and regions:
+            pdf_bytes = roi_ocr_to_bytes(source, regions, profile)
+        else:
+            pdf_bytes = ocr_to_bytes(source, profile)
+        metrics.add("ocr_seconds", time.perf_counter() - start)
+        metrics.add("ocr_pages", pdf_io.page_count(pdf_bytes))
+        events.emit("ocr", "   > OCR Success ({kb} KB in memory)", kb=len(pdf_bytes) // 1024, stage="done")
+        return pdf_bytes
         
     except Exception as e:
-        print(f"   > OCR Failed: {e}")
+        events.emit("ocr", "   > OCR Failed: {error}", events.WARNING, error=str(e), stage="failed")
         return None
 
-def has_readable_text(pdf_path, keywords=None):
+def has_readable_text(source, keywords=None, max_pages=None):
+    """True if the PDF has a text layer with statement keywords; max_pages: only look at the first pages."""
     if keywords is None:
         keywords = ["FECHA", "SALDO", "MOVIMIENTO", "DATE", "BALANCE", "DEPOSITO", "RETIRO", "ABONO", "CARGO", "REFERENCIA"]
     
     try:
-        doc = fitz.open(pdf_path)
+        doc = pdf_io.open_document(source)
         text = ""
-        for page in doc:
+        for page in doc.pages(0, min(max_pages or len(doc), len(doc))):
             text += page.get_text()
         
         doc.close()
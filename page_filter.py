@@ -0,0 +1,52 @@
+import os
+import re
+
+import fitz  # PyMuPDF
+
+import events
+import metrics
+import pdf_io
+
+# Cheap per-page check run before an engine's word extraction and row clustering.
+# Each engine declares PAGE_FILTER: a list of rules that must all match the page's
+# plain text (optionally only a vertical strip, x0/x1 as fractions of the page width).
+# Rules only encode what every tagged row needs (a date, an amount, a reference),
+# so terms, ads, fiscal annexes and summary pages are skipped without losing rows.
+ENABLED = os.environ.get("BST_PREFILTER", "1") != "0"
+
+def rule(pattern, x0=None, x1=None):
+    return {"pattern": re.compile(pattern), "x0": x0, "x1": x1}
+
+def matches(page, rules, text=None):
+    """
+    True if the PyMuPDF page may hold transactions (always True when disabled).
+    text: the page's full upper-cased text if the caller already extracted it.
+    """
+    if not ENABLED or not rules:
+        return True
+    texts = {(None, None): text} if text is not None else {}
+    for r in rules:
+        strip = (r["x0"], r["x1"])
+        if strip not in texts:
+            clip = None
+            if r["x0"] is not None:
+                width = page.rect.width
+                clip = fitz.Rect(width * r["x0"], 0, width * r["x1"], page.rect.height)
+            texts[strip] = page.get_text("text", clip=clip).upper()
+        if not r["pattern"].search(texts[strip]):
+            return False
+    return True
+
+def relevant_pages(source, rules):
+    """Per-page flags for engines that parse with pdfplumber (checked with PyMuPDF first)."""
+    doc = pdf_io.open_document(source)
+    try:
+        return [matches(page, rules) for page in doc]
+    finally:
+        doc.close()
+
+def report(bank, skipped, total):
+    metrics.add("pages_skipped", skipped)
+    if skipped:
+        events.emit("prefilter", "   > Skipped {skipped}/{pages} pages without transactions",
+                    bank=bank, skipped=skipped, pages=total)
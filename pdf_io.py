@@ -0,0 +1,165 @@
+import fitz  # PyMuPDF
+import contextlib
+import io
+import mmap
+import os
+import shutil
+import stat
+import tempfile
+import time
+
+# Lock files older than this are considered left over by a crashed worker
+LOCK_STALE_SECONDS = 3600
+# Lock files live in this subfolder of the locked file's folder, so claiming a file does
+# not touch the folder itself (the watcher only re-lists its inbox when that changes)
+LOCK_DIR = ".bst_locks"
+
+# A "source" is anything the taggers can read a PDF from:
+#   - a filesystem path (str / os.PathLike)
+#   - raw bytes, bytearray, memoryview or an mmap'd buffer
+#   - a binary file-like object (anything with .read())
+
+def is_path(source):
+    """True if the source refers to a file on disk."""
+    return isinstance(source, (str, os.PathLike))
+
+def display_name(source, default="<memory>"):
+    """Short name used in log messages."""
+    if is_path(source):
+        return os.path.basename(os.fspath(source))
+    name = getattr(source, "name", None)
+    if isinstance(name, str):
+        return os.path.basename(name)
+    return default
+
+def read_bytes(source):
+    """Returns the PDF content as bytes without copying more than needed."""
+    if is_path(source):
+        with open(source, "rb") as f:
+            return f.read()
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, (bytearray, memoryview, mmap.mmap)):
+        return bytes(source)
+    if hasattr(source, "read"):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return source.read()
+    raise TypeError(f"Unsupported PDF source: {type(source).__name__}")
+
+def open_document(source):
+    """Opens a path or in-memory PDF with PyMuPDF."""
+    if is_path(source):
+        return fitz.open(source)
+    if isinstance(source, mmap.mmap):
+        # PyMuPDF rejects mmap objects but reads a view of them without copying
+        return fitz.open(stream=memoryview(source), filetype="pdf")
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        # PyMuPDF reads directly from the buffer, no temp file needed
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(stream=read_bytes(source), filetype="pdf")
+
+def page_count(source):
+    doc = open_document(source)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+def open_stream(source):
+    """Returns something pdfplumber can open (a path or a BytesIO)."""
+    if is_path(source):
+        return source
+    return io.BytesIO(read_bytes(source))
+
+def document_bytes(doc):
+    """Serializes a PyMuPDF document to bytes."""
+    return doc.tobytes()
+
+# Read once: os.umask() can only be queried by setting it, which races with other threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _file_mode(path):
+    """Mode of the existing file at path, else 0o666 minus the umask (what open() would give)."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        return 0o666 & ~_UMASK
+
+def write_bytes(path, data):
+    """
+    Writes the PDF bytes atomically and returns the path.
+    Content goes to a hidden temp file in the same folder which is then renamed
+    over the target, so readers and other workers never see a half-written file.
+    """
+    path = os.fspath(path)
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp makes the file 0600; give it the mode a plain open() would have
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    return path
+
+@contextlib.contextmanager
+def job_workspace():
+    """Private scratch folder for one job's intermediates, removed afterwards."""
+    folder = tempfile.mkdtemp(prefix="bst_job_")
+    try:
+        yield folder
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+def _lock_path(path):
+    path = os.fspath(path)
+    return os.path.join(os.path.dirname(path), LOCK_DIR, f"{os.path.basename(path)}.lock")
+
+def acquire_lock(path):
+    """
+    Claims an input file for this worker across processes.
+    Returns False if another worker is already processing it.
+    """
+    lock = _lock_path(path)
+    os.makedirs(os.path.dirname(lock), exist_ok=True)
+    try:
+        if os.path.exists(lock) and time.time() - os.path.getmtime(lock) > LOCK_STALE_SECONDS:
+            os.remove(lock)
+    except OSError:
+        pass
+
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        f.write(str(os.getpid()))
+    return True
+
+def release_lock(path):
+    with contextlib.suppress(OSError):
+        os.remove(_lock_path(path))
+
+@contextlib.contextmanager
+def exclusive(path):
+    """Context manager around acquire_lock; yields False if the file is taken."""
+    if not acquire_lock(path):
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        release_lock(path)
+
+def tagged_output_path(filename, suffix="_TAGGED"):
+    """e.g. 'statement.pdf' -> 'statement_TAGGED.pdf'"""
+    base, ext = os.path.splitext(os.fspath(filename))
+    return f"{base}{suffix}{ext or '.pdf'}"
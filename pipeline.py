@@ -0,0 +1,329 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import events
+import manifest
+import metrics
+import pdf_io
+import profiler
+import segmenter
+import tagger
+import txindex
+
+# Default parallelism per stage. Tagging is CPU bound (one process per core);
+# reading and writing are I/O bound and mostly wait on the disk or network share.
+DEFAULT_READERS = 2
+DEFAULT_WRITERS = 2
+DEFAULT_QUEUE_SIZE = 4
+
+def _tag_job(data, bank, prefix, filename, pattern, profile_dir=None, segment=None, profile_key=None, path=None):
+    """
+    Detect + OCR + extract + render, executed in a worker process.
+    Its events carry the input's full path ('path'): 'file' is only the name.
+    """
+    with events.context(segment=segment, path=path):
+        if not profile_dir:
+            return tagger.tag_statement(data, prefix=prefix, bank=bank, filename=filename, pattern=pattern)
+        tagged, _ = profiler.profile_call(
+            profile_dir, profiler.profile_name(filename, segment, profile_key),
+            tagger.tag_statement, data, prefix=prefix, bank=bank, filename=filename, pattern=pattern)
+        return tagged
+
+async def run_pipeline(jobs, pattern=tagger.DEFAULT_PATTERN, readers=DEFAULT_READERS, workers=None,
+                       writers=DEFAULT_WRITERS, queue_size=DEFAULT_QUEUE_SIZE, executor=None, on_result=None,
+                       split=False, profile_dir=profiler.PROFILE_DIR, metrics_file=metrics.METRICS_FILE,
+                       on_event=None, event_level=events.INFO, index_file=txindex.INDEX_FILE,
+                       force=False, cancel=None):
+    """
+    Processes files as a three-stage pipeline: read -> tag -> write.
+
+    jobs: list of dicts with 'path' and optionally 'bank' and 'prefix'
+          (missing values are detected / built from pattern).
+    Stages are connected by bounded queues of queue_size items, so the next file
+    is read and the previous output is written while the current one is tagged,
+    and memory stays bounded when one stage is slower than the others.
+    on_result(result) is called as each file finishes. Returns all results.
+    With split=True, combined PDFs are cut into one segment per statement
+    (see segmenter.py) and the segments are tagged in parallel, each with its
+    own detection, counter and output file ('<name>_partNN_TAGGED.pdf').
+    With profile_dir, each file's tagging is profiled (see profiler.py) and a
+    hotspot report for the whole batch is written there at the end.
+    Every result is recorded in metrics.REGISTRY; with metrics_file the
+    Prometheus textfile and JSON snapshot are written when the batch ends.
+    on_event(event) receives progress events at or above event_level from the
+    workers (see events.py), e.g. one per page; it is called from a helper thread.
+    With index_file, each tagged file's transactions are added to that SQLite
+    index (see txindex.py) by the write stage, once its output is written.
+    Finished files are recorded in their folder's run manifest (see manifest.py); files
+    whose outputs are still up to date are skipped (result 'skipped': True) unless force.
+    Files with identical content (and the same bank and prefix) are tagged once: the
+    copies get the first one's outputs, written under their own names, and results with
+    'duplicate_of' set to its path (see summarize()).
+    cancel: optional threading.Event. Once set, files not yet being tagged are not
+    started and finish with stage 'cancelled'; files already in a worker complete.
+    """
+    loop = asyncio.get_running_loop()
+    own_executor = executor is None
+    event_queue = None
+    if on_event:
+        events.subscribe(on_event, event_level)
+        if own_executor:
+            event_queue = multiprocessing.Queue()
+            threading.Thread(target=events.pump, args=(event_queue, on_event), daemon=True).start()
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=tagger.warm_up,
+                                       initargs=(event_queue, event_level))
+    workers = workers or getattr(executor, "_max_workers", os.cpu_count() or 1)
+
+    pending = list(jobs)
+    pending.reverse()
+    to_tag = asyncio.Queue(maxsize=queue_size)
+    to_write = asyncio.Queue(maxsize=queue_size)
+    results = []
+    profiles = []
+    index = txindex.Index(index_file) if index_file else None
+    runs = manifest.Manifest() if manifest.ENABLED else None
+    # (sha256, bank, prefix) -> the first file with that content and the copies waiting for it
+    originals = {}
+    fan_outs = []
+
+    def finish(result, stage=None, error=None):
+        if error is not None:
+            result["stage"] = stage
+            result["error"] = str(error)
+        result["seconds"] = time.perf_counter() - result.pop("_start")
+        # The input lock is shared by all segments of a file; the last one releases it
+        metrics.REGISTRY.record_result(result)
+        result.pop("stats", None)
+        result.pop("year", None)
+        result.pop("transactions", None)
+        shared = result.pop("_file")
+        shared["refs"] -= 1
+        if error is not None:
+            shared["failed"] = result
+        elif not result["skipped"]:
+            shared["results"].append(result)
+        if shared["refs"] == 0 and shared["locked"]:
+            pdf_io.release_lock(result["path"])
+        # A file enters the manifest once all its segments are written
+        if shared["refs"] == 0 and runs is not None and shared["results"] and not shared["failed"]:
+            runs.record(result["path"], shared["stat"], shared["sha256"], shared["results"], split)
+        results.append(result)
+        if on_result:
+            on_result(result)
+        original = shared.get("original")
+        if shared["refs"] == 0 and original is not None:
+            original.update(done=True, failed=shared["failed"], results=shared["results"])
+            for copy in original.pop("copies"):
+                fan_outs.append(asyncio.ensure_future(fan_out(original, copy)))
+
+    async def fan_out(original, result):
+        """Gives a duplicate the outputs of the file it is a copy of."""
+        failed = original["failed"]
+        if failed:
+            finish(result, failed["stage"], f"same content as {os.path.basename(original['path'])}, "
+                                            f"which failed: {failed['error']}")
+            return
+        parts = []
+        for done in original["results"]:
+            part = dict(result, segment=done["segment"], first_page=done["first_page"], last_page=done["last_page"],
+                        saved_seconds=done["seconds"],
+                        **{k: done[k] for k in ("bank", "currency", "prefix", "count", "pages")})
+            parts.append((part, done["output"]))
+        result["_file"]["refs"] = len(parts)
+        for part, source in parts:
+            if source:
+                target = part["path"]
+                if part["segment"] is not None:
+                    target = segmenter.segment_path(target, part["segment"])
+                try:
+                    data = await asyncio.to_thread(pdf_io.read_bytes, source)
+                    part["output"] = await asyncio.to_thread(pdf_io.write_bytes, tagger.output_path(target, part["bank"]), data)
+                except Exception as e:
+                    finish(part, "write", e)
+                    continue
+            finish(part)
+
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    async def read_stage():
+        while pending:
+            job = pending.pop()
+            path = job["path"]
+            shared = {"refs": 1, "locked": False, "results": [], "failed": None}
+            result = {"path": path, "bank": job.get("bank"), "currency": None, "prefix": job.get("prefix"),
+                      "count": 0, "pages": None, "output": None, "stage": None, "error": None,
+                      "segment": None, "first_page": None, "last_page": None, "skipped": False,
+                      "duplicate_of": None,
+                      "_start": time.perf_counter(), "_file": shared}
+            if cancelled():
+                finish(result, "cancelled", "cancelled")
+                continue
+            if runs is not None and not force:
+                entry = await asyncio.to_thread(runs.current, path, job.get("bank"), job.get("prefix"), pattern, split)
+                if entry is not None:
+                    result.update(manifest.skipped_result(path, entry))
+                    finish(result)
+                    continue
+            if not pdf_io.acquire_lock(path):
+                finish(result, "read", "file is being processed by another worker")
+                continue
+            shared["locked"] = True
+            try:
+                shared["stat"] = await asyncio.to_thread(os.stat, path)
+                data = await asyncio.to_thread(pdf_io.read_bytes, path)
+                shared["sha256"] = await asyncio.to_thread(txindex.content_hash, data)
+            except Exception as e:
+                finish(result, "read", e)
+                continue
+
+            key = (shared["sha256"], job.get("bank"), job.get("prefix"))
+            original = originals.get(key)
+            if original is not None:
+                result["duplicate_of"] = original["path"]
+                if original["done"]:
+                    await fan_out(original, result)
+                else:
+                    original["copies"].append(result)
+                continue
+            originals[key] = shared["original"] = {"path": path, "done": False, "copies": []}
+
+            try:
+                if split:
+                    segments = await asyncio.to_thread(segmenter.split_segments, data)
+                else:
+                    segments = None
+            except Exception as e:
+                finish(result, "read", e)
+                continue
+
+            if not segments or len(segments) == 1:
+                await to_tag.put((result, data))
+                continue
+
+            shared["refs"] = len(segments)
+            for segment in segments:
+                part = dict(result, segment=segment["index"], first_page=segment["first_page"],
+                            last_page=segment["last_page"], _start=time.perf_counter())
+                await to_tag.put((part, segment["pdf"]))
+
+    async def tag_stage():
+        while True:
+            item = await to_tag.get()
+            if item is None:
+                return
+            result, data = item
+            if cancelled():
+                finish(result, "cancelled", "cancelled")
+                continue
+            # Same-named inputs from different folders get their own profile
+            profile_key = result["_file"]["sha256"][:12]
+            if profile_dir:
+                # Failed files are profiled too; the report skips files that never got that far
+                profiles.append(os.path.join(
+                    profile_dir, profiler.profile_name(result["path"], result["segment"], profile_key) + ".prof"))
+            try:
+                tagged = await loop.run_in_executor(
+                    executor, _tag_job, data, result["bank"], result["prefix"],
+                    os.path.basename(result["path"]), pattern, profile_dir, result["segment"], profile_key,
+                    result["path"])
+            except Exception as e:
+                finish(result, "tag", e)
+                continue
+            result.update({k: tagged[k] for k in ("bank", "currency", "prefix", "count", "pages", "stats",
+                                                  "sha256", "year", "transactions")})
+            await to_write.put((result, tagged["pdf"]))
+
+    async def write_stage():
+        while True:
+            item = await to_write.get()
+            if item is None:
+                return
+            result, pdf_bytes = item
+            if result["count"]:
+                target = result["path"]
+                if result["segment"] is not None:
+                    target = segmenter.segment_path(target, result["segment"])
+                output = tagger.output_path(target, result["bank"])
+                try:
+                    result["output"] = await asyncio.to_thread(pdf_io.write_bytes, output, pdf_bytes)
+                except Exception as e:
+                    finish(result, "write", e)
+                    continue
+            if index is not None:
+                try:
+                    await asyncio.to_thread(index.add, result, result["path"], result["output"])
+                except Exception as e:
+                    events.emit("index", "⚠️ Could not index {file}: {error}", events.WARNING,
+                                file=os.path.basename(result["path"]), path=result["path"], error=e)
+            finish(result)
+
+    try:
+        tag_tasks = [asyncio.create_task(tag_stage()) for _ in range(workers)]
+        write_tasks = [asyncio.create_task(write_stage()) for _ in range(writers)]
+
+        await asyncio.gather(*(read_stage() for _ in range(readers)))
+        for _ in tag_tasks:
+            await to_tag.put(None)
+        await asyncio.gather(*tag_tasks)
+        for _ in write_tasks:
+            await to_write.put(None)
+        await asyncio.gather(*write_tasks)
+        await asyncio.gather(*fan_outs)
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+        if on_event:
+            events.unsubscribe(on_event)
+        if event_queue is not None:
+            event_queue.put(None)
+        if index is not None:
+            index.close()
+
+    if profile_dir:
+        report = profiler.write_report(profile_dir, profiles)
+        if report:
+            # WARNING so it reaches the console (and the GUI log) by default: it was asked for
+            events.emit("profile", "📊 Profile hotspots: {report}", events.WARNING, report=report)
+    if metrics_file:
+        metrics.REGISTRY.write(metrics_file)
+    return results
+
+def summarize(results):
+    """
+    Run summary from run_pipeline results: counts by outcome (segments count separately)
+    and the tagging time duplicates did not spend (what their original took).
+    """
+    summary = {"files": len({r["path"] for r in results}), "done": 0, "empty": 0, "failed": 0,
+               "skipped": 0, "duplicates": 0, "cancelled": 0, "seconds_saved": 0.0}
+    for r in results:
+        if r["stage"] == "cancelled":
+            summary["cancelled"] += 1
+        elif r["error"]:
+            summary["failed"] += 1
+        elif r["skipped"]:
+            summary["skipped"] += 1
+        elif r["duplicate_of"]:
+            summary["duplicates"] += 1
+            summary["seconds_saved"] += r.get("saved_seconds", 0.0)
+        else:
+            summary["done" if r["count"] else "empty"] += 1
+    return summary
+
+def format_summary(summary):
+    text = (f"{summary['files']} files: {summary['done']} tagged, {summary['empty']} without movements, "
+            f"{summary['failed']} failed, {summary['skipped']} up to date")
+    if summary["duplicates"]:
+        text += f", {summary['duplicates']} duplicates (~{summary['seconds_saved']:.1f}s of tagging saved)"
+    if summary["cancelled"]:
+        text += f", {summary['cancelled']} cancelled"
+    return text
+
+def process_batch(jobs, **kwargs):
+    """Synchronous wrapper around run_pipeline for scripts and the GUI thread."""
+    return asyncio.run(run_pipeline(jobs, **kwargs))
@@ -0,0 +1,81 @@
+import os
+import numpy as np
+from PIL import Image
+
+# Image preprocessing applied to each page before Tesseract.
+# Every profile works on one 8-bit grayscale buffer with numpy (no per-pass PIL copies).
+#   none             - page as rendered
+#   threshold        - grayscale + Otsu binarization (clean, high-contrast scans)
+#   contrast_sharpen - grayscale + ImageEnhance Contrast 1.5 and Sharpness 1.5 (previous behaviour, on gray)
+#   downsample       - grayscale + 2x2 averaging (half the pixels, for fast scratch runs)
+PROFILES = ("none", "threshold", "contrast_sharpen", "downsample")
+DEFAULT_PROFILE = os.environ.get("BST_PREPROCESS", "contrast_sharpen").lower()
+
+CONTRAST_FACTOR = 1.5
+SHARPEN_FACTOR = 1.5
+
+def to_gray_array(image):
+    """PIL image -> 2-D uint8 array (converts to grayscale once if needed)."""
+    if image.mode != "L":
+        image = image.convert("L")
+    return np.asarray(image, dtype=np.uint8)
+
+def otsu_threshold(gray):
+    """Otsu's threshold computed from the histogram for all 256 levels at once."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = gray.size
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    mean_bg = np.divide(sum_bg, weight_bg, out=np.zeros(256), where=weight_bg > 0)
+    mean_fg = np.divide(sum_bg[-1] - sum_bg, weight_fg, out=np.zeros(256), where=weight_fg > 0)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+def smooth3(gray):
+    """
+    PIL's ImageFilter.SMOOTH (3x3 kernel, centre 5, others 1, / 13) as nine shifted slices;
+    like PIL, the one-pixel border is left as it is.
+    """
+    h, w = gray.shape
+    wide = gray.astype(np.uint16)
+    acc = 4 * wide[1:-1, 1:-1]
+    for dy in range(3):
+        for dx in range(3):
+            acc += wide[dy:dy + h - 2, dx:dx + w - 2]
+    out = gray.copy()
+    out[1:-1, 1:-1] = (acc + 6) // 13
+    return out
+
+def threshold(gray):
+    return np.where(gray > otsu_threshold(gray), 255, 0).astype(np.uint8)
+
+def contrast_sharpen(gray):
+    # Contrast around the rounded mean grey level (ImageEnhance.Contrast)
+    mean = int(gray.mean() + 0.5)
+    out = np.clip(mean + CONTRAST_FACTOR * (gray.astype(np.float32) - mean), 0, 255).astype(np.uint8)
+    # Push pixels away from their SMOOTH-filtered neighbourhood (ImageEnhance.Sharpness)
+    soft = smooth3(out).astype(np.float32)
+    return np.clip(soft + SHARPEN_FACTOR * (out - soft), 0, 255).astype(np.uint8)
+
+def downsample(gray):
+    h, w = gray.shape
+    h2, w2 = h // 2 * 2, w // 2 * 2
+    blocks = gray[:h2, :w2].reshape(h2 // 2, 2, w2 // 2, 2).astype(np.uint16)
+    return (blocks.sum(axis=(1, 3)) // 4).astype(np.uint8)
+
+_OPERATIONS = {
+    "threshold": threshold,
+    "contrast_sharpen": contrast_sharpen,
+    "downsample": downsample,
+}
+
+def apply(image, profile=None):
+    """Returns the preprocessed page as a PIL image (mode 'L' unless profile is 'none')."""
+    profile = (profile or DEFAULT_PROFILE).lower()
+    if profile == "none":
+        return image
+    if profile not in _OPERATIONS:
+        raise ValueError(f"Unknown preprocessing profile '{profile}' (choose from {', '.join(PROFILES)})")
+    return Image.fromarray(_OPERATIONS[profile](to_gray_array(image)))
@@ -0,0 +1,128 @@
+import collections
+import cProfile
+import io
+import os
+import pstats
+
+# Profiling is off unless a folder is given (--profile on the CLIs, BST_PROFILE for the GUI).
+# Each file writes <name>_<key>.prof (for snakeviz / gprof2dot) and .txt (top functions),
+# the key keeping same-named inputs from overwriting each other; write_report() then
+# aggregates the batch's profiles into hotspots.txt and hotspots.folded.
+PROFILE_DIR = os.environ.get("BST_PROFILE") or None
+
+TOP_FUNCTIONS = 30
+FOLDED_MIN_SECONDS = 0.0005   # drop flame-graph paths shorter than this
+FOLDED_MAX_DEPTH = 60
+
+def profile_name(filename, segment=None, key=None):
+    """'statement.pdf', 2, 'ab12cd34' -> 'statement_part02_ab12cd34' (one profile per file / segment)"""
+    base = os.path.splitext(os.path.basename(filename))[0]
+    if segment is not None:
+        base += f"_part{segment:02d}"
+    if key:
+        base += f"_{key}"
+    return base
+
+def _stats_text(stats, sort, limit):
+    buffer = io.StringIO()
+    stats.stream = buffer
+    stats.sort_stats(sort).print_stats(limit)
+    return buffer.getvalue()
+
+def profile_call(profile_dir, name, func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs) under cProfile and writes <profile_dir>/<name>.prof and .txt.
+    Returns (result, prof_path). The profile is written even if func raises.
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    prof_path = os.path.join(profile_dir, name + ".prof")
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(prof_path)
+        stats = pstats.Stats(prof_path).strip_dirs()
+        with open(os.path.join(profile_dir, name + ".txt"), "w", encoding="utf-8") as f:
+            f.write(_stats_text(stats, "cumulative", TOP_FUNCTIONS))
+    return result, prof_path
+
+def module_name(filename):
+    """'.../pymupdf/__init__.py' -> 'pymupdf/__init__.py', '~' (C functions) -> '<built-in>'"""
+    if filename == "~":
+        return "<built-in>"
+    base = os.path.basename(filename)
+    if base == "__init__.py":
+        return f"{os.path.basename(os.path.dirname(filename))}/{base}"
+    return base
+
+def module_times(stats):
+    """Own time per source file, e.g. {'santander.py': 1.2, 'pytesseract.py': 8.4}"""
+    totals = collections.Counter()
+    for (filename, _, _), (_, _, tottime, _, _) in stats.stats.items():
+        totals[module_name(filename)] += tottime
+    return totals
+
+def _label(func):
+    filename, line, name = func
+    return f"{module_name(filename)}:{name}" if line else name
+
+def folded_stacks(stats):
+    """
+    Approximate call stacks in the 'folded' format used by flamegraph.pl and speedscope
+    ('a;b;c <microseconds>'). cProfile only records caller -> callee edges, so the time of
+    a function called from several places is split in proportion to each edge.
+    """
+    raw = stats.stats
+    callees = collections.defaultdict(list)
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees[caller].append((func, edge[3]))
+    roots = [f for f, (_, _, _, _, callers) in raw.items() if not any(c in raw for c in callers)]
+
+    lines = collections.Counter()
+
+    def walk(func, stack, seconds):
+        _, _, tottime, cumtime, _ = raw[func]
+        if seconds < FOLDED_MIN_SECONDS or len(stack) > FOLDED_MAX_DEPTH:
+            return
+        share = seconds / cumtime if cumtime else 0
+        stack = stack + [_label(func)]
+        lines[";".join(stack)] += tottime * share
+        for callee, edge_seconds in callees[func]:
+            if _label(callee) not in stack:
+                walk(callee, stack, edge_seconds * share)
+
+    for root in roots:
+        walk(root, [], raw[root][3])
+    return [f"{stack} {int(seconds * 1e6)}" for stack, seconds in lines.items() if seconds * 1e6 >= 1]
+
+def write_report(profile_dir, prof_paths=None, top=TOP_FUNCTIONS):
+    """
+    Aggregates per-file profiles (default: every .prof in profile_dir) into
+    hotspots.txt (top functions and time per module) and hotspots.folded (flame graph input).
+    Returns the report path, or None when there is nothing to aggregate.
+    """
+    if prof_paths is None:
+        prof_paths = [os.path.join(profile_dir, f) for f in sorted(os.listdir(profile_dir)) if f.endswith(".prof")]
+    prof_paths = [p for p in prof_paths if p and os.path.exists(p)]
+    if not prof_paths:
+        return None
+
+    stats = pstats.Stats(*prof_paths)
+    modules = module_times(stats)
+    with open(os.path.join(profile_dir, "hotspots.folded"), "w", encoding="utf-8") as f:
+        f.write("\n".join(folded_stacks(stats)) + "\n")
+    stats.strip_dirs()
+
+    report_path = os.path.join(profile_dir, "hotspots.txt")
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(f"Hotspots across {len(prof_paths)} profiled files\n\n")
+        f.write("Own time per module\n")
+        total = sum(modules.values()) or 1
+        for module, seconds in modules.most_common(15):
+            f.write(f"  {seconds:9.3f}s  {100 * seconds / total:5.1f}%  {module}\n")
+        f.write("\nTop functions by own time\n")
+        f.write(_stats_text(stats, "tottime", top))
+        f.write("\nTop functions by cumulative time\n")
+        f.write(_stats_text(stats, "cumulative", top))
+    return report_path
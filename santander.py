@@ -3,6 +3,15 @@ import re
 import os
 import sys
 import ocr_utils # Use our new utility instead of ocrmypdf
+import pdf_io
+import events
+import page_filter
+import tag_render
+import txindex
+
+# Súbelo cuando un cambio altere qué movimientos se encuentran o dónde van las etiquetas;
+# los sidecars de re-etiquetado de versiones anteriores se ignoran (ver sidecar.py)
+ENGINE_VERSION = 1
 
 DATE_LIMIT_X = 0.18      # Límite derecho para encontrar la FECHA de la transacción
 MIN_X_SEARCH = 0.60      # Inicio de búsqueda de montos (salta descripción)
@@ -16,6 +25,20 @@ SPLIT_X = 0.76
 TAG_POS_DEPOSITO = 0.64 
 TAG_POS_RETIRO   = 0.76   
 
+# Franjas que el OCR por regiones (BST_OCR_MODE=roi) necesita leer: fecha y montos.
+# Se deja un pequeño margen para no cortar palabras en el borde.
+OCR_REGIONS = [
+    {"x0": 0.0, "x1": DATE_LIMIT_X + 0.04, "kind": "date"},
+    {"x0": MIN_X_SEARCH - 0.02, "x1": MAX_X_SEARCH + 0.02, "kind": "amount"},
+]
+
+# Filtro previo por página: se omite la extracción de palabras en páginas sin una
+# fecha en el margen izquierdo o sin un número con decimales en la zona de montos.
+PAGE_FILTER = [
+    page_filter.rule(r'\d{1,2}[\s.\-/]+(?:[A-Z]{3}|\d{2})', 0.0, DATE_LIMIT_X + 0.10),
+    page_filter.rule(r'\d[.,]\d', MIN_X_SEARCH - 0.05, MAX_X_SEARCH + 0.05),
+]
+
 def check_if_text_pdf(filename):
     """Verifica si el PDF ya tiene texto seleccionable."""
     try:
@@ -78,13 +101,17 @@ def row_starts_with_date(words_in_row, page_width):
     """
     Confirma si la fila comienza con una fecha válida en el margen izquierdo.
     """
+    return row_date(words_in_row, page_width) is not None
+
+def row_date(words_in_row, page_width):
+    """Fecha con la que comienza la fila (ej. "12 DIC"), o None."""
     limit_pixels = page_width * DATE_LIMIT_X
     
     # Filtrar palabras que empiezan visualmente en la zona de fecha
     candidate_words = [w for w in words_in_row if w[0] < limit_pixels]
     
     if not candidate_words:
-        return False
+        return None
 
     sorted_words = sorted(candidate_words, key=lambda w: w[0])
     
@@ -96,7 +123,7 @@ def row_starts_with_date(words_in_row, page_width):
     # Excluye falsos positivos que no empiecen con digito
     match = re.search(r'^\d{1,2}[\s\.\-\/]+(?:[A-Z]{3}|\d{2})', start_text)
     
-    return bool(match)
+    return match.group(0) if match else None
 
 def get_rows(page):
     """Agrupa palabras en renglones con tolerancia vertical."""
@@ -130,11 +157,14 @@ def process_page_strict_start(page, prefix, counter):
     pos_ret_vis    = page_width * TAG_POS_RETIRO
     
     rows = get_rows(page)
+    # Las etiquetas se escriben juntas al terminar la página
+    tags = tag_render.PageTags(page)
     
     for y, words in rows.items():
         
         # 1. ¿Es un renglón de transacción? (Tiene fecha a la izquierda)
-        if not row_starts_with_date(words, page_width):
+        date_text = row_date(words, page_width)
+        if not date_text:
             continue
             
         # 2. Buscar monto a la derecha
@@ -170,64 +200,71 @@ def process_page_strict_start(page, prefix, counter):
                     fs = w[3] - w[1] 
                     final_y = w[3] - (fs * 0.15)
                     
-                    # Insertar etiqueta en el PDF
-                    page.insert_text(
-                        (final_x, final_y), 
-                        key, 
-                        fontsize=fs, 
-                        fontname="helv", # Fuente estándar segura
-                        color=color
-                    )
+                    # Agregar etiqueta al lote de la página (Helvetica estándar)
+                    tags.text((final_x, final_y), key, fs, color)
+                    txindex.record(page.number, w, key, val, "deposit" if tag_type == "DEP" else "withdrawal", date_text)
                     
-                    print(f"   [{counter}] {tag_type} | ${val:,.2f} -> Etiqueta: {key}")
+                    events.emit("transaction", "   [{n}] {type} | ${amount:,.2f} -> Etiqueta: {tag}", events.DEBUG,
+                                n=counter, type=tag_type, amount=val, tag=key, page=page.number + 1)
                     counter += 1
                     amount_found = True
                     break # Solo tomamos el primer monto válido de la fila
         
+    tags.flush()
     return counter
 
-def process_file(filename, prefix):
-    work_file = filename
+def tag_pdf(source, prefix):
+    """
+    Etiqueta un estado de cuenta Santander (ruta o PDF en memoria).
+    Regresa (bytes_del_pdf_etiquetado, total_transacciones).
+    """
+    work_source = source
     
     # Lógica de OCR usando ocr_utils
-    if not ocr_utils.has_readable_text(filename):
-        print(f"⚠️  Texto no detectado o ilegible. Aplicando OCR...")
-        ocr_result = ocr_utils.force_ocr(filename)
+    if not ocr_utils.has_readable_text(source):
+        events.emit("ocr_needed", "⚠️  Texto no detectado o ilegible. Aplicando OCR...")
+        ocr_result = ocr_utils.force_ocr(source, regions=OCR_REGIONS, bank="SANTANDER")
         if ocr_result:
-            work_file = ocr_result
+            work_source = ocr_result
 
     doc = None
     try:
-        doc = fitz.open(work_file)
-        print(f"\n🚀 Procesando: {filename}")
+        doc = tag_render.open_document(work_source)
+        events.emit("file", "\n🚀 Procesando: {file}", bank="SANTANDER", file=pdf_io.display_name(source), pages=len(doc))
         
         counter = 1
+        skipped = 0
         for i, page in enumerate(doc):
-            # Feedback visual de progreso
-            print(f"--- Pág {i+1} ---")
-            counter = process_page_strict_start(page, prefix, counter)
+            if page_filter.matches(page, PAGE_FILTER):
+                counter = process_page_strict_start(page, prefix, counter)
+            else:
+                skipped += 1
+            # Avance por página (con los movimientos acumulados)
+            events.emit("page", "--- Pág {page}/{pages}: {count} movimientos ---", page=i + 1, pages=len(doc), count=counter - 1)
+        page_filter.report("SANTANDER", skipped, len(doc))
             
-        output = filename.replace(".pdf", "_TAGGED.pdf")
-        doc.save(output)
-        print(f"\n✅ FINALIZADO. Total Transacciones: {counter - 1}")
-        print(f"📁 Archivo guardado: {output}")
-        
-    except Exception as e:
-        print(f"❌ Error crítico procesando {filename}: {e}")
+        return tag_render.save(doc), counter - 1
     finally:
         # IMPORTANTE: Cerrar el documento para liberar el archivo
+        # (el resultado del OCR vive en memoria, no hay temporal que borrar)
         if doc:
-            doc.close()
+            tag_render.close_document(doc)
 
-    # Limpieza de archivo temporal OCR
-    if work_file != filename and os.path.exists(work_file):
-        try:
-            os.remove(work_file)
-            print("🧹 Archivo temporal OCR eliminado.")
-        except OSError as e:
-            print(f"⚠️ No se pudo borrar el temporal (quizás sigue en uso): {e}")
+def process_file(filename, prefix):
+    try:
+        pdf_bytes, total = tag_pdf(filename, prefix)
+            
+        output = pdf_io.tagged_output_path(filename)
+        pdf_io.write_bytes(output, pdf_bytes)
+        print(f"\n✅ FINALIZADO. Total Transacciones: {total}")
+        print(f"📁 Archivo guardado: {output}")
+        return output
+        
+    except Exception as e:
+        print(f"❌ Error crítico procesando {filename}: {e}")
 
 if __name__ == "__main__":
+    events.set_console_level(events.DEBUG)
     print("--- SANTANDER TAGGER V6 (FIXED) ---")
     
     # Buscar PDFs en el directorio actual
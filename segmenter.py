@@ -0,0 +1,130 @@
+import fitz  # PyMuPDF
+import re
+import os
+import sys
+import multiprocessing
+
+import pdf_io
+
+# Only these bands are read per page (header and footer), never the full page.
+# The header band is kept short so transaction descriptions ("TRASPASO A CUENTA ...")
+# on continuation pages do not look like a new account header.
+HEADER_FRACTION = 0.18
+FOOTER_FRACTION = 0.12
+
+# "Página 1 de 5", "HOJA 2/7", "Page 3 of 9"
+PAGE_NUMBER_RE = re.compile(r'\b(?:P[AÁ]GINA|HOJA|PAGE|PAG\.?)\s*:?\s*(\d{1,3})\s*(?:DE|OF|/)\s*(\d{1,3})\b')
+# "PERIODO DEL 01/01/2024 AL 31/01/2024", "PERIODO: 01-ENE-2024 - 31-ENE-2024"
+DATE = r'\d{1,2}[/\-\s](?:\d{1,2}|[A-Z]{3})[A-Z]*[/\-\s]\d{2,4}'
+PERIOD_RE = re.compile(r'PER[IÍ]ODO[^\d\n]{0,20}(' + DATE + r')[^\d\n]{1,10}(' + DATE + r')')
+# "CUENTA: 65-50123456-7", "CONTRATO 123456789", "ACCOUNT NO. 0012345678"
+ACCOUNT_RE = re.compile(r'(?:CUENTA|CONTRATO|ACCOUNT)[^\d\n]{0,20}(\d[\d\- ]{6,}\d)')
+
+def _band_text(page, top, bottom):
+    rect = page.rect
+    clip = fitz.Rect(0, rect.height * top, rect.width, rect.height * bottom)
+    return page.get_text("text", clip=clip).upper()
+
+def page_signature(page):
+    """
+    Cheap header/footer facts used to spot where a new statement starts.
+    Returns a dict with page_number, period and account (None when absent).
+    """
+    head = _band_text(page, 0, HEADER_FRACTION)
+    foot = _band_text(page, 1 - FOOTER_FRACTION, 1)
+
+    signature = {"page_number": None, "period": None, "account": None}
+
+    m = PAGE_NUMBER_RE.search(head) or PAGE_NUMBER_RE.search(foot)
+    if m:
+        signature["page_number"] = int(m.group(1))
+
+    m = PERIOD_RE.search(head)
+    if m:
+        signature["period"] = f"{m.group(1)} - {m.group(2)}"
+
+    m = ACCOUNT_RE.search(head)
+    if m:
+        signature["account"] = re.sub(r'[\s\-]', '', m.group(1))
+
+    return signature
+
+def _changed(current, new, key):
+    return current[key] is not None and new[key] is not None and current[key] != new[key]
+
+def find_boundaries(doc):
+    """
+    Returns the page indexes where a statement starts (always includes 0).
+    A page starts a new statement when its page number resets to 1, or when
+    its period or account differs from the statement being read.
+    Bank and currency are detected afterwards on each segment by the tagger.
+    """
+    starts = [0]
+    current = None
+    for i, page in enumerate(doc):
+        sig = page_signature(page)
+        if current is None:
+            current = sig
+            continue
+
+        new_statement = (
+            sig["page_number"] == 1
+            or _changed(current, sig, "period")
+            or _changed(current, sig, "account")
+        )
+        if new_statement:
+            starts.append(i)
+            current = sig
+        else:
+            # Fill in facts that only appear on later pages of the same statement
+            for key, value in sig.items():
+                if current[key] is None:
+                    current[key] = value
+    return starts
+
+def split_segments(source):
+    """
+    Splits a combined PDF into one PDF per statement.
+    Returns a list of dicts: index (1-based), first_page, last_page (1-based) and pdf (bytes).
+    A document with a single statement comes back unchanged as one segment.
+    """
+    doc = pdf_io.open_document(source)
+    try:
+        starts = find_boundaries(doc)
+        if len(starts) == 1:
+            return [{"index": 1, "first_page": 1, "last_page": len(doc), "pdf": pdf_io.read_bytes(source)}]
+
+        segments = []
+        ends = starts[1:] + [len(doc)]
+        for n, (start, end) in enumerate(zip(starts, ends), 1):
+            part = fitz.open()
+            part.insert_pdf(doc, from_page=start, to_page=end - 1)
+            segments.append({"index": n, "first_page": start + 1, "last_page": end, "pdf": part.tobytes(garbage=1)})
+            part.close()
+        return segments
+    finally:
+        doc.close()
+
+def segment_path(filename, index):
+    """'combined.pdf', 3 -> 'combined_part03.pdf' (used to name each segment's output)"""
+    base, ext = os.path.splitext(filename)
+    return f"{base}_part{index:02d}{ext}"
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    import pipeline
+
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python segmenter.py combined.pdf [more.pdf ...]")
+
+    def report(result):
+        label = os.path.basename(result["path"])
+        if result["segment"] is not None:
+            label += f" part {result['segment']} (pages {result['first_page']}-{result['last_page']})"
+        if result["error"]:
+            print(f"❌ {label}: {result['error']}")
+        else:
+            output = os.path.basename(result["output"]) if result["output"] else "no output"
+            print(f"✅ {label}: {result['bank']}-{result['currency']} {result['count']} movements -> {output}")
+
+    pipeline.process_batch([{"path": p} for p in sys.argv[1:]], split=True, on_result=report)
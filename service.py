@@ -0,0 +1,296 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import metrics
+import ocr_utils
+import sidecar
+import tagger
+import txindex
+
+# Finished jobs (and their PDFs) are kept this long for fetching
+RESULT_TTL_SECONDS = 600
+# Pages looked at to route a job to the text or the OCR lane
+ROUTING_PAGES = 2
+
+class QueueFull(Exception):
+    """Raised when a job queue is at capacity; the client should retry later."""
+
+def _run_job(data, filename, prefix, bank, pattern):
+    return tagger.tag_statement(data, prefix=prefix, bank=bank, filename=filename, pattern=pattern)
+
+class JobQueue:
+    """
+    Two bounded lanes ('text' and 'ocr'), each with its own worker processes.
+    A lane accepts at most max_pending waiting jobs; beyond that submit() raises QueueFull.
+    A worker process that dies (e.g. a crash in MuPDF or Tesseract on a bad upload) breaks
+    its pool: the lane gets a new one, and the jobs that were running are tried once more
+    on it, so only a job that crashes it again fails.
+    """
+
+    def __init__(self, text_workers=4, ocr_workers=2, max_pending=32, index_file=txindex.INDEX_FILE):
+        self.jobs = {}
+        self.index = txindex.Index(index_file) if index_file else None
+        self.lock = threading.Lock()
+        self.lanes = {}
+        for kind, workers in (("text", text_workers), ("ocr", ocr_workers)):
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=tagger.warm_up)
+            lane = {"queue": queue.Queue(maxsize=max_pending), "pool": pool, "workers": workers, "restarts": 0}
+            self.lanes[kind] = lane
+            for _ in range(workers):
+                threading.Thread(target=self._dispatch, args=(kind,), daemon=True).start()
+        # Expire results even when no new jobs arrive
+        threading.Thread(target=self._purge_loop, daemon=True).start()
+
+    def submit(self, data, filename=None, prefix=None, bank=None, pattern=tagger.DEFAULT_PATTERN):
+        self._purge()
+        kind = "text" if ocr_utils.has_readable_text(data, max_pages=ROUTING_PAGES) else "ocr"
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "filename": filename,
+            "status": "queued",
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "error": None,
+            "result": None,
+        }
+        args = (data, filename, prefix, bank, pattern)
+        try:
+            self.lanes[kind]["queue"].put_nowait((job, args))
+        except queue.Full:
+            raise QueueFull(kind)
+        with self.lock:
+            self.jobs[job["id"]] = job
+        return job
+
+    def _dispatch(self, kind):
+        lane = self.lanes[kind]
+        while True:
+            job, args = lane["queue"].get()
+            job["status"] = "running"
+            job["started"] = time.time()
+            try:
+                job["result"] = self._run(kind, args)
+                job["status"] = "done"
+            except Exception as e:
+                job["error"] = str(e)
+                job["status"] = "failed"
+            job["finished"] = time.time()
+            try:
+                self._record(job, args[3])
+            except Exception as e:
+                # e.g. 'database is locked' on an index shared with the watcher: keep the worker alive
+                print(f"⚠️ {job['filename'] or job['id']}: could not record job: {e}")
+            finally:
+                lane["queue"].task_done()
+
+    def _run(self, kind, args, attempts=2):
+        lane = self.lanes[kind]
+        for attempt in range(attempts):
+            pool = lane["pool"]
+            try:
+                return pool.submit(_run_job, *args).result()
+            except BrokenProcessPool:
+                self._replace_pool(kind, pool)
+                if attempt == attempts - 1:
+                    raise RuntimeError("worker process crashed while tagging this file")
+
+    def _replace_pool(self, kind, broken):
+        """Swaps a lane's broken pool for a new one (once, however many jobs saw it break)."""
+        lane = self.lanes[kind]
+        with self.lock:
+            if lane["pool"] is not broken:
+                return
+            lane["pool"] = ProcessPoolExecutor(max_workers=lane["workers"], initializer=tagger.warm_up)
+            lane["restarts"] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        print(f"⚠️ {kind} lane: a worker process died, started a new pool")
+
+    def _record(self, job, bank):
+        seconds = job["finished"] - job["started"]
+        result = job["result"]
+        if result is None:
+            metrics.REGISTRY.record_file(bank, "failed", seconds, stage="tag")
+            return
+        metrics.REGISTRY.record_file(result["bank"], "done" if result["count"] else "empty", seconds,
+                                     result["pages"], result["count"], result["stats"])
+        if self.index is not None and result["count"]:
+            # The tagged PDF only lives in memory here, so the filename is the only locator
+            self.index.add(result, job["filename"])
+
+    def _purge(self):
+        cutoff = time.time() - RESULT_TTL_SECONDS
+        with self.lock:
+            expired = [k for k, j in self.jobs.items() if j["finished"] and j["finished"] < cutoff]
+            for k in expired:
+                del self.jobs[k]
+
+    def _purge_loop(self):
+        while True:
+            time.sleep(RESULT_TTL_SECONDS / 10)
+            self._purge()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stats(self):
+        with self.lock:
+            counts = {}
+            for j in self.jobs.values():
+                counts[j["status"]] = counts.get(j["status"], 0) + 1
+        lanes = {
+            kind: {"workers": lane["workers"], "waiting": lane["queue"].qsize(), "capacity": lane["queue"].maxsize,
+                   "restarts": lane["restarts"]}
+            for kind, lane in self.lanes.items()
+        }
+        return {"jobs": counts, "lanes": lanes}
+
+    def shutdown(self):
+        for lane in self.lanes.values():
+            lane["pool"].shutdown(wait=False, cancel_futures=True)
+        if self.index is not None:
+            self.index.close()
+
+def job_status(job):
+    """Public view of a job (without the PDF bytes)."""
+    status = {k: job[k] for k in ("id", "kind", "filename", "status", "submitted", "started", "finished", "error")}
+    if job["result"]:
+        status.update({k: job["result"][k] for k in ("bank", "currency", "prefix", "count")})
+    return status
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    POST /jobs?filename=&prefix=&bank=&pattern=   body: PDF bytes   -> 202 {"id": ...}
+    GET  /jobs/<id>                                                  -> job status
+    GET  /jobs/<id>/result                                           -> tagged PDF
+    GET  /health                                                     -> queue stats
+    GET  /metrics                                                    -> Prometheus text format
+    GET  /metrics.json                                               -> metrics snapshot
+    GET  /transactions?amount=&from=&to=&tag=&bank=&limit=          -> transaction index search
+    """
+    jobs = None  # JobQueue, set by serve()
+
+    def _send_json(self, code, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/jobs":
+            return self._send_json(404, {"error": "not found"})
+
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length)
+        if not data.startswith(b"%PDF"):
+            return self._send_json(400, {"error": "body must be a PDF"})
+
+        try:
+            job = self.jobs.submit(
+                data,
+                filename=params.get("filename"),
+                prefix=params.get("prefix"),
+                bank=params.get("bank"),
+                pattern=params.get("pattern", tagger.DEFAULT_PATTERN),
+            )
+        except QueueFull as e:
+            return self._send_json(429, {"error": f"{e} queue is full"}, {"Retry-After": "1"})
+        self._send_json(202, {"id": job["id"], "kind": job["kind"]})
+
+    def do_GET(self):
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        if parts == ["health"]:
+            return self._send_json(200, self.jobs.stats())
+        if parts == ["metrics.json"]:
+            return self._send_json(200, metrics.REGISTRY.snapshot())
+        if parts == ["metrics"]:
+            body = metrics.REGISTRY.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if parts == ["transactions"]:
+            if self.jobs.index is None:
+                return self._send_json(404, {"error": "no transaction index (start with --index)"})
+            params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            try:
+                rows = self.jobs.index.find(params.get("amount"), params.get("from"), params.get("to"),
+                                            params.get("tag"), params.get("bank"), int(params.get("limit", 100)))
+            except ValueError as e:
+                return self._send_json(400, {"error": str(e)})
+            return self._send_json(200, {"transactions": rows})
+        if len(parts) < 2 or parts[0] != "jobs":
+            return self._send_json(404, {"error": "not found"})
+
+        job = self.jobs.get(parts[1])
+        if job is None:
+            return self._send_json(404, {"error": "unknown job"})
+        if len(parts) == 2:
+            return self._send_json(200, job_status(job))
+        if parts[2:] == ["result"]:
+            if job["status"] != "done":
+                return self._send_json(409, job_status(job))
+            body = job["result"]["pdf"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._send_json(404, {"error": "not found"})
+
+    def log_message(self, format, *args):
+        # Keep request logging out of the hot path
+        pass
+
+def serve(host="127.0.0.1", port=8765, text_workers=4, ocr_workers=2, max_pending=32, index_file=txindex.INDEX_FILE):
+    jobs = JobQueue(text_workers=text_workers, ocr_workers=ocr_workers, max_pending=max_pending,
+                    index_file=index_file)
+    Handler.jobs = jobs
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"🚀 Tagger service listening on http://{host}:{port}")
+    print(f"   text workers: {text_workers}, OCR workers: {ocr_workers}, queue capacity: {max_pending}/lane")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        jobs.shutdown()
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    cpus = os.cpu_count() or 2
+    parser = argparse.ArgumentParser(description="Bank Statement Tagger local service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--text-workers", type=int, default=cpus)
+    parser.add_argument("--ocr-workers", type=int, default=max(1, cpus // 2))
+    parser.add_argument("--max-pending", type=int, default=32, help="waiting jobs per lane before 429")
+    parser.add_argument("--index", metavar="FILE", default=txindex.INDEX_FILE,
+                        help="SQLite transaction index of every tagged job (searchable at /transactions)")
+    parser.add_argument("--sidecars", metavar="DIR", default=sidecar.SIDECAR_DIR,
+                        help="re-tag sidecars folder: a PDF posted again with another prefix is only redrawn")
+    args = parser.parse_args()
+    sidecar.set_dir(args.sidecars)
+    serve(args.host, args.port, args.text_workers, args.ocr_workers, args.max_pending, args.index)
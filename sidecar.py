@@ -0,0 +1,72 @@
+import gzip
+import json
+import os
+
+import pdf_io
+
+# Re-tag sidecars: what an engine found in a statement, so the statement can be tagged
+# again with another prefix by only drawing the tags (tag_render.replay), without
+# detection, OCR, word extraction or row logic.
+# A sidecar is keyed by the SHA-256 of the input and records the engine version it was
+# made with; tagger.tag_statement ignores it when the engine has changed since.
+# For scans, the OCR result the tags were drawn on is kept next to it ('<sha256>.pdf').
+#
+# BST_SIDECAR_DIR (or --sidecars): folder for the sidecars; unset = no sidecars.
+SIDECAR_DIR = os.environ.get("BST_SIDECAR_DIR") or None
+
+FORMAT = 1
+
+def set_dir(folder):
+    """Sidecar folder for this process and the worker processes it starts."""
+    global SIDECAR_DIR
+    SIDECAR_DIR = folder or None
+    if folder:
+        os.environ["BST_SIDECAR_DIR"] = folder
+    else:
+        os.environ.pop("BST_SIDECAR_DIR", None)
+
+def _path(sha256, ext):
+    return os.path.join(SIDECAR_DIR, sha256[:2], sha256 + ext)
+
+def load(sha256):
+    """
+    The sidecar for an input hash as a dict, or None (no folder, none stored, unreadable).
+    'base' is the path of the stored OCR result, or None when the tags go on the input itself.
+    """
+    if not SIDECAR_DIR:
+        return None
+    try:
+        with open(_path(sha256, ".json.gz"), "rb") as f:
+            data = json.loads(gzip.decompress(f.read()))
+    except (OSError, ValueError, EOFError):
+        return None
+    if data.get("format") != FORMAT:
+        return None
+    if data["base"]:
+        data["base"] = _path(sha256, ".pdf")
+        if not os.path.exists(data["base"]):
+            return None
+    return data
+
+def store(sha256, data, base_pdf=None):
+    """
+    Writes the sidecar for an input hash. data: bank, currency, prefix, engine_version,
+    count, pages, year, 'pages_drawn' (tag_render.recording) and transactions.
+    base_pdf: bytes of the document the tags were drawn on, when it is not the input (OCR).
+    """
+    if not SIDECAR_DIR:
+        return None
+    os.makedirs(os.path.dirname(_path(sha256, "")), exist_ok=True)
+    if base_pdf is not None:
+        pdf_io.write_bytes(_path(sha256, ".pdf"), base_pdf)
+    payload = dict(data, format=FORMAT, base=base_pdf is not None)
+    body = gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+    return pdf_io.write_bytes(_path(sha256, ".json.gz"), body)
+
+def relabel(old_prefix, new_prefix):
+    """Function renaming tags made with old_prefix ('HSBC_MXN_TAG_7' -> 'AUDIT_7')."""
+    def rename(tag):
+        if old_prefix and tag.startswith(old_prefix):
+            return new_prefix + tag[len(old_prefix):]
+        return tag
+    return rename
@@ -0,0 +1,207 @@
+import contextlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import fitz  # PyMuPDF
+
+import events
+import metrics
+import pdf_io
+
+# Engines queue a page's tags on a PageTags and write them in one batch when the page
+# is done: a single Shape holds the cover boxes, marks and tag texts and is committed
+# once, so the page gets one content stream fragment and one reference to the standard
+# Helvetica resource instead of one fragment per insert_text/draw_* call.
+# (fitz.TextWriter would also batch, but it embeds a copy of the font in every output,
+# which costs more than it saves on typical statements.)
+#
+# While a job runs inside recording(), the document an engine opened and every flushed
+# page are recorded, so the same tags can later be drawn again with another prefix
+# without re-running the engine (see sidecar.py).
+#
+# BST_RENDER_MODE: "production" (default) leaves out the debug dots drawn where the
+# engines computed each tag; "debug" draws them.
+RENDER_MODE = os.environ.get("BST_RENDER_MODE", "production").lower()
+
+# How tagged outputs are serialized, chosen per run with BST_SAVE_PROFILE (or --save-profile)
+SAVE_PROFILES = {
+    # Deflate streams, drop unused objects and merge duplicates: smallest files
+    "compact": {"garbage": 3, "deflate": True, "deflate_images": True, "deflate_fonts": True, "use_objstms": 1},
+    # Append only the tags to an unchanged copy of the input: quickest on large scans,
+    # the original bytes (and any signatures) are kept as they are
+    "incremental": {"incremental": True},
+    # Plain serialization without compression or cleanup, for scratch runs
+    "fast": {},
+}
+SAVE_PROFILE = os.environ.get("BST_SAVE_PROFILE", "compact").lower()
+if SAVE_PROFILE not in SAVE_PROFILES:
+    SAVE_PROFILE = "compact"
+
+# Incremental saves need a document opened from a file PyMuPDF may append to
+COPY_PREFIX = "bst_incr_"
+
+FONT_NAME = "helv"
+RED = (1, 0, 0)
+WHITE = (1, 1, 1)
+MARK_COLOR = (0, 0, 1)
+
+def text_length(text, fontsize):
+    return fitz.get_text_length(text, fontname=FONT_NAME, fontsize=fontsize)
+
+class PageTags:
+    """Collects one page's tags; flush() draws them (call it once the page is processed)."""
+
+    def __init__(self, page):
+        self.page = page
+        self.texts = []     # (baseline anchor, text, fontsize, color, align)
+        self.covers = []    # (rect, color)
+        self.marks = []     # (center, radius)
+
+    def text(self, point, text, fontsize, color=RED, align="left"):
+        """
+        point: where the baseline is anchored; align says which end of the text sits there
+        ('left' as in page.insert_text, 'right' or 'center'). The text is measured when
+        drawn, so a right-aligned tag keeps its right edge whatever its length.
+        """
+        self.texts.append((fitz.Point(point), text, fontsize, color, align))
+
+    def cover(self, rect, color=WHITE):
+        """Box painted under the tags (e.g. to hide a printed value)."""
+        self.covers.append((fitz.Rect(rect), color))
+
+    def mark(self, center, radius=3):
+        """Debug dot at a computed position (only drawn in debug mode)."""
+        if RENDER_MODE == "debug":
+            self.marks.append((fitz.Point(center), radius))
+
+    def flush(self):
+        if not (self.texts or self.covers or self.marks):
+            return
+        shape = self.page.new_shape()
+        for rect, color in self.covers:
+            shape.draw_rect(rect)
+            shape.finish(color=color, fill=color)
+        for center, radius in self.marks:
+            shape.draw_circle(center, radius)
+        if self.marks:
+            shape.finish(color=MARK_COLOR, fill=MARK_COLOR)
+        for point, text, fontsize, color, align in self.texts:
+            if align != "left":
+                width = text_length(text, fontsize)
+                point = point - (width if align == "right" else width / 2, 0)
+            shape.insert_text(point, text, fontsize=fontsize, fontname=FONT_NAME, color=color)
+        shape.commit()
+        rec = getattr(_local, "recording", None)
+        if rec is not None:
+            rec["pages"].append({
+                "page": self.page.number,
+                "covers": [[*rect, *color] for rect, color in self.covers],
+                "marks": [[*center, radius] for center, radius in self.marks],
+                "texts": [[*point, text, fontsize, list(color), align]
+                          for point, text, fontsize, color, align in self.texts],
+            })
+        self.texts, self.covers, self.marks = [], [], []
+
+# --- recording and replay -----------------------------------------------------------
+
+_local = threading.local()
+
+@contextlib.contextmanager
+def recording():
+    """
+    Records what the engines draw while a job runs in this thread. Yields a dict with
+    'base' (the source passed to open_document, e.g. the OCR result of a scan) and
+    'pages' (one entry per flushed PageTags, in drawing order; JSON serializable).
+    """
+    rec = {"base": None, "pages": []}
+    previous = getattr(_local, "recording", None)
+    _local.recording = rec
+    try:
+        yield rec
+    finally:
+        _local.recording = previous
+
+def replay(source, pages, relabel=None):
+    """
+    Draws recorded pages on source again and returns the saved bytes.
+    relabel(text) -> text lets the tags be renamed (e.g. another prefix).
+    """
+    doc = open_document(source)
+    try:
+        for item in pages:
+            tags = PageTags(doc[item["page"]])
+            for x0, y0, x1, y1, *color in item["covers"]:
+                tags.cover((x0, y0, x1, y1), tuple(color))
+            for x, y, radius in item["marks"]:
+                tags.mark((x, y), radius)
+            for x, y, text, fontsize, color, align in item["texts"]:
+                tags.text((x, y), relabel(text) if relabel else text, fontsize, tuple(color), align)
+            tags.flush()
+        return save(doc)
+    finally:
+        close_document(doc)
+
+# --- saving -----------------------------------------------------------------------
+
+def set_save_profile(profile):
+    """Save profile for this process and the worker processes it starts."""
+    global SAVE_PROFILE
+    SAVE_PROFILE = profile
+    os.environ["BST_SAVE_PROFILE"] = profile
+
+def _is_copy(doc):
+    return bool(doc.name) and os.path.basename(doc.name).startswith(COPY_PREFIX)
+
+def open_document(source, profile=None):
+    """
+    Opens the PDF an engine tags and later serializes with save().
+    With the incremental profile it is opened from a private copy of the input,
+    because PyMuPDF can only append an update to the file a document came from.
+    """
+    rec = getattr(_local, "recording", None)
+    if rec is not None:
+        rec["base"] = source
+    if (profile or SAVE_PROFILE) != "incremental":
+        return pdf_io.open_document(source)
+    fd, copy_path = tempfile.mkstemp(prefix=COPY_PREFIX, suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        if pdf_io.is_path(source):
+            with open(source, "rb") as original:
+                shutil.copyfileobj(original, f)
+        else:
+            f.write(pdf_io.read_bytes(source))
+    try:
+        return fitz.open(copy_path)
+    except Exception:
+        with contextlib.suppress(OSError):
+            os.remove(copy_path)
+        raise
+
+def save(doc, profile=None):
+    """Serializes a tagged document with a save profile; records output size and save time."""
+    profile = profile or SAVE_PROFILE
+    options = dict(SAVE_PROFILES[profile])
+    start = time.perf_counter()
+    if options.pop("incremental", False) and _is_copy(doc):
+        doc.save(doc.name, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        with open(doc.name, "rb") as f:
+            data = f.read()
+    else:
+        data = doc.tobytes(**options)
+    seconds = time.perf_counter() - start
+    metrics.add("save_seconds", seconds)
+    metrics.add("output_bytes", len(data))
+    events.emit("save", "   > Saved {kb} KB ({profile}) in {seconds:.2f}s", kb=len(data) // 1024,
+                profile=profile, seconds=seconds)
+    return data
+
+def close_document(doc):
+    """Closes a document from open_document() and removes its private copy, if any."""
+    copy_path = doc.name if _is_copy(doc) else None
+    doc.close()
+    if copy_path:
+        with contextlib.suppress(OSError):
+            os.remove(copy_path)
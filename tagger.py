@@ -0,0 +1,169 @@
+import importlib
+
+import detector
+import events
+import layout_cache
+import metrics
+import pdf_io
+import sidecar
+import tag_render
+import txindex
+
+DEFAULT_PATTERN = "[BANK]_[CURR]_TAG"
+
+# Engine module per bank. Engines are imported on first use (get_engine), so start-up
+# only loads the engines that are actually needed. Every engine exposes
+# tag_pdf(source, prefix) -> (tagged_pdf_bytes, count).
+# Frozen builds: keep this list in sync with hiddenimports in the .spec files.
+ENGINES = {
+    "HSBC": "hsbc_tagger",
+    "DB": "db_tagger",
+    "BANAMEX": "banamex_tagger",
+    "BBVA": "bbva_tagger",
+    "SANTANDER": "santander",
+    "MONEX": "monex_tagger",
+}
+
+# Display names for menus, in menu order
+BANK_NAMES = {
+    "HSBC": "HSBC",
+    "BANAMEX": "Banamex",
+    "BBVA": "BBVA",
+    "SANTANDER": "Santander",
+    "MONEX": "Monex",
+    "DB": "Deutsche Bank",
+}
+
+# Output file suffix per engine (engines not listed use "_TAGGED")
+OUTPUT_SUFFIXES = {
+    "BANAMEX": "_BANAMEX_TAGGED",
+    "BBVA": "_BBVA_TAGGED",
+    "MONEX": "_MONEX_TAGGED",
+}
+
+def get_engine(bank):
+    """The engine module for bank (imported on first use), or None if the bank is not supported."""
+    name = ENGINES.get(bank)
+    if name is None:
+        return None
+    return importlib.import_module(name)
+
+def warm_up(event_queue=None, event_level=events.INFO):
+    """
+    Process-pool initializer: loads every engine before the first job (the OCR stack
+    still loads on the first scanned page, see ocr_utils.load_ocr_stack).
+    With event_queue, progress events at or above event_level are forwarded to the parent.
+    """
+    for bank in ENGINES:
+        get_engine(bank)
+    if event_queue is not None:
+        events.forward_to(event_queue, event_level)
+
+def output_path(filename, bank):
+    """Where the tagged copy of filename is written, e.g. 'x.pdf' -> 'x_BBVA_TAGGED.pdf'"""
+    return pdf_io.tagged_output_path(filename, OUTPUT_SUFFIXES.get(bank, "_TAGGED"))
+
+def build_prefix(pattern, bank, currency):
+    """'[BANK]_[CURR]_TAG' -> 'HSBC_USD_TAG'"""
+    return pattern.replace("[BANK]", bank).replace("[CURR]", currency)
+
+def tag_statement(source, prefix=None, bank=None, filename=None, pattern=DEFAULT_PATTERN):
+    """
+    Detects, OCRs (if needed) and tags a statement entirely in memory.
+
+    source: path, bytes, bytearray, memoryview, mmap or binary file object.
+    filename: optional original name, used as a detection hint for in-memory sources.
+    Returns a dict with bank, currency, prefix, count, pages, the tagged PDF bytes ('pdf'),
+    the job's stats (OCR time, cache lookups; see metrics.py) and what the transaction
+    index needs: 'sha256' of the input, the statement 'year' and the tagged 'transactions'
+    (see txindex.py).
+    With a sidecar folder (see sidecar.py), a statement tagged before by the same engine
+    version is only drawn again with the new prefix.
+    Raises ValueError if the bank cannot be identified.
+    """
+    if not pdf_io.is_path(source) and hasattr(source, "read"):
+        # File objects can only be consumed once, keep the content around
+        source = pdf_io.read_bytes(source)
+    sha256 = txindex.content_hash(source)
+
+    with events.context(file=filename or pdf_io.display_name(source)):
+        cached = _load_sidecar(sha256, bank)
+        if cached is not None:
+            return _retag(source, sha256, cached, prefix, pattern)
+
+        detected_bank, currency = detector.detect_bank_and_currency(source, filename=filename)
+        bank = bank or detected_bank
+
+        engine = get_engine(bank)
+        if engine is None:
+            raise ValueError(f"Could not identify supported bank (Detected: {bank})")
+
+        if not prefix:
+            prefix = build_prefix(pattern, bank, currency)
+
+        with metrics.job_stats() as stats, txindex.collect() as transactions, tag_render.recording() as drawn:
+            if sidecar.SIDECAR_DIR:
+                metrics.cache_lookup("sidecar", False)
+            pdf_bytes, count = engine.tag_pdf(source, prefix)
+        layout_cache.flush()
+        result = {
+            "bank": bank,
+            "currency": currency,
+            "prefix": prefix,
+            "count": count,
+            "pages": pdf_io.page_count(source),
+            "pdf": pdf_bytes,
+            "stats": dict(stats),
+            "sha256": sha256,
+            "year": txindex.statement_year(source),
+            "transactions": transactions,
+        }
+        if sidecar.SIDECAR_DIR:
+            _store_sidecar(source, result, engine, drawn)
+    return result
+
+def _load_sidecar(sha256, bank):
+    """The stored sidecar if it can stand in for the engine run (same bank and engine version)."""
+    cached = sidecar.load(sha256)
+    if cached is None or (bank and bank != cached["bank"]):
+        return None
+    engine = get_engine(cached["bank"])
+    if engine is None or getattr(engine, "ENGINE_VERSION", None) != cached["engine_version"]:
+        return None
+    return cached
+
+def _retag(source, sha256, cached, prefix, pattern):
+    """Draws the tags of a sidecar with another prefix (no detection, OCR or extraction)."""
+    bank = cached["bank"]
+    if not prefix:
+        prefix = build_prefix(pattern, bank, cached["currency"])
+    rename = sidecar.relabel(cached["prefix"], prefix)
+    with metrics.job_stats() as stats:
+        metrics.cache_lookup("sidecar", True)
+        pdf_bytes = tag_render.replay(cached["base"] or source, cached["pages_drawn"], rename)
+    events.emit("retag", "   > Re-tagged {count} movements from sidecar", count=cached["count"])
+    return {
+        "bank": bank,
+        "currency": cached["currency"],
+        "prefix": prefix,
+        "count": cached["count"],
+        "pages": cached["pages"],
+        "pdf": pdf_bytes,
+        "stats": dict(stats),
+        "sha256": sha256,
+        "year": cached["year"],
+        "transactions": [dict(t, tag=rename(t["tag"])) for t in cached["transactions"]],
+    }
+
+def _store_sidecar(source, result, engine, drawn):
+    base = drawn["base"]
+    if base is None:
+        return
+    # Scans are tagged on their OCR result, which is kept so a re-tag skips OCR too
+    on_input = base is source or (pdf_io.is_path(base) and base == source)
+    data = {k: result[k] for k in ("bank", "currency", "prefix", "count", "pages", "year", "transactions")}
+    data.update(engine_version=getattr(engine, "ENGINE_VERSION", None), pages_drawn=drawn["pages"])
+    try:
+        sidecar.store(result["sha256"], data, None if on_input else pdf_io.read_bytes(base))
+    except OSError as e:
+        events.emit("sidecar", "⚠️ Could not write sidecar: {error}", events.WARNING, error=e)
@@ -0,0 +1,188 @@
+import argparse
+import collections
+import glob
+import os
+import threading
+import time
+
+import fitz  # PyMuPDF
+
+import pdf_io
+
+# Low-resolution page thumbnails for reviewing tagged outputs without opening them.
+# A thumbnail is rendered straight at its final width (no full-resolution page image)
+# and kept in a process-wide LRU cache bounded in bytes, keyed by the file's path,
+# size and mtime, so a re-tagged output is never shown stale.
+# The GUI preview asks a Thumbnailer for the pages on screen (plus the next ones);
+# it renders them in one background thread and reports each one as it is ready.
+#
+#   python thumbnails.py statements/ --out thumbs --pages 1-4
+#
+# BST_THUMB_WIDTH: thumbnail width in pixels; BST_THUMB_CACHE_MB: cache size.
+THUMB_WIDTH = int(os.environ.get("BST_THUMB_WIDTH", "160"))
+CACHE_MB = int(os.environ.get("BST_THUMB_CACHE_MB", "64"))
+
+def render(doc, page, width=THUMB_WIDTH):
+    """Thumbnail of a page of an open document: dict with width, height and RGB samples."""
+    p = doc[page]
+    zoom = width / p.rect.width
+    pix = p.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csRGB, alpha=False)
+    return {"width": pix.width, "height": pix.height, "samples": pix.samples}
+
+def to_png(thumb):
+    pix = fitz.Pixmap(fitz.csRGB, thumb["width"], thumb["height"], thumb["samples"], False)
+    return pix.tobytes("png")
+
+def file_key(path):
+    """(path, size, mtime): changes whenever the file is rewritten."""
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+class ThumbnailCache:
+    """LRU of thumbnails, at most max_bytes of samples. Thread-safe."""
+
+    def __init__(self, max_bytes=CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()   # (file key, page, width) -> thumb
+        self.size = 0
+
+    def get(self, key):
+        with self.lock:
+            thumb = self.entries.get(key)
+            if thumb is not None:
+                self.entries.move_to_end(key)
+            return thumb
+
+    def put(self, key, thumb):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old["samples"])
+            self.entries[key] = thumb
+            self.size += len(thumb["samples"])
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted["samples"])
+
+CACHE = ThumbnailCache()
+
+class Thumbnailer:
+    """
+    Renders requested thumbnails in a background thread (one: MuPDF documents must not be
+    shared between threads) and calls on_ready(path, page, thumb) from that thread as each
+    one is done; thumb is None if the page could not be rendered.
+    Each request() replaces the pages still pending, so paging quickly through a long
+    document only renders what was last asked for.
+    """
+
+    def __init__(self, on_ready, width=THUMB_WIDTH, cache=CACHE):
+        self.on_ready = on_ready
+        self.width = width
+        self.cache = cache
+        self.pending = collections.deque()     # (path, file key, page)
+        self.wakeup = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def request(self, path, pages):
+        """
+        Asks for thumbnails of pages (0-based, in order of need) of path.
+        Returns {page: thumb} for those already cached; the rest arrive through on_ready.
+        """
+        try:
+            key = file_key(path)
+        except OSError:
+            key = None
+        cached, missing = {}, []
+        for page in pages:
+            thumb = self.cache.get((key, page, self.width)) if key else None
+            if thumb is not None:
+                cached[page] = thumb
+            else:
+                missing.append((path, key, page))
+        with self.wakeup:
+            self.pending.clear()
+            self.pending.extend(missing)
+            self.wakeup.notify()
+        return cached
+
+    def _run(self):
+        doc, doc_key = None, None
+        while True:
+            with self.wakeup:
+                while not self.pending:
+                    if doc is not None:
+                        # Idle: don't keep the file open (it may be about to be rewritten)
+                        doc.close()
+                        doc, doc_key = None, None
+                    self.wakeup.wait()
+                path, key, page = self.pending.popleft()
+            thumb = None
+            try:
+                if key is None:
+                    raise OSError(f"cannot read {path}")
+                thumb = self.cache.get((key, page, self.width))
+                if thumb is None:
+                    if doc_key != key:
+                        if doc is not None:
+                            doc.close()
+                        doc, doc_key = None, None   # stays closed if the open below fails
+                        doc, doc_key = pdf_io.open_document(path), key
+                    thumb = render(doc, page, self.width)
+                    self.cache.put((key, page, self.width), thumb)
+            except Exception:
+                thumb = None
+            self.on_ready(path, page, thumb)
+
+def parse_pages(spec, count):
+    """'1-4,9' -> [0, 1, 2, 3, 8] (clipped to the document); empty spec = every page."""
+    if not spec:
+        return list(range(count))
+    pages = []
+    for part in spec.split(","):
+        first, _, last = part.strip().partition("-")
+        for number in range(int(first), int(last or first) + 1):
+            if 1 <= number <= count and number - 1 not in pages:
+                pages.append(number - 1)
+    return pages
+
+def main():
+    parser = argparse.ArgumentParser(description="Export page thumbnails of tagged statements as PNG files")
+    parser.add_argument("paths", nargs="+", help="tagged PDFs, or folders (their *_TAGGED*.pdf files)")
+    parser.add_argument("--out", default="thumbnails", help="output folder")
+    parser.add_argument("--width", type=int, default=THUMB_WIDTH, help="thumbnail width in pixels")
+    parser.add_argument("--pages", help="1-based pages, e.g. '1-4,9' (default: all)")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "*_TAGGED*.pdf")))
+        else:
+            files.append(path)
+    if not files:
+        print("❌ No PDF files found.")
+        return
+
+    os.makedirs(args.out, exist_ok=True)
+    start = time.perf_counter()
+    written = 0
+    for path in files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        try:
+            doc = pdf_io.open_document(path)
+        except Exception as e:
+            print(f"❌ {os.path.basename(path)}: {e}")
+            continue
+        try:
+            for page in parse_pages(args.pages, len(doc)):
+                png = to_png(render(doc, page, args.width))
+                pdf_io.write_bytes(os.path.join(args.out, f"{stem}_p{page + 1:04d}.png"), png)
+                written += 1
+        finally:
+            doc.close()
+    elapsed = time.perf_counter() - start
+    print(f"🖼️ {written} thumbnails from {len(files)} files in {args.out} ({elapsed:.2f}s)")
+
+if __name__ == "__main__":
+    main()
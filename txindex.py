@@ -0,0 +1,242 @@
+import argparse
+import collections
+import contextlib
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import pdf_io
+
+# Archive-wide index of tagged transactions in SQLite.
+# Engines call record() for every tag they place; the rows travel back with the job
+# result (see tagger.tag_statement) and the process that collects results (pipeline,
+# watcher, service) bulk-inserts them, one transaction per statement, so workers never
+# touch the database. A statement is keyed by the SHA-256 of its input bytes; tagging the
+# same file again replaces its rows.
+#
+#   python txindex.py index.db --amount 12345.67 --from 2024-01-01 --to 2024-01-31
+INDEX_FILE = os.environ.get("BST_INDEX") or None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS statements (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    path TEXT,
+    output TEXT,
+    bank TEXT,
+    currency TEXT,
+    pages INTEGER,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    statement_id INTEGER NOT NULL REFERENCES statements(id) ON DELETE CASCADE,
+    page INTEGER NOT NULL,
+    x0 REAL, y0 REAL, x1 REAL, y1 REAL,
+    amount_cents INTEGER,
+    direction TEXT,
+    date TEXT,
+    date_text TEXT,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_amount ON transactions (amount_cents, date);
+CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date);
+CREATE INDEX IF NOT EXISTS transactions_tag ON transactions (tag);
+CREATE INDEX IF NOT EXISTS transactions_statement ON transactions (statement_id);
+"""
+
+MONTHS = {
+    "ENE": 1, "JAN": 1, "FEB": 2, "MAR": 3, "ABR": 4, "APR": 4, "MAY": 5, "JUN": 6,
+    "JUL": 7, "AGO": 8, "AUG": 8, "SEP": 9, "SET": 9, "OCT": 10, "NOV": 11, "DIC": 12, "DEC": 12,
+}
+# '14 ENE', '02/OCT', '14-01', '14.01.2024'
+DATE_RE = re.compile(r'\b(\d{1,2})[\s/.\-]+([A-Z]{3}|\d{1,2})\b(?:[\s/.\-]+(\d{4}|\d{2})\b)?')
+YEAR_RE = re.compile(r'\b(20\d{2})\b')
+
+# --- worker side: per-job records -----------------------------------------------
+
+_local = threading.local()
+
+@contextlib.contextmanager
+def collect():
+    """Collects record() calls made while a job runs in this thread; yields the list."""
+    rows = []
+    previous = getattr(_local, "rows", None)
+    _local.rows = rows
+    try:
+        yield rows
+    finally:
+        _local.rows = previous
+
+def record(page, bbox, tag, amount=None, direction=None, date=None):
+    """
+    Adds one tagged transaction to the current job (no-op outside collect()).
+    page: 0-based page index; bbox: the word the tag belongs to; amount: float or text
+    as printed; direction: 'deposit', 'withdrawal' or None; date: the date as printed.
+    """
+    rows = getattr(_local, "rows", None)
+    if rows is None:
+        return
+    if isinstance(amount, str):
+        amount = parse_amount(amount)
+    if amount is not None and amount < 0:
+        amount, direction = -amount, direction or "withdrawal"
+    rows.append({"page": page, "bbox": [round(v, 1) for v in bbox[:4]], "tag": tag,
+                 "amount": amount, "direction": direction, "date_text": date})
+
+def parse_amount(text):
+    """'1,234.56', '$1,234.56', '-50.00', '1.234,56' -> float; None if there are no decimals."""
+    clean = re.sub(r'[^\d.,\-]', '', text or "")
+    negative = clean.startswith("-") or clean.endswith("-")
+    clean = clean.replace("-", "")
+    if len(clean) < 4 or clean[-3] not in ".,":
+        return None
+    # The last separator is the decimal one; the others group thousands
+    number = re.sub(r'[.,]', '', clean[:-3]) + "." + clean[-2:]
+    try:
+        value = float(number)
+    except ValueError:
+        return None
+    return -value if negative else value
+
+def find_date(text):
+    """First date-like token in a line ('14 ENE', '02/OCT', '14/01/2024'), or None."""
+    for m in DATE_RE.finditer((text or "").upper()):
+        day, month = int(m.group(1)), m.group(2)
+        if 1 <= day <= 31 and (month in MONTHS or (month.isdigit() and 1 <= int(month) <= 12)):
+            return m.group(0)
+    return None
+
+def normalize_date(text, year=None):
+    """'14 ENE' + 2024 -> '2024-01-14'; None if the text is not a date or no year is known."""
+    m = DATE_RE.search((text or "").upper())
+    if not m:
+        return None
+    day, month, printed_year = m.groups()
+    month = MONTHS.get(month) or (int(month) if month.isdigit() else None)
+    if printed_year:
+        year = int(printed_year) + (2000 if len(printed_year) == 2 else 0)
+    day = int(day)
+    if not year or not month or not 1 <= month <= 12 or not 1 <= day <= 31:
+        return None
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+def statement_year(source):
+    """The year the statement covers: the most frequent 20xx on its first page, or None."""
+    doc = pdf_io.open_document(source)
+    try:
+        if not len(doc):
+            return None
+        years = collections.Counter(YEAR_RE.findall(doc[0].get_text()))
+    finally:
+        doc.close()
+    return int(years.most_common(1)[0][0]) if years else None
+
+def content_hash(source):
+    return hashlib.sha256(pdf_io.read_bytes(source)).hexdigest()
+
+# --- collector side ----------------------------------------------------------------
+
+class Index:
+    """The SQLite index; thread-safe, one connection per process."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        # WAL: readers (searches) never block the writer; NORMAL is durable enough for an index
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+
+    def add(self, result, path=None, output=None):
+        """
+        Indexes a tag_statement() result (needs 'sha256' and 'transactions').
+        Replaces earlier rows of the same content. Returns the number of transactions added.
+        """
+        rows = result.get("transactions") or []
+        if not result.get("sha256"):
+            return 0
+        year = result.get("year")
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM statements WHERE sha256 = ?", (result["sha256"],))
+            cursor = self.db.execute(
+                "INSERT INTO statements (sha256, path, output, bank, currency, pages, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (result["sha256"], path, output, result.get("bank"), result.get("currency"),
+                 result.get("pages"), time.time()))
+            statement_id = cursor.lastrowid
+            self.db.executemany(
+                "INSERT INTO transactions (statement_id, page, x0, y0, x1, y1, amount_cents, direction, "
+                "date, date_text, tag) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(statement_id, r["page"], *r["bbox"],
+                  None if r["amount"] is None else round(r["amount"] * 100),
+                  r["direction"], normalize_date(r["date_text"], year), r["date_text"], r["tag"])
+                 for r in rows])
+        return len(rows)
+
+    def find(self, amount=None, date_from=None, date_to=None, tag=None, bank=None, limit=100):
+        """Transactions matching every given filter (dates as 'YYYY-MM-DD'), newest first."""
+        where, params = [], []
+        if amount is not None:
+            where.append("t.amount_cents = ?")
+            params.append(round(abs(float(amount)) * 100))
+        if date_from:
+            where.append("t.date >= ?")
+            params.append(date_from)
+        if date_to:
+            where.append("t.date <= ?")
+            params.append(date_to)
+        if tag:
+            where.append("t.tag = ?")
+            params.append(tag)
+        if bank:
+            where.append("s.bank = ?")
+            params.append(bank)
+        sql = ("SELECT s.path, s.output, s.bank, s.currency, t.page, t.x0, t.y0, t.x1, t.y1, "
+               "t.amount_cents / 100.0 AS amount, t.direction, t.date, t.date_text, t.tag "
+               "FROM transactions t JOIN statements s ON s.id = t.statement_id")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY t.date DESC LIMIT ?"
+        params.append(limit)
+        with self.lock:
+            return [dict(row) for row in self.db.execute(sql, params)]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the transaction index")
+    parser.add_argument("index", nargs="?", default=INDEX_FILE)
+    parser.add_argument("--amount", type=float)
+    parser.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD")
+    parser.add_argument("--tag")
+    parser.add_argument("--bank")
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+    if not args.index:
+        parser.error("no index file (argument or BST_INDEX)")
+
+    index = Index(args.index)
+    start = time.perf_counter()
+    rows = index.find(args.amount, args.date_from, args.date_to, args.tag, args.bank, args.limit)
+    elapsed = time.perf_counter() - start
+    for r in rows:
+        where = r["output"] or r["path"]
+        amount = "" if r["amount"] is None else f"{r['amount']:,.2f}"
+        print(f"{r['date'] or r['date_text'] or '?':<12} {amount:>14} {r['direction'] or '':<10} "
+              f"{r['tag']:<20} p.{r['page'] + 1:<4} {where}")
+    print(f"{len(rows)} transactions ({1000 * elapsed:.2f} ms)")
+    index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import argparse
+import collections
+import itertools
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import events
+import metrics
+import pdf_io
+import profiler
+import sidecar
+import tag_render
+import tagger
+import txindex
+
+# A file is picked up once its size and mtime stay unchanged for this long
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_POLL_SECONDS = 1.0
+# Files that stop growing but never get a %%EOF are handed over (and end up in failed/) after this
+INCOMPLETE_GIVE_UP_SECONDS = 300.0
+# Safety net for shares where the folder mtime is not updated reliably (SMB, NFS)
+FULL_SCAN_SECONDS = 60.0
+
+# Profiles are named <file>_<time>_<pid>_<n>: the same name dropped again never overwrites one
+_profile_ids = itertools.count(1)
+
+def is_candidate(name):
+    """PDFs only; skips hidden files, our own .tmp files and previous outputs."""
+    return (
+        name.lower().endswith(".pdf")
+        and not name.startswith(".")
+        and "_TAGGED" not in name
+    )
+
+def looks_complete(path):
+    """A PDF that is still being copied has no %%EOF marker at its end yet."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 1024))
+            return b"%%EOF" in f.read()
+    except OSError:
+        # Typically a sharing violation on Windows while the writer still has it open
+        return False
+
+class HotFolder:
+    """
+    Tracks new files in an inbox without re-listing it on every poll.
+    The folder is only scanned when its mtime changes (a file was added, renamed
+    or removed) or every FULL_SCAN_SECONDS; between scans only the files still
+    settling are stat'ed. Changes the watcher makes itself (moving finished files
+    out, see release) don't count; lock files live in a subfolder (pdf_io.LOCK_DIR).
+    """
+
+    def __init__(self, inbox, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        self.inbox = inbox
+        self.settle_seconds = settle_seconds
+        self.folder_mtime = None
+        self.last_full_scan = 0.0
+        self.settling = {}  # path -> ((size, mtime), stable_since)
+        self.claimed = set()  # paths handed out and not yet moved away
+
+    def _scan(self):
+        with os.scandir(self.inbox) as entries:
+            for entry in entries:
+                if entry.is_file() and is_candidate(entry.name):
+                    if entry.path not in self.claimed and entry.path not in self.settling:
+                        self.settling[entry.path] = (None, 0.0)
+
+    def poll(self):
+        """Returns the files that finished arriving since the last poll."""
+        now = time.monotonic()
+        folder_mtime = os.stat(self.inbox).st_mtime_ns
+        if folder_mtime != self.folder_mtime or now - self.last_full_scan > FULL_SCAN_SECONDS:
+            self.folder_mtime = folder_mtime
+            self.last_full_scan = now
+            self._scan()
+
+        ready = []
+        for path, (signature, since) in list(self.settling.items()):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                del self.settling[path]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != signature:
+                self.settling[path] = (current, now)
+            elif now - since >= self.settle_seconds and (
+                looks_complete(path) or now - since >= INCOMPLETE_GIVE_UP_SECONDS
+            ):
+                del self.settling[path]
+                self.claimed.add(path)
+                ready.append(path)
+        return ready
+
+    def release(self, path, inbox_mtimes=None):
+        """
+        A claimed file is done. inbox_mtimes: the inbox mtime just before and after the
+        worker moved the file out; if nothing else had changed the inbox since the last
+        scan, the move is adopted as already seen instead of triggering a re-scan.
+        """
+        self.claimed.discard(path)
+        if inbox_mtimes and inbox_mtimes[0] == self.folder_mtime:
+            self.folder_mtime = inbox_mtimes[1]
+
+def move_unique(path, folder):
+    """Moves path into folder, adding a timestamp if the name is already taken."""
+    os.makedirs(folder, exist_ok=True)
+    target = os.path.join(folder, os.path.basename(path))
+    if os.path.exists(target):
+        base, ext = os.path.splitext(target)
+        target = f"{base}_{time.strftime('%Y%m%d_%H%M%S')}{ext}"
+    shutil.move(path, target)
+    return target
+
+def move_out(path, folder, summary):
+    """move_unique for an inbox file, noting the inbox mtime around the move (see HotFolder.release)."""
+    inbox = os.path.dirname(os.path.abspath(path))
+    before = os.stat(inbox).st_mtime_ns
+    target = move_unique(path, folder)
+    summary["inbox_mtimes"] = (before, os.stat(inbox).st_mtime_ns)
+    return target
+
+def process_inbox_file(path, done_dir, failed_dir, pattern, profile_dir=None):
+    """Runs in a worker process: tags one inbox file and files it under done/ or failed/."""
+    name = os.path.basename(path)
+    summary = {"path": path, "status": "skipped", "bank": None, "count": 0, "pages": 0, "output": None,
+               "error": None, "stage": None, "stats": None, "archived": None,
+               "sha256": None, "year": None, "transactions": None, "inbox_mtimes": None, "profile": None}
+    if not pdf_io.acquire_lock(path):
+        return summary
+
+    start = time.perf_counter()
+    try:
+        try:
+            summary["stage"] = "read"
+            data = pdf_io.read_bytes(path)
+            summary["stage"] = "tag"
+            if profile_dir:
+                key = f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{next(_profile_ids)}"
+                summary["profile"] = os.path.join(profile_dir, profiler.profile_name(name, key=key) + ".prof")
+                result, _ = profiler.profile_call(profile_dir, profiler.profile_name(name, key=key),
+                                                  tagger.tag_statement, data, filename=name, pattern=pattern)
+            else:
+                result = tagger.tag_statement(data, filename=name, pattern=pattern)
+            summary.update(bank=result["bank"], count=result["count"], pages=result["pages"], stats=result["stats"],
+                           sha256=result["sha256"], year=result["year"], transactions=result["transactions"])
+            if not result["count"]:
+                raise ValueError("No transactions found")
+            output = tagger.output_path(os.path.join(done_dir, name), result["bank"])
+            os.makedirs(done_dir, exist_ok=True)
+            summary["stage"] = "write"
+            summary["output"] = pdf_io.write_bytes(output, result["pdf"])
+            summary["archived"] = move_out(path, done_dir, summary)
+            summary.update(status="done", stage=None)
+        except Exception as e:
+            summary.update(status="failed", error=str(e))
+            moved = move_out(path, failed_dir, summary)
+            with open(moved + ".error.txt", "w", encoding="utf-8") as f:
+                f.write(f"{e}\n")
+    finally:
+        pdf_io.release_lock(path)
+        summary["seconds"] = time.perf_counter() - start
+    return summary
+
+def give_up(path, failed_dir, error):
+    """Moves an input that keeps crashing its worker to failed/ with an .error.txt."""
+    summary = {}
+    moved = move_out(path, failed_dir, summary)
+    with open(moved + ".error.txt", "w", encoding="utf-8") as f:
+        f.write(f"{error}\n")
+    return summary["inbox_mtimes"]
+
+def run(inbox, done_dir=None, failed_dir=None, workers=None, pattern=tagger.DEFAULT_PATTERN,
+        poll_seconds=DEFAULT_POLL_SECONDS, settle_seconds=DEFAULT_SETTLE_SECONDS, profile_dir=profiler.PROFILE_DIR,
+        metrics_file=metrics.METRICS_FILE, index_file=txindex.INDEX_FILE):
+    done_dir = done_dir or os.path.join(inbox, "done")
+    failed_dir = failed_dir or os.path.join(inbox, "failed")
+    workers = workers or os.cpu_count() or 1
+
+    folder = HotFolder(inbox, settle_seconds)
+    backlog = collections.deque()
+    in_flight = {}
+    profiles = []   # written this session; older ones in profile_dir stay out of the report
+    # Only this process writes the index; workers send their transactions back with the summary
+    index = txindex.Index(index_file) if index_file else None
+
+    print(f"👀 Watching {os.path.abspath(inbox)} with {workers} workers (Ctrl+C to stop)")
+    # A worker process that dies breaks the whole pool and fails every file in flight. Those
+    # files become suspects and are retried one at a time on a new pool (nothing else is
+    # submitted meanwhile): a file that crashes while running alone is moved to failed/.
+    suspects = collections.deque()
+    alone = False
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=tagger.warm_up)
+    try:
+        while True:
+            backlog.extend(folder.poll())
+
+            if suspects and not in_flight:
+                batch, alone = [suspects.popleft()], True
+            elif suspects or alone:
+                batch = []
+            else:
+                # Keep at most two files per worker in flight; month-end bursts wait in the backlog
+                batch = [backlog.popleft() for _ in range(min(len(backlog), workers * 2 - len(in_flight)))]
+            for path in batch:
+                try:
+                    future = pool.submit(process_inbox_file, path, done_dir, failed_dir, pattern, profile_dir)
+                except BrokenProcessPool:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(max_workers=workers, initializer=tagger.warm_up)
+                    future = pool.submit(process_inbox_file, path, done_dir, failed_dir, pattern, profile_dir)
+                in_flight[future] = (path, pool)
+
+            if not in_flight:
+                time.sleep(poll_seconds)
+                continue
+
+            finished, _ = wait(in_flight, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path, future_pool = in_flight.pop(future)
+                name = os.path.basename(path)
+                ran_alone, alone = alone, False
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    # The worker died (or process_inbox_file itself failed) holding the file's lock
+                    pdf_io.release_lock(path)
+                    if isinstance(e, BrokenProcessPool) and future_pool is pool:
+                        print("⚠️ A worker process died, starting a new pool")
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        pool = ProcessPoolExecutor(max_workers=workers, initializer=tagger.warm_up)
+                    if not ran_alone:
+                        print(f"⚠️ {name}: worker crashed, retrying on its own")
+                        suspects.append(path)   # still claimed: the next scan won't add it again
+                        continue
+                    error = f"worker crashed: {e or type(e).__name__}"
+                    try:
+                        folder.release(path, give_up(path, failed_dir, error))
+                    except OSError as move_error:
+                        folder.release(path)
+                        print(f"⚠️ {name}: could not move to failed/: {move_error}")
+                    metrics.REGISTRY.record_file(None, "failed", 0.0, stage="tag")
+                    print(f"❌ {name}: {error}")
+                    continue
+                folder.release(path, summary["inbox_mtimes"])
+                if summary["profile"]:
+                    profiles.append(summary["profile"])
+                if summary["status"] != "skipped":
+                    # No transactions counts as a failure here: the file is moved to failed/
+                    status = "done" if summary["status"] == "done" else "failed"
+                    metrics.REGISTRY.record_file(summary["bank"], status, summary["seconds"], summary["pages"],
+                                                 summary["count"], summary["stats"], summary["stage"])
+                if summary["status"] == "done" and index is not None:
+                    try:
+                        index.add(summary, summary["archived"], summary["output"])
+                    except Exception as e:
+                        print(f"⚠️ {name}: could not index: {e}")
+                if summary["status"] == "done":
+                    print(f"✅ {name}: {summary['bank']} {summary['count']} movements ({summary['seconds']:.1f}s)")
+                elif summary["status"] == "failed":
+                    print(f"❌ {name}: {summary['error']}")
+                if backlog:
+                    print(f"   ... {len(backlog)} files waiting")
+            if finished and metrics_file:
+                metrics.REGISTRY.write(metrics_file)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping, waiting for running files to finish...")
+        for future in in_flight:
+            future.cancel()
+    finally:
+        pool.shutdown(wait=True)
+        if index is not None:
+            index.close()
+
+    if profile_dir:
+        report = profiler.write_report(profile_dir, profiles)
+        if report:
+            events.emit("profile", "📊 Profile hotspots: {report}", events.WARNING, report=report)
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Watch a folder and tag every statement dropped into it")
+    parser.add_argument("inbox")
+    parser.add_argument("--done", help="folder for processed inputs and outputs (default: inbox/done)")
+    parser.add_argument("--failed", help="folder for inputs that failed (default: inbox/failed)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--pattern", default=tagger.DEFAULT_PATTERN)
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_SECONDS)
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS)
+    parser.add_argument("--profile", metavar="DIR", default=profiler.PROFILE_DIR,
+                        help="profile each file with cProfile; hotspot report is written on exit")
+    parser.add_argument("--metrics", metavar="FILE", default=metrics.METRICS_FILE,
+                        help="Prometheus textfile updated as files finish (JSON snapshot next to it)")
+    parser.add_argument("--save-profile", choices=tag_render.SAVE_PROFILES, default=tag_render.SAVE_PROFILE,
+                        help="how tagged PDFs are written (compact, incremental, fast)")
+    parser.add_argument("--sidecars", metavar="DIR", default=sidecar.SIDECAR_DIR,
+                        help="re-tag sidecars folder: files tagged before are only redrawn (see sidecar.py)")
+    parser.add_argument("--index", metavar="FILE", default=txindex.INDEX_FILE,
+                        help="SQLite transaction index updated as files finish (search it with txindex.py)")
+    args = parser.parse_args()
+    tag_render.set_save_profile(args.save_profile)
+    sidecar.set_dir(args.sidecars)
+    run(args.inbox, args.done, args.failed, args.workers, args.pattern, args.poll, args.settle, args.profile,
+        args.metrics, args.index)